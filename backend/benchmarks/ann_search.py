@@ -0,0 +1,136 @@
+"""
+Recall and latency benchmark for the IVF-PQ index against exact search.
+
+Embeds N synthetic topical conversations with the offline hashing embedder, builds
+the exact VectorIndex and an IVF-PQ index (saved to a temporary directory
+and memory-mapped back, as in production), then reports recall@k against the
+exact results and query latency for a range of nprobe and rerank settings.
+
+Usage:
+    python benchmarks/ann_search.py --conversations 200000 --queries 200
+
+No database is needed.
+
+Recall depends on how clustered the embeddings are. The synthetic texts
+draw most of their words from one of --topics topics; with --topic-share 0
+they are unclustered noise, every query's top k are near ties, and no
+partition-based index reaches useful recall at a small nprobe.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Setup Django environment
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chat_portal.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.utils import timezone  # noqa: E402
+
+from conversations.ann_index import IVFPQ  # noqa: E402
+from conversations.embeddings import HashingEmbedder  # noqa: E402
+from conversations.vector_index import VectorIndex  # noqa: E402
+from vector_search import percentiles, synthetic_texts  # noqa: E402
+
+
+def topical_texts(count, words_per_text, topics, topic_words, topic_share, seed):
+    """
+    Texts that mostly draw from one of `topics` small topic vocabularies,
+    padded with Zipf-distributed background words, so they cluster the way
+    real conversations do.
+    """
+    rng = np.random.default_rng(seed)
+    vocabularies = rng.integers(0, 10 ** 6, size=(topics, topic_words))
+    background_count = int(words_per_text * (1 - topic_share))
+    background = synthetic_texts(count, background_count, 20000, seed=seed)
+    texts = []
+    for i, topic in enumerate(rng.integers(0, topics, size=count)):
+        words = rng.choice(vocabularies[topic], size=words_per_text - background_count)
+        texts.append(background[i] + ' ' + ' '.join(f'topic{word}' for word in words))
+    return texts
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--conversations', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--dim', type=int, default=HashingEmbedder().dim)
+    parser.add_argument('--m', type=int, default=None, help='PQ bytes per vector (default: dim / 8)')
+    parser.add_argument('--words', type=int, default=60, help='words per synthetic conversation')
+    parser.add_argument('--topics', type=int, default=1000)
+    parser.add_argument('--topic-words', type=int, default=20, help='vocabulary size of each topic')
+    parser.add_argument('--topic-share', type=float, default=0.9,
+                        help='share of each text drawn from its topic (0: unclustered)')
+    args = parser.parse_args()
+
+    embedder = HashingEmbedder(dim=args.dim)
+    texts = topical_texts(args.conversations, args.words, args.topics, args.topic_words,
+                          args.topic_share, seed=1)
+    vectors = np.concatenate([embedder.embed(texts[i:i + 1000]) for i in range(0, len(texts), 1000)])
+    ids = np.arange(1, len(vectors) + 1)
+    now = timezone.now()
+    starts = np.full(len(vectors), now.timestamp())
+
+    exact = VectorIndex(args.dim)
+    for conversation_id, vector in zip(ids, vectors):
+        exact.add(int(conversation_id), now, vector)
+
+    nlist = max(1, int(4 * np.sqrt(len(vectors))))
+    started = time.perf_counter()
+    trained = IVFPQ.train(vectors, nlist, args.m or args.dim // 8)
+    train_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    built = trained.encode(ids, starts, vectors, built_at=now)
+    encode_seconds = time.perf_counter() - started
+
+    directory = tempfile.mkdtemp(prefix='ann-index-')
+    built.save(directory)
+    index = IVFPQ.load(directory)
+    codes_mib = index.codes.nbytes / 2**20
+    print(f"{len(vectors)} conversations, dim={args.dim}, nlist={nlist}, m={index.codebooks.shape[0]}, k={args.k}")
+    print(f"train: {train_seconds:.1f}s; encode: {encode_seconds:.1f}s; "
+          f"files: {directory_size(directory) / 2**20:.1f} MiB "
+          f"(codes {codes_mib:.1f} MiB, full vectors {index.vectors.nbytes / 2**20:.1f} MiB)\n")
+
+    # A few words from a random conversation, like a user recalling it
+    rng = np.random.default_rng(2)
+    queries = [
+        embedder.embed_one(' '.join(rng.choice(texts[i].split(), size=8, replace=False)))
+        for i in rng.integers(0, len(texts), size=args.queries)
+    ]
+    truth, samples = [], []
+    for query in queries:
+        started = time.perf_counter()
+        truth.append({conversation_id for conversation_id, _ in exact.search(query, args.k, min_score=-1)})
+        samples.append(time.perf_counter() - started)
+    stats = percentiles(samples)
+    print(f"{'exact':<22} recall@{args.k}=1.000  p50={stats[50]:6.2f}ms  p95={stats[95]:6.2f}ms")
+
+    for nprobe in (4, 8, 16, 32, 64):
+        for rerank in (0, 10):
+            recall, samples = 0.0, []
+            for query, expected in zip(queries, truth):
+                started = time.perf_counter()
+                hits = index.search(query, args.k, nprobe, rerank)
+                samples.append(time.perf_counter() - started)
+                recall += len(expected & {conversation_id for conversation_id, _ in hits}) / len(expected)
+            stats = percentiles(samples)
+            label = f'nprobe={nprobe} rerank={rerank}'
+            print(f"{label:<22} recall@{args.k}={recall / len(queries):.3f}  "
+                  f"p50={stats[50]:6.2f}ms  p95={stats[95]:6.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
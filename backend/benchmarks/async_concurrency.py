@@ -0,0 +1,167 @@
+"""
+Concurrency benchmark for the send_message request path.
+
+Fires N concurrent send_message requests against a stub AI provider that only
+waits LATENCY seconds per call, and reports how many provider calls were in
+flight at the same time:
+
+- sync:  the DRF endpoint driven by a pool of --workers threads, modelling a
+         gunicorn deployment with that many sync workers.
+- async: the /api/async/ endpoint driven from a single event loop, modelling
+         one uvicorn process.
+
+Usage:
+    python benchmarks/async_concurrency.py --requests 500 --latency 1.0 --workers 4
+
+A throwaway test database is created (and dropped) on the configured server.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+
+# Setup Django environment
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chat_portal.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection, connections  # noqa: E402
+from django.test import AsyncClient, Client  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+from conversations.models import Conversation  # noqa: E402
+
+
+class StubAIService:
+    """AI service stand-in that simulates provider latency and counts in-flight calls."""
+
+    # Read by build_chat_messages() for the token budget lookup
+    provider = 'stub'
+    model = 'stub-model'
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.in_flight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+
+    def _exit(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _result(self):
+        return {'response': 'ok', 'tokens_used': 1, 'model': self.model, 'error': False}
+
+    def chat(self, messages, stream=False):
+        self._enter()
+        try:
+            time.sleep(self.latency)
+        finally:
+            self._exit()
+        return self._result()
+
+    async def achat(self, messages):
+        self._enter()
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self._exit()
+        return self._result()
+
+
+def _create_conversations(count):
+    return list(Conversation.objects.bulk_create(
+        Conversation(title=f'Benchmark {i}', status='active') for i in range(count)
+    ))
+
+
+def run_sync(conversations, workers):
+    """Send one message per conversation through the sync endpoint."""
+    def send(conversation):
+        try:
+            response = Client().post(
+                '/api/conversations/send_message/',
+                {'conversation_id': conversation.id, 'message': 'Hello'},
+                content_type='application/json'
+            )
+            return response.status_code
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(send, conversations))
+
+
+async def run_async(conversations):
+    """Send one message per conversation through the async endpoint."""
+    client = AsyncClient()
+    responses = await asyncio.gather(*(
+        client.post(
+            '/api/async/conversations/send_message/',
+            {'conversation_id': conversation.id, 'message': 'Hello'},
+            content_type='application/json'
+        )
+        for conversation in conversations
+    ))
+    # Release the connection held by the ORM's sync_to_async worker thread
+    await sync_to_async(connections.close_all)()
+    return [response.status_code for response in responses]
+
+
+def report(label, stub, statuses, elapsed):
+    ok = sum(1 for code in statuses if code == 200)
+    print(
+        f"{label:<6} requests={len(statuses):<5} ok={ok:<5} "
+        f"wall={elapsed:7.2f}s  throughput={len(statuses) / elapsed:8.1f} req/s  "
+        f"peak in-flight LLM calls={stub.peak}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=500, help='concurrent requests per run')
+    parser.add_argument('--latency', type=float, default=1.0, help='simulated provider latency (s)')
+    parser.add_argument('--workers', type=int, default=4, help='sync worker threads')
+    parser.add_argument('--skip-sync', action='store_true', help='only run the async path')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        print(f"Stub provider latency {args.latency}s, {args.requests} concurrent requests\n")
+
+        if not args.skip_sync:
+            stub = StubAIService(args.latency)
+            conversations = _create_conversations(args.requests)
+            with patch('conversations.views.get_ai_service', return_value=stub):
+                start = time.perf_counter()
+                statuses = run_sync(conversations, args.workers)
+                report('sync', stub, statuses, time.perf_counter() - start)
+
+        stub = StubAIService(args.latency)
+        conversations = _create_conversations(args.requests)
+        with patch('conversations.async_views.get_ai_service', return_value=stub):
+            start = time.perf_counter()
+            statuses = asyncio.run(run_async(conversations))
+            report('async', stub, statuses, time.perf_counter() - start)
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Memory and latency benchmark for the in-process BM25 index.
+
+Indexes N synthetic messages (spread over conversations of 20 messages) with
+the index API directly, then reports the memory used per million indexed
+tokens and the latency of word, phrase and prefix queries, before and after
+incremental updates land in the delta log.
+
+Usage:
+    python benchmarks/bm25_search.py --messages 200000 --queries 200
+
+No database is needed.
+
+Memory is reported two ways: the NumPy arrays alone (postings, positions and
+per-document columns, including the slack of arrays that grow by doubling),
+and everything allocated while building, which adds the vocabulary dict.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import timedelta
+
+import numpy as np
+
+# Setup Django environment
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chat_portal.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from conversations.bm25_index import BM25Index  # noqa: E402
+from vector_search import percentiles, synthetic_texts  # noqa: E402
+
+
+MESSAGES_PER_CONVERSATION = 20
+
+
+def report(label, samples):
+    stats = percentiles(samples)
+    print(f"{label:<24} p50={stats[50]:6.2f}ms  p95={stats[95]:6.2f}ms  p99={stats[99]:6.2f}ms")
+
+
+def time_queries(index, queries, k):
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query, k)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--words', type=int, default=30, help='words per synthetic message')
+    args = parser.parse_args()
+
+    texts = synthetic_texts(args.messages, args.words, 50000, seed=1)
+    conversations = args.messages // MESSAGES_PER_CONVERSATION + 1
+    now = timezone.now()
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    index = BM25Index(merge_threshold=2 ** 62)
+    for conversation_id in range(1, conversations + 1):
+        index.set_conversation(conversation_id, now - timedelta(minutes=conversation_id), True,
+                               f'Conversation {conversation_id}')
+    for message_id, text in enumerate(texts, start=1):
+        index.add_message(message_id, message_id // MESSAGES_PER_CONVERSATION + 1, text)
+    index.merge()
+    build_seconds = time.perf_counter() - started
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tokens_m = index.total_length / 1e6
+    print(f"{args.messages} messages, {index.total_length:,} tokens, {len(index._terms):,} terms")
+    print(f"build: {build_seconds:.1f}s ({index.total_length / build_seconds:,.0f} tokens/s)")
+    print(f"memory per million tokens: arrays {index.nbytes() / 2**20 / tokens_m:.1f} MiB, "
+          f"total {traced / 2**20 / tokens_m:.1f} MiB\n")
+
+    rng = np.random.default_rng(2)
+    words = synthetic_texts(args.queries, 3, 50000, seed=2)
+    phrases = []
+    for _ in range(args.queries):
+        tokens = texts[rng.integers(len(texts))].split()
+        start = rng.integers(len(tokens) - 1)
+        phrases.append('"' + ' '.join(tokens[start:start + 2]) + '"')
+    prefixes = [f'word{rng.integers(1, 500)}*' for _ in range(args.queries)]
+
+    for label, queries in (('3 words', words), ('phrase', phrases), ('prefix', prefixes)):
+        time_queries(index, queries[:10], args.k)  # Warm up
+        report(label, time_queries(index, queries, args.k))
+
+    # Incremental updates: queries also scan the delta log until it is merged
+    index.merge_threshold = settings.AI_BM25_MERGE_THRESHOLD
+    extra = synthetic_texts(5000, args.words, 50000, seed=3)
+    for offset, text in enumerate(extra, start=args.messages + 1):
+        index.add_message(offset, conversations, text)
+    print(f"\nwith {index._delta_count:,} postings in the delta log:")
+    report('3 words', time_queries(index, words, args.k))
+
+    started = time.perf_counter()
+    index.merge()
+    print(f"merge: {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
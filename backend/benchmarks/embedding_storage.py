@@ -0,0 +1,104 @@
+"""
+Table size and load time benchmark for embedding storage formats.
+
+Writes N random unit vectors to temporary tables, as JSON float lists (the
+format before migration 0008) and as EmbeddingField binary in float32,
+float16 and int8, then reports each table's size (including TOAST) and the
+time to read every row and decode it into a float32 matrix, as
+VectorIndex.sync() does. Also reports the cosine similarity the compact
+formats keep.
+
+Usage:
+    python benchmarks/embedding_storage.py --rows 20000 --dim 1536
+
+Needs the configured PostgreSQL database; the tables are temporary and are
+dropped when the benchmark exits.
+
+With 20,000 1536-d vectors on a single-vCPU VM, JSON took 20.3 KiB per row
+and 19.3s to load; float32 took 8.2 KiB and 0.7s (2.5x smaller, 27x faster),
+float16 4.1 KiB and int8 1.6 KiB, with cosine similarity to the original
+vectors of at least 0.9999.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# Setup Django environment
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chat_portal.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+from conversations.fields import decode_embedding, encode_embedding  # noqa: E402
+
+
+FORMATS = ['json', 'float32', 'float16', 'int8']
+BATCH_SIZE = 1000
+
+
+def create_table(cursor, name, vectors):
+    column = 'jsonb' if name == 'json' else 'bytea'
+    cursor.execute(f'CREATE TEMPORARY TABLE embeddings_{name} (id serial PRIMARY KEY, embedding {column})')
+    for start in range(0, len(vectors), BATCH_SIZE):
+        batch = vectors[start:start + BATCH_SIZE]
+        if name == 'json':
+            values = [json.dumps(vector.tolist()) for vector in batch]
+        else:
+            values = [encode_embedding(vector, name) for vector in batch]
+        cursor.executemany(f'INSERT INTO embeddings_{name} (embedding) VALUES (%s)', [(value,) for value in values])
+    cursor.execute(f'ANALYZE embeddings_{name}')
+
+
+def load(cursor, name, dim):
+    """Read every embedding into a float32 matrix; returns (matrix, seconds)."""
+    started = time.perf_counter()
+    if name == 'json':
+        # JSONField reads jsonb as text and parses it
+        cursor.execute(f'SELECT embedding::text FROM embeddings_{name} ORDER BY id')
+        rows = [json.loads(value) for value, in cursor.fetchall()]
+    else:
+        cursor.execute(f'SELECT embedding FROM embeddings_{name} ORDER BY id')
+        rows = [decode_embedding(value) for value, in cursor.fetchall()]
+    matrix = np.zeros((len(rows), dim), dtype=np.float32)
+    for row, vector in enumerate(rows):
+        matrix[row] = vector
+    return matrix, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--dim', type=int, default=1536)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.rows, args.dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    print(f"{args.rows} vectors of dimension {args.dim}\n")
+    print(f"{'format':<10}{'table size':>14}{'per row':>12}{'load':>10}{'min cosine':>12}")
+    baseline = None
+    with connection.cursor() as cursor:
+        for name in FORMATS:
+            create_table(cursor, name, vectors)
+            cursor.execute(f"SELECT pg_total_relation_size('embeddings_{name}')")
+            size, = cursor.fetchone()
+            load(cursor, name, args.dim)  # Warm the buffer cache
+            matrix, seconds = load(cursor, name, args.dim)
+            cosine = float(np.min(np.sum(matrix * vectors, axis=1) / np.linalg.norm(matrix, axis=1)))
+            baseline = baseline or (size, seconds)
+            print(f"{name:<10}{size / 2**20:>11.1f} MiB{size / args.rows / 1024:>9.1f} KiB{seconds:>9.2f}s"
+                  f"{cosine:>12.4f}   ({baseline[0] / size:.1f}x smaller, {baseline[1] / seconds:.1f}x faster)")
+            cursor.execute(f'DROP TABLE embeddings_{name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+JSON rendering and parsing benchmark on a large conversation payload.
+
+Builds the detail response of a conversation with N messages, shaped as the
+retrieve endpoint returns it (values() rows with datetime objects, see
+ConversationValuesSerializer), and times DRF's stdlib-based JSONRenderer and
+JSONParser against the orjson-backed ORJSONRenderer and ORJSONParser.
+
+Usage:
+    python benchmarks/json_rendering.py --messages 5000
+
+No database is needed; orjson must be installed.
+
+With 5,000 messages (a 3.0 MiB payload) on a single-vCPU VM, JSONRenderer
+took 76ms per render (p50) and ORJSONRenderer 14ms (5.4x faster), with
+byte-identical output; parsing took 14ms with JSONParser and 7ms with
+ORJSONParser (2x).
+"""
+import argparse
+import io
+import os
+import sys
+import time
+from datetime import timedelta
+
+# Setup Django environment
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chat_portal.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.utils import timezone  # noqa: E402
+from rest_framework.parsers import JSONParser  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from conversations.renderers import ORJSONParser, ORJSONRenderer  # noqa: E402
+from vector_search import percentiles, synthetic_texts  # noqa: E402
+
+
+def conversation_payload(messages):
+    """The retrieve response of an ended conversation with `messages` messages."""
+    now = timezone.now()
+    texts = synthetic_texts(messages, 60, 20000, seed=1)
+    return {
+        'success': True,
+        'conversation': {
+            'id': 1,
+            'title': 'Trip Planning Discussion',
+            'status': 'ended',
+            'start_timestamp': now,
+            'end_timestamp': now + timedelta(seconds=messages * 30),
+            'summary': ' '.join(texts[:3]),
+            'topics': ['travel', 'Japan', 'itinerary'],
+            'key_points': texts[3:8],
+            'sentiment': 'positive',
+            'running_summary': None,
+            'running_topics': [],
+            'message_count': messages,
+            'duration': messages * 30.0,
+            'version': messages,
+            'created_at': now,
+            'updated_at': now,
+            'messages': [
+                {
+                    'id': i + 1,
+                    'content': text,
+                    'sender': 'user' if i % 2 == 0 else 'ai',
+                    'timestamp': now + timedelta(seconds=i * 30),
+                    'tokens_used': None if i % 2 == 0 else 120,
+                    'model_used': None if i % 2 == 0 else 'gpt-3.5-turbo',
+                    'version': i + 1,
+                    'created_at': now + timedelta(seconds=i * 30),
+                }
+                for i, text in enumerate(texts)
+            ],
+            'messages_next': None,
+        }
+    }
+
+
+def time_calls(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return percentiles(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    payload = conversation_payload(args.messages)
+    body = JSONRenderer().render(payload)
+    identical = ORJSONRenderer().render(payload) == body
+    print(f"{args.messages} messages, {len(body) / 2**20:.1f} MiB rendered; "
+          f"orjson output {'identical' if identical else 'DIFFERENT'}\n")
+
+    cases = [
+        ('render JSONRenderer', lambda: JSONRenderer().render(payload)),
+        ('render ORJSONRenderer', lambda: ORJSONRenderer().render(payload)),
+        ('parse JSONParser', lambda: JSONParser().parse(io.BytesIO(body))),
+        ('parse ORJSONParser', lambda: ORJSONParser().parse(io.BytesIO(body))),
+    ]
+    for label, function in cases:
+        function()  # Warm up
+        stats = time_calls(function, args.repeat)
+        print(f"{label:<24} p50={stats[50]:7.2f}ms  p95={stats[95]:7.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Retrieval latency benchmark for the conversation vector index.
+
+Embeds N synthetic conversations with the offline hashing embedder, loads
+them into a VectorIndex and times top-k searches (with and without a date
+range filter), plus embedding of the query itself.
+
+Usage:
+    python benchmarks/vector_search.py --conversations 100000 --queries 200
+
+No database is needed.
+
+A search scans the whole matrix (conversations x dim x 4 bytes), so latency
+is bound by memory bandwidth and grows linearly with the dimension. On a
+single-vCPU VM at 100k conversations, p95 was about 3.3ms at the default
+dim=128 and about 15ms at dim=256.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import timedelta
+
+import numpy as np
+
+# Setup Django environment
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chat_portal.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.utils import timezone  # noqa: E402
+
+from conversations.embeddings import HashingEmbedder  # noqa: E402
+from conversations.vector_index import VectorIndex  # noqa: E402
+
+
+TARGET_MS = 10.0
+
+
+def synthetic_texts(count, words_per_text, vocabulary_size, seed):
+    """Texts drawn from a Zipf-like vocabulary, like real conversation text."""
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array([f'word{i}' for i in range(vocabulary_size)])
+    weights = 1.0 / np.arange(1, vocabulary_size + 1)
+    words = vocabulary[rng.choice(vocabulary_size, size=(count, words_per_text), p=weights / weights.sum())]
+    return [' '.join(row) for row in words]
+
+
+def percentiles(samples):
+    ms = np.array(samples) * 1000
+    return {p: float(np.percentile(ms, p)) for p in (50, 95, 99)}
+
+
+def report(label, samples):
+    stats = percentiles(samples)
+    verdict = 'ok' if stats[95] < TARGET_MS else 'SLOW'
+    print(f"{label:<28} p50={stats[50]:6.2f}ms  p95={stats[95]:6.2f}ms  p99={stats[99]:6.2f}ms  [{verdict}]")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--conversations', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--dim', type=int, default=HashingEmbedder().dim)
+    parser.add_argument('--words', type=int, default=60, help='words per synthetic conversation')
+    args = parser.parse_args()
+
+    embedder = HashingEmbedder(dim=args.dim)
+    texts = synthetic_texts(args.conversations, args.words, 20000, seed=1)
+
+    started = time.perf_counter()
+    vectors = np.concatenate([embedder.embed(texts[i:i + 1000]) for i in range(0, len(texts), 1000)])
+    embed_seconds = time.perf_counter() - started
+
+    now = timezone.now()
+    index = VectorIndex(args.dim)
+    started = time.perf_counter()
+    for i, vector in enumerate(vectors):
+        index.add(i + 1, now - timedelta(minutes=i), vector)
+    build_seconds = time.perf_counter() - started
+
+    print(f"{args.conversations} conversations, dim={args.dim}, k={args.k}")
+    print(f"embedding: {args.conversations / embed_seconds:,.0f} conversations/s; "
+          f"index build: {build_seconds:.2f}s; matrix: {index._matrix[:len(index)].nbytes / 2**20:.1f} MiB\n")
+
+    queries = synthetic_texts(args.queries, 4, 20000, seed=2)
+    query_vectors = [embedder.embed_one(query) for query in queries]
+    date_from = now - timedelta(minutes=args.conversations // 2)
+
+    # Warm up
+    for vector in query_vectors[:10]:
+        index.search(vector, args.k, min_score=-1)
+
+    timings = {'search': [], 'search + date filter': [], 'embed query': [], 'embed query + search': []}
+    for query, vector in zip(queries, query_vectors):
+        started = time.perf_counter()
+        index.search(vector, args.k, min_score=-1)
+        timings['search'].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        index.search(vector, args.k, date_from=date_from, min_score=-1)
+        timings['search + date filter'].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        vector = embedder.embed_one(query)
+        timings['embed query'].append(time.perf_counter() - started)
+        index.search(vector, args.k, min_score=-1)
+        timings['embed query + search'].append(time.perf_counter() - started)
+
+    for label, samples in timings.items():
+        report(label, samples)
+
+    # Sanity check: exact search finds each conversation from its own vector
+    hits = sum(index.search(vectors[i], 1)[0][0] == i + 1 for i in range(0, len(vectors), len(vectors) // 100))
+    print(f"\nself-retrieval: {hits}/100")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,9 +2,12 @@
 Django settings for chat_portal project.
 """
 
+from importlib.util import find_spec
 from pathlib import Path
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -18,6 +21,12 @@ SECRET_KEY = 'django-insecure-your-secret-key-here-change-in-production'
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# Settings profile: 'development' adds the browsable API to the JSON API;
+# 'production' serves JSON only
+SETTINGS_PROFILE = os.environ.get('SETTINGS_PROFILE', 'development')
+if SETTINGS_PROFILE not in ('development', 'production'):
+    raise ImproperlyConfigured(f"SETTINGS_PROFILE must be 'development' or 'production', not '{SETTINGS_PROFILE}'")
+
 ALLOWED_HOSTS = ['localhost', '127.0.0.1', '*']
 
 
@@ -30,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'conversations',
@@ -81,6 +91,25 @@ DATABASES = {
     }
 }
 
+# Cache shared by all worker processes, so cached query answers, their
+# corpus version and ended conversations' details stay consistent across
+# them: 'database' (run `python manage.py createcachetable` once), 'redis'
+# (REDIS_URL, pip install redis) or 'locmem' (per process, for a single
+# development server only)
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'database')
+if CACHE_BACKEND == 'database':
+    DEFAULT_CACHE = {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'django_cache'}
+elif CACHE_BACKEND == 'redis':
+    DEFAULT_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL', 'redis://localhost:6379/0'),
+    }
+elif CACHE_BACKEND == 'locmem':
+    DEFAULT_CACHE = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+else:
+    raise ImproperlyConfigured(f"CACHE_BACKEND must be 'database', 'redis' or 'locmem', not '{CACHE_BACKEND}'")
+CACHES = {'default': DEFAULT_CACHE}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -124,19 +153,43 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# JSON rendering and parsing: 'orjson' (several times faster on large
+# payloads, needs `pip install orjson`) or 'stdlib' (DRF's JSONRenderer and
+# JSONParser); see conversations/renderers.py
+API_JSON_BACKEND = os.environ.get('API_JSON_BACKEND', 'orjson' if find_spec('orjson') else 'stdlib')
+JSON_RENDERER, JSON_PARSER = {
+    'orjson': ('conversations.renderers.ORJSONRenderer', 'conversations.renderers.ORJSONParser'),
+    'stdlib': ('rest_framework.renderers.JSONRenderer', 'rest_framework.parsers.JSONParser'),
+}[API_JSON_BACKEND]
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 50,
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
+        JSON_RENDERER,
+        *(['rest_framework.renderers.BrowsableAPIRenderer'] if SETTINGS_PROFILE == 'development' else []),
     ],
     'DEFAULT_PARSER_CLASSES': [
-        'rest_framework.parsers.JSONParser',
+        JSON_PARSER,
     ],
 }
 
+# Logging: app logs (e.g. per-analysis timings) go to the console
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'conversations': {
+            'handlers': ['console'],
+            'level': os.environ.get('APP_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # For development only
 CORS_ALLOW_CREDENTIALS = True
@@ -148,3 +201,116 @@ ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY', '')
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
 LM_STUDIO_BASE_URL = os.environ.get('LM_STUDIO_BASE_URL', 'http://localhost:1234/v1')
 
+# Seconds to wait for each conversation analysis (summary, topics, ...) when
+# a conversation ends; analyses that take longer are skipped
+AI_ANALYSIS_TIMEOUT = float(os.environ.get('AI_ANALYSIS_TIMEOUT', 60))
+# 'separate': one provider call per analysis, run concurrently
+# 'combined': one call returning all analyses as JSON (sends the transcript
+#             once); only fields that fail validation are re-run separately
+AI_ANALYSIS_MODE = os.environ.get('AI_ANALYSIS_MODE', 'separate')
+
+# Map-reduce analysis of long conversations, per model or provider with a
+# 'default' fallback. Transcripts longer than chunk_tokens are split into
+# chunks that are condensed in parallel (at most `parallelism` provider calls
+# at once) before the analyses run on the condensed text. Condensed text still
+# longer than chunk_tokens is condensed again, at most max_rounds times in all;
+# the analyses fail if it does not fit by then or a round does not shorten it.
+AI_MAP_REDUCE = {
+    'default': {'chunk_tokens': 2000, 'parallelism': 4, 'max_rounds': 3},
+    'openai': {'chunk_tokens': 2000, 'parallelism': 4, 'max_rounds': 3},
+    'lmstudio': {'chunk_tokens': 2000, 'parallelism': 1, 'max_rounds': 3},
+    'anthropic': {'chunk_tokens': 12000, 'parallelism': 4, 'max_rounds': 3},
+    'gemini': {'chunk_tokens': 12000, 'parallelism': 4, 'max_rounds': 3},
+}
+# Seconds to keep condensed chunks in the cache, keyed by chunk content, so a
+# re-analysis only condenses the chunks that changed
+AI_CHUNK_CACHE_TIMEOUT = 7 * 24 * 3600
+
+# Conversation search (see conversations/vector_index.py)
+# 'hashing': local embedder, no network access needed; 'openai': OpenAI embeddings API
+# ('openai:<model>' to pick the model)
+AI_EMBEDDER = os.environ.get('AI_EMBEDDER', 'hashing')
+# Storage format of new embeddings: 'float32' (exact), 'float16' (half the size)
+# or 'int8' (a quarter, quantized); see conversations/fields.py
+AI_EMBEDDING_DTYPE = os.environ.get('AI_EMBEDDING_DTYPE', 'float32')
+# Seconds between syncs of the in-process search indexes with changes made
+# by other processes
+AI_VECTOR_INDEX_REFRESH = 10
+# Minimum cosine similarity for a conversation to count as relevant
+AI_VECTOR_MIN_SCORE = 0.1
+# 'exact': scan every embedding; 'ivfpq': approximate index built by
+# `python manage.py build_ann_index` (see conversations/ann_index.py)
+AI_VECTOR_INDEX = os.environ.get('AI_VECTOR_INDEX', 'exact')
+AI_ANN_INDEX_DIR = os.environ.get('AI_ANN_INDEX_DIR', str(BASE_DIR / 'ann_index'))
+# Inverted lists scanned per query: higher is slower with better recall
+AI_ANN_NPROBE = 16
+# Re-score the best AI_ANN_RERANK * k approximate candidates exactly (0 disables)
+AI_ANN_RERANK = 10
+# Saved index versions kept on disk, the current one included, so a process
+# that is loading the previous version when a new build lands still finds it
+AI_ANN_KEEP_VERSIONS = 3
+# query_conversations answers from windows of this many consecutive messages,
+# starting every AI_RETRIEVAL_WINDOW_STRIDE messages (see conversations/retrieval.py)
+AI_RETRIEVAL_WINDOW_MESSAGES = 6
+AI_RETRIEVAL_WINDOW_STRIDE = 4
+# Windows retrieved per query, and the prompt tokens they may fill
+AI_RETRIEVAL_CANDIDATES = 20
+AI_RETRIEVAL_CONTEXT_TOKENS = 3000
+# Drop windows scoring below this fraction of the best window's score
+AI_RETRIEVAL_RELATIVE_SCORE = 0.5
+# Keyword retrieval: 'postgres' (full-text search, see conversations/search.py)
+# or 'bm25' (in-process index, see conversations/bm25_index.py)
+AI_LEXICAL_BACKEND = os.environ.get('AI_LEXICAL_BACKEND', 'postgres')
+# Postings buffered in the BM25 index before they are merged into its main arrays
+AI_BM25_MERGE_THRESHOLD = 200000
+# query_conversations fuses the best AI_HYBRID_CANDIDATES of the lexical and
+# vector retrievers by reciprocal rank, then optionally reranks the fused list
+# by query word coverage of each conversation's title, summary and topics
+AI_HYBRID_CANDIDATES = 20
+AI_HYBRID_RERANK = os.environ.get('AI_HYBRID_RERANK', 'False') == 'True'
+# Cache up to AI_QUERY_CACHE_SIZE query_conversations results (0 disables) for
+# AI_QUERY_CACHE_TIMEOUT seconds; a conversation ending or being deleted
+# invalidates them (see conversations/answer_cache.py)
+AI_QUERY_CACHE_SIZE = int(os.environ.get('AI_QUERY_CACHE_SIZE', 500))
+AI_QUERY_CACHE_TIMEOUT = 3600
+
+# Update a live summary and topic list of active conversations in the
+# background after every N new messages (0 disables; see
+# conversations/running_summary.py). end_conversation then only analyzes the
+# messages after the last update.
+AI_RUNNING_SUMMARY_INTERVAL = int(os.environ.get('AI_RUNNING_SUMMARY_INTERVAL', 0))
+
+# Background analysis queue (see conversations/jobs.py). When enabled,
+# end_conversation returns 202 and `python manage.py run_analysis_worker`
+# runs the analysis.
+ANALYSIS_QUEUE_ENABLED = os.environ.get('ANALYSIS_QUEUE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+ANALYSIS_JOB_MAX_ATTEMPTS = 3
+# Seconds a worker owns a claimed job; must exceed the analysis time
+ANALYSIS_JOB_LEASE_SECONDS = 2 * AI_ANALYSIS_TIMEOUT + 30
+# Base delay in seconds before the first retry; doubles on each attempt
+ANALYSIS_JOB_RETRY_BACKOFF = 30
+
+# Seconds the detail response of an ended conversation stays in Django's
+# cache, keyed by its ETag (0 disables; see conversations/conditional.py)
+CONVERSATION_CACHE_TIMEOUT = int(os.environ.get('CONVERSATION_CACHE_TIMEOUT', 24 * 3600))
+
+# Chat context window (see conversations/context.py)
+# 'summary': turns that no longer fit the budget are folded into a rolling summary
+# 'truncate': turns that no longer fit the budget are dropped
+AI_CONTEXT_STRATEGY = os.environ.get('AI_CONTEXT_STRATEGY', 'summary')
+# Prompt token budget per model or provider, falling back to 'default'.
+# Leaves room for the reply (max_tokens=1000) inside each model's context window.
+AI_CONTEXT_TOKEN_BUDGET = {
+    'default': 3000,
+    'openai': 3000,
+    'lmstudio': 3000,
+    'anthropic': 16000,
+    'gemini': 16000,
+}
+# Share of the budget kept verbatim after folding, so the summary is only
+# rebuilt once the recent turns have grown back to the full budget
+AI_CONTEXT_KEEP_RATIO = 0.5
+# Summary updates per chat turn, each folding at most one budget of older turns;
+# a longer unsummarized history is caught up over the following turns
+AI_CONTEXT_FOLD_STEPS = 2
+
@@ -1,8 +1,8 @@
 """
-Django admin configuration for Conversations and Messages.
+Django admin configuration for Conversations, Messages and analysis jobs.
 """
 from django.contrib import admin
-from .models import Conversation, Message
+from .models import AnalysisJob, Conversation, Message
 
 
 @admin.register(Conversation)
@@ -40,3 +40,10 @@ class MessageAdmin(admin.ModelAdmin):
         return obj.content[:100] + '...' if len(obj.content) > 100 else obj.content
     content_preview.short_description = 'Content Preview'
 
+
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    """Admin interface for AnalysisJob model."""
+    list_display = ['id', 'conversation', 'status', 'attempts', 'run_after', 'locked_by', 'finished_at']
+    list_filter = ['status']
+    readonly_fields = ['created_at', 'updated_at', 'finished_at']
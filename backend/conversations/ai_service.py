@@ -10,8 +10,30 @@ This module handles all AI-powered features including:
 """
 import os
 import json
-from typing import List, Dict, Any, Optional
+import time
+import hashlib
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Dict, Any, Iterator, Optional
 from django.conf import settings
+from django.core.cache import cache
+
+from .context import message_tokens
+
+
+# Conversation analyses run when a conversation ends
+ANALYSIS_FIELDS = ('summary', 'topics', 'sentiment', 'key_points')
+
+# Bump to invalidate cached chunk summaries when the map prompt changes
+CHUNK_PROMPT_VERSION = 1
+
+# Condensing rounds for AI_MAP_REDUCE configs that do not set max_rounds
+MAP_REDUCE_MAX_ROUNDS = 3
+
+
+class AIServiceError(Exception):
+    """Raised when the AI provider returns an error instead of a response."""
 
 
 class AIService:
@@ -39,6 +61,7 @@ class AIService:
             try:
                 import anthropic
                 self.client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
+                self.async_client = anthropic.AsyncAnthropic(api_key=settings.ANTHROPIC_API_KEY)
                 self.model = "claude-3-sonnet-20240229"
             except ImportError:
                 raise ImportError("Anthropic library not installed. Run: pip install anthropic")
@@ -78,9 +101,103 @@ class AIService:
             if self.provider == 'openai' or self.provider == 'lmstudio':
                 return self._chat_openai(messages, stream)
             elif self.provider == 'anthropic':
-                return self._chat_anthropic(messages)
+                return self._chat_anthropic(messages, stream)
+            elif self.provider == 'gemini':
+                return self._chat_gemini(messages, stream)
+        except Exception as e:
+            return {
+                'response': f"Error communicating with AI: {str(e)}",
+                'error': True,
+                'model': self.model
+            }
+    
+    def chat_stream(self, messages: List[Dict[str, str]]) -> Iterator[Dict[str, Any]]:
+        """
+        Send messages to AI and yield the response as it is generated.
+        
+        Args:
+            messages: List of message dicts with 'role' and 'content'
+        
+        Yields:
+            {'delta': str} for every text fragment, followed by a final dict
+            with 'done': True and the same keys chat() returns ('response',
+            'tokens_used', 'model', 'error').
+        """
+        result = self.chat(messages, stream=True)
+        if result.get('error'):
+            yield {**result, 'done': True}
+            return
+        
+        if self.provider == 'anthropic':
+            chunks = self._iter_anthropic_stream(result['stream'])
+        elif self.provider == 'gemini':
+            chunks = self._iter_gemini_stream(result['stream'])
+        else:
+            chunks = self._iter_openai_stream(result['stream'])
+        
+        parts = []
+        tokens_used = None
+        try:
+            for chunk in chunks:
+                if chunk.get('delta'):
+                    parts.append(chunk['delta'])
+                    yield chunk
+                if chunk.get('tokens_used') is not None:
+                    tokens_used = chunk['tokens_used']
+        except Exception as e:
+            yield {
+                'done': True,
+                'response': f"Error communicating with AI: {str(e)}",
+                'error': True,
+                'model': self.model
+            }
+            return
+        finally:
+            # Release the provider connection when the consumer stops early
+            close = getattr(result['stream'], 'close', None)
+            if callable(close):
+                close()
+        
+        yield {
+            'done': True,
+            'response': ''.join(parts),
+            'tokens_used': tokens_used,
+            'model': self.model,
+            'error': False
+        }
+    
+    async def achat(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        """
+        Async version of chat() using the providers' non-blocking clients.
+        
+        Args:
+            messages: List of message dicts with 'role' and 'content'
+        
+        Returns:
+            Dict containing AI response and metadata
+        """
+        try:
+            if self.provider == 'openai' or self.provider == 'lmstudio':
+                response = await self.client.ChatCompletion.acreate(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=1000
+                )
+                return self._openai_result(response)
+            elif self.provider == 'anthropic':
+                system_message, claude_messages = self._anthropic_messages(messages)
+                response = await self.async_client.messages.create(
+                    model=self.model,
+                    max_tokens=1000,
+                    system=system_message,
+                    messages=claude_messages
+                )
+                return self._anthropic_result(response)
             elif self.provider == 'gemini':
-                return self._chat_gemini(messages)
+                model = self.client.GenerativeModel(self.model)
+                response = await model.generate_content_async(self._gemini_prompt(messages))
+                return self._gemini_result(response)
         except Exception as e:
             return {
                 'response': f"Error communicating with AI: {str(e)}",
@@ -101,16 +218,49 @@ class AIService:
         if stream:
             return {'stream': response, 'model': self.model}
         else:
-            return {
-                'response': response.choices[0].message.content,
-                'tokens_used': response.usage.total_tokens,
-                'model': self.model,
-                'error': False
-            }
+            return self._openai_result(response)
+    
+    def _openai_result(self, response) -> Dict[str, Any]:
+        """Convert an OpenAI/LM Studio completion into the chat() result format."""
+        return {
+            'response': response.choices[0].message.content,
+            'tokens_used': response.usage.total_tokens,
+            'model': self.model,
+            'error': False
+        }
     
-    def _chat_anthropic(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    def _iter_openai_stream(self, stream) -> Iterator[Dict[str, Any]]:
+        """Normalize OpenAI/LM Studio stream chunks into text deltas."""
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            content = getattr(chunk.choices[0].delta, 'content', None)
+            if content:
+                yield {'delta': content}
+            # Some OpenAI-compatible servers report usage on the last chunk
+            usage = getattr(chunk, 'usage', None)
+            if usage:
+                yield {'tokens_used': usage.total_tokens}
+    
+    def _chat_anthropic(self, messages: List[Dict[str, str]], stream: bool = False) -> Dict[str, Any]:
         """Handle Anthropic Claude chat requests."""
-        # Convert messages format for Claude
+        system_message, claude_messages = self._anthropic_messages(messages)
+        
+        response = self.client.messages.create(
+            model=self.model,
+            max_tokens=1000,
+            system=system_message,
+            messages=claude_messages,
+            stream=stream
+        )
+        
+        if stream:
+            return {'stream': response, 'model': self.model}
+        
+        return self._anthropic_result(response)
+    
+    def _anthropic_messages(self, messages: List[Dict[str, str]]):
+        """Split messages into Claude's separate system prompt and message list."""
         system_message = ""
         claude_messages = []
         
@@ -123,13 +273,10 @@ class AIService:
                     'content': msg['content']
                 })
         
-        response = self.client.messages.create(
-            model=self.model,
-            max_tokens=1000,
-            system=system_message,
-            messages=claude_messages
-        )
-        
+        return system_message, claude_messages
+    
+    def _anthropic_result(self, response) -> Dict[str, Any]:
+        """Convert a Claude response into the chat() result format."""
         return {
             'response': response.content[0].text,
             'tokens_used': response.usage.input_tokens + response.usage.output_tokens,
@@ -137,15 +284,36 @@ class AIService:
             'error': False
         }
     
-    def _chat_gemini(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    def _iter_anthropic_stream(self, stream) -> Iterator[Dict[str, Any]]:
+        """Normalize Anthropic stream events into text deltas and token usage."""
+        input_tokens = 0
+        for event in stream:
+            if event.type == 'message_start':
+                input_tokens = event.message.usage.input_tokens
+            elif event.type == 'content_block_delta':
+                text = getattr(event.delta, 'text', None)
+                if text:
+                    yield {'delta': text}
+            elif event.type == 'message_delta':
+                yield {'tokens_used': input_tokens + event.usage.output_tokens}
+    
+    def _chat_gemini(self, messages: List[Dict[str, str]], stream: bool = False) -> Dict[str, Any]:
         """Handle Google Gemini chat requests."""
         model = self.client.GenerativeModel(self.model)
         
-        # Convert messages to Gemini format
-        prompt = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
+        response = model.generate_content(self._gemini_prompt(messages), stream=stream)
         
-        response = model.generate_content(prompt)
+        if stream:
+            return {'stream': response, 'model': self.model}
         
+        return self._gemini_result(response)
+    
+    def _gemini_prompt(self, messages: List[Dict[str, str]]) -> str:
+        """Convert messages to Gemini's single-prompt format."""
+        return "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
+    
+    def _gemini_result(self, response) -> Dict[str, Any]:
+        """Convert a Gemini response into the chat() result format."""
         return {
             'response': response.text,
             'tokens_used': None,  # Gemini doesn't provide token count in the same way
@@ -153,22 +321,32 @@ class AIService:
             'error': False
         }
     
-    def generate_summary(self, messages: List[Dict[str, str]]) -> str:
-        """
-        Generate a summary of a conversation.
-        
-        Args:
-            messages: List of conversation messages
-        
-        Returns:
-            Summary text
-        """
-        conversation_text = "\n".join([
+    def _iter_gemini_stream(self, stream) -> Iterator[Dict[str, Any]]:
+        """Normalize Gemini stream chunks into text deltas."""
+        for chunk in stream:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Safety-blocked and finish-only chunks have no text part
+                text = None
+            if text:
+                yield {'delta': text}
+            usage = getattr(chunk, 'usage_metadata', None)
+            if usage:
+                yield {'tokens_used': usage.total_token_count}
+    
+    def _format_transcript(self, messages: List[Dict[str, str]]) -> str:
+        """Render conversation messages as a plain-text transcript."""
+        return "\n".join([
             f"{msg.get('sender', msg.get('role'))}: {msg['content']}"
             for msg in messages
         ])
+    
+    def _summary_prompt(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Build the prompt for generate_summary()."""
+        conversation_text = self._format_transcript(messages)
         
-        summary_prompt = [
+        return [
             {
                 'role': 'system',
                 'content': 'You are an AI assistant that creates concise, informative summaries of conversations.'
@@ -178,26 +356,12 @@ class AIService:
                 'content': f"Please provide a concise summary of the following conversation:\n\n{conversation_text}"
             }
         ]
-        
-        result = self.chat(summary_prompt)
-        return result.get('response', 'Summary generation failed')
     
-    def extract_topics(self, messages: List[Dict[str, str]]) -> List[str]:
-        """
-        Extract main topics from a conversation.
+    def _topics_prompt(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Build the prompt for extract_topics()."""
+        conversation_text = self._format_transcript(messages)
         
-        Args:
-            messages: List of conversation messages
-        
-        Returns:
-            List of topic strings
-        """
-        conversation_text = "\n".join([
-            f"{msg.get('sender', msg.get('role'))}: {msg['content']}"
-            for msg in messages
-        ])
-        
-        topic_prompt = [
+        return [
             {
                 'role': 'system',
                 'content': 'You are an AI that extracts key topics from conversations. Return only a JSON array of topics.'
@@ -207,10 +371,9 @@ class AIService:
                 'content': f"Extract 3-5 main topics from this conversation as a JSON array:\n\n{conversation_text}"
             }
         ]
-        
-        result = self.chat(topic_prompt)
-        response_text = result.get('response', '[]')
-        
+    
+    def _parse_topics(self, response_text: str) -> List[str]:
+        """Parse the topics response into a list of at most 5 topics."""
         try:
             # Try to parse JSON response
             topics = json.loads(response_text)
@@ -223,176 +386,730 @@ class AIService:
         
         return []
     
-    def analyze_sentiment(self, messages: List[Dict[str, str]]) -> str:
+    def _sentiment_prompt(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Build the prompt for analyze_sentiment()."""
+        conversation_text = self._format_transcript(messages)
+        
+        return [
+            {
+                'role': 'system',
+                'content': 'You are an AI that analyzes sentiment. Respond with only one word: positive, negative, or neutral.'
+            },
+            {
+                'role': 'user',
+                'content': f"What is the overall sentiment of this conversation?\n\n{conversation_text}"
+            }
+        ]
+    
+    def _parse_sentiment(self, response_text: str) -> str:
+        """Normalize the sentiment response to positive, negative or neutral."""
+        sentiment = response_text.lower().strip()
+        
+        # Ensure valid sentiment
+        if sentiment not in ['positive', 'negative', 'neutral']:
+            sentiment = 'neutral'
+        
+        return sentiment
+    
+    def _key_points_prompt(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Build the prompt for extract_key_points()."""
+        conversation_text = self._format_transcript(messages)
+        
+        return [
+            {
+                'role': 'system',
+                'content': 'You are an AI that extracts key points, decisions, and action items. Return a JSON array of strings.'
+            },
+            {
+                'role': 'user',
+                'content': f"Extract key points, decisions, and action items from this conversation as a JSON array:\n\n{conversation_text}"
+            }
+        ]
+    
+    def _parse_key_points(self, response_text: str) -> List[str]:
+        """Parse the key points response into a list of at most 10 points."""
+        try:
+            key_points = json.loads(response_text)
+            if isinstance(key_points, list):
+                return key_points[:10]  # Limit to 10 key points
+        except json.JSONDecodeError:
+            # Fallback: split by newlines or bullets
+            lines = response_text.split('\n')
+            key_points = [line.strip('- •*').strip() for line in lines if line.strip()]
+            return key_points[:10]
+        
+        return []
+    
+    def get_map_reduce_config(self) -> Dict[str, int]:
+        """Return the chunk_tokens, parallelism and max_rounds settings for the current model or provider."""
+        configs = settings.AI_MAP_REDUCE
+        for key in (self.model, self.provider):
+            if key in configs:
+                return configs[key]
+        return configs['default']
+    
+    def _chunk_transcript(self, messages: List[Dict[str, str]], chunk_tokens: int) -> List[List[Dict[str, str]]]:
         """
-        Analyze the overall sentiment of a conversation.
+        Split messages into consecutive chunks of at most chunk_tokens each.
+        
+        Chunks break between messages and are filled from the start, so
+        appending messages only changes the last chunk. A single message
+        longer than a chunk is split into several parts.
+        """
+        chunks = []
+        current = []
+        used = 0
+        for msg in messages:
+            sender = msg.get('sender', msg.get('role'))
+            content = msg['content']
+            # Split oversized messages into chunk-sized parts (about 4 characters per token)
+            part_chars = max(chunk_tokens - 8, 1) * 4
+            parts = [content[i:i + part_chars] for i in range(0, len(content), part_chars)] or ['']
+            for part in parts:
+                cost = message_tokens(part)
+                if current and used + cost > chunk_tokens:
+                    chunks.append(current)
+                    current, used = [], 0
+                current.append({'sender': sender, 'content': part})
+                used += cost
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    def _chunk_prompt(self, chunk: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Build the map prompt that condenses one chunk of a long conversation."""
+        conversation_text = self._format_transcript(chunk)
+        
+        return [
+            {
+                'role': 'system',
+                'content': (
+                    'You are an AI assistant that condenses one part of a long conversation. '
+                    'Keep names, facts, decisions, action items, open questions and the tone of the participants.'
+                )
+            },
+            {
+                'role': 'user',
+                'content': f"Condense this part of a conversation into a few short paragraphs:\n\n{conversation_text}"
+            }
+        ]
+    
+    def _chunk_cache_key(self, chunk: List[Dict[str, str]]) -> str:
+        """Cache key for a condensed chunk: provider, model and a hash of the chunk content."""
+        digest = hashlib.sha256(self._format_transcript(chunk).encode('utf-8')).hexdigest()
+        return f'chunk-summary:v{CHUNK_PROMPT_VERSION}:{self.provider}:{self.model}:{digest}'
+    
+    def _condense_chunk(self, chunk: List[Dict[str, str]]) -> str:
+        """Condense one chunk, reusing the cached result for identical chunks."""
+        key = self._chunk_cache_key(chunk)
+        condensed = cache.get(key)
+        if condensed is None:
+            result = self.chat(self._chunk_prompt(chunk))
+            if result.get('error'):
+                raise AIServiceError(result.get('response', 'AI service error'))
+            condensed = (result.get('response') or '').strip()
+            cache.set(key, condensed, settings.AI_CHUNK_CACHE_TIMEOUT)
+        return condensed
+    
+    async def _acondense_chunk(self, chunk: List[Dict[str, str]]) -> str:
+        """Async version of _condense_chunk()."""
+        key = self._chunk_cache_key(chunk)
+        condensed = await cache.aget(key)
+        if condensed is None:
+            result = await self.achat(self._chunk_prompt(chunk))
+            if result.get('error'):
+                raise AIServiceError(result.get('response', 'AI service error'))
+            condensed = (result.get('response') or '').strip()
+            await cache.aset(key, condensed, settings.AI_CHUNK_CACHE_TIMEOUT)
+        return condensed
+    
+    def _condensed_messages(self, chunks: List[List[Dict[str, str]]], condensed: List[str]) -> List[Dict[str, str]]:
+        """Present condensed chunks as transcript entries for the reduce step."""
+        return [
+            {'sender': f'part {i} of {len(chunks)} (condensed)', 'content': text}
+            for i, text in enumerate(condensed, start=1)
+        ]
+    
+    def _transcript_tokens(self, messages: List[Dict[str, str]]) -> int:
+        return sum(message_tokens(msg['content']) for msg in messages)
+    
+    def needs_map_reduce(self, messages: List[Dict[str, str]]) -> bool:
+        """Whether a transcript is too long to analyze in a single prompt."""
+        return self._transcript_tokens(messages) > self.get_map_reduce_config()['chunk_tokens']
+    
+    def _check_map_round(self, config: Dict[str, int], rounds: int, before: int,
+                         messages: List[Dict[str, str]]) -> int:
+        """
+        Check that a condensing round made progress and another may follow.
+        
+        Returns:
+            Token estimate of the condensed messages
+        
+        Raises:
+            AIServiceError: if the round did not shorten the transcript, or it
+                is still too long after max_rounds rounds
+        """
+        after = self._transcript_tokens(messages)
+        if after >= before:
+            raise AIServiceError(f'Condensing did not shorten the transcript ({before} to {after} tokens)')
+        max_rounds = config.get('max_rounds', MAP_REDUCE_MAX_ROUNDS)
+        if after > config['chunk_tokens'] and rounds >= max_rounds:
+            raise AIServiceError(f'Transcript still has {after} tokens after {rounds} condensing rounds')
+        return after
+    
+    def condense_transcript(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        Map step of the map-reduce analysis for long conversations.
+        
+        Splits the transcript into token-bounded chunks and condenses them in
+        parallel (at most `parallelism` provider calls at once). If the
+        condensed text is still longer than one chunk, it is condensed again,
+        for at most `max_rounds` rounds that must each shorten it. Short
+        transcripts are returned unchanged.
         
         Args:
             messages: List of conversation messages
         
         Returns:
-            Sentiment string (e.g., 'positive', 'negative', 'neutral')
+            Messages to run the analyses on
+        
+        Raises:
+            AIServiceError: if a chunk could not be condensed, or the
+                transcript could not be condensed to one chunk
         """
-        conversation_text = "\n".join([
-            f"{msg.get('sender', msg.get('role'))}: {msg['content']}"
-            for msg in messages
-        ])
+        config = self.get_map_reduce_config()
+        tokens = self._transcript_tokens(messages)
+        rounds = 0
+        while tokens > config['chunk_tokens']:
+            chunks = self._chunk_transcript(messages, config['chunk_tokens'])
+            with ThreadPoolExecutor(max_workers=config['parallelism'], thread_name_prefix='map') as executor:
+                condensed = list(executor.map(self._condense_chunk, chunks))
+            messages = self._condensed_messages(chunks, condensed)
+            rounds += 1
+            tokens = self._check_map_round(config, rounds, tokens, messages)
+        return messages
+    
+    async def acondense_transcript(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Async version of condense_transcript()."""
+        config = self.get_map_reduce_config()
+        semaphore = asyncio.Semaphore(config['parallelism'])
         
-        sentiment_prompt = [
+        async def condense(chunk):
+            async with semaphore:
+                return await self._acondense_chunk(chunk)
+        
+        tokens = self._transcript_tokens(messages)
+        rounds = 0
+        while tokens > config['chunk_tokens']:
+            chunks = self._chunk_transcript(messages, config['chunk_tokens'])
+            condensed = await asyncio.gather(*(condense(chunk) for chunk in chunks))
+            messages = self._condensed_messages(chunks, condensed)
+            rounds += 1
+            tokens = self._check_map_round(config, rounds, tokens, messages)
+        return messages
+    
+    def generate_summary(self, messages: List[Dict[str, str]]) -> str:
+        """
+        Generate a summary of a conversation.
+        
+        Long conversations are condensed chunk by chunk first (map-reduce).
+        
+        Args:
+            messages: List of conversation messages
+        
+        Returns:
+            Summary text
+        """
+        try:
+            messages = self.condense_transcript(messages)
+        except AIServiceError:
+            return 'Summary generation failed'
+        result = self.chat(self._summary_prompt(messages))
+        return result.get('response', 'Summary generation failed')
+    
+    async def agenerate_summary(self, messages: List[Dict[str, str]]) -> str:
+        """Async version of generate_summary()."""
+        try:
+            messages = await self.acondense_transcript(messages)
+        except AIServiceError:
+            return 'Summary generation failed'
+        result = await self.achat(self._summary_prompt(messages))
+        return result.get('response', 'Summary generation failed')
+    
+    def _update_summary_prompt(self, previous_summary: Optional[str], messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Build the prompt for update_summary()."""
+        conversation_text = self._format_transcript(messages)
+        
+        return [
             {
                 'role': 'system',
-                'content': 'You are an AI that analyzes sentiment. Respond with only one word: positive, negative, or neutral.'
+                'content': 'You are an AI assistant that maintains a running summary of a conversation. Keep names, facts, decisions and open questions; drop small talk.'
             },
             {
                 'role': 'user',
-                'content': f"What is the overall sentiment of this conversation?\n\n{conversation_text}"
+                'content': (
+                    f"Summary so far:\n{previous_summary or '(none)'}\n\n"
+                    f"New messages:\n{conversation_text}\n\n"
+                    "Return the updated summary only."
+                )
             }
         ]
+    
+    def update_summary(self, previous_summary: Optional[str], messages: List[Dict[str, str]]) -> Optional[str]:
+        """
+        Extend an existing summary with new conversation messages.
         
-        result = self.chat(sentiment_prompt)
-        sentiment = result.get('response', 'neutral').lower().strip()
+        Only the new messages are sent, so the cost does not grow with the
+        length of the conversation.
         
-        # Ensure valid sentiment
-        if sentiment not in ['positive', 'negative', 'neutral']:
-            sentiment = 'neutral'
+        Args:
+            previous_summary: Summary of the earlier messages (may be empty)
+            messages: Messages that came after the summarized ones
         
-        return sentiment
+        Returns:
+            Updated summary text, or None if the AI call failed
+        """
+        result = self.chat(self._update_summary_prompt(previous_summary, messages))
+        if result.get('error'):
+            return None
+        return result.get('response')
+    
+    async def aupdate_summary(self, previous_summary: Optional[str], messages: List[Dict[str, str]]) -> Optional[str]:
+        """Async version of update_summary()."""
+        result = await self.achat(self._update_summary_prompt(previous_summary, messages))
+        if result.get('error'):
+            return None
+        return result.get('response')
+    
+    def _running_analysis_prompt(self, previous_summary: Optional[str], previous_topics: List[str],
+                                 messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Build the prompt for update_running_analysis()."""
+        conversation_text = self._format_transcript(messages)
+        
+        return [
+            {
+                'role': 'system',
+                'content': (
+                    'You are an AI that maintains a live summary of an ongoing conversation. '
+                    'Respond with only a JSON object with these keys: '
+                    '"summary" (the updated concise summary string), '
+                    '"topics" (array of 3-5 main topic strings for the whole conversation so far).'
+                )
+            },
+            {
+                'role': 'user',
+                'content': (
+                    f"Summary so far:\n{previous_summary or '(none)'}\n\n"
+                    f"Topics so far: {json.dumps(previous_topics or [])}\n\n"
+                    f"New messages:\n{conversation_text}"
+                )
+            }
+        ]
+    
+    def update_running_analysis(self, previous_summary: Optional[str], previous_topics: List[str],
+                                messages: List[Dict[str, str]]) -> Optional[Dict[str, Any]]:
+        """
+        Extend the live summary and topic list of an active conversation.
+        
+        Only the new messages and the previous results are sent, so each
+        update costs about the same however long the conversation gets.
+        
+        Args:
+            previous_summary: Summary of the earlier messages (may be empty)
+            previous_topics: Topics of the earlier messages (may be empty)
+            messages: Messages that came after the summarized ones
+        
+        Returns:
+            Dict with 'summary' and 'topics', or None if the AI call failed
+        """
+        try:
+            messages = self.condense_transcript(messages)
+        except AIServiceError:
+            return None
+        result = self.chat(self._running_analysis_prompt(previous_summary, previous_topics, messages))
+        if result.get('error'):
+            return None
+        fields = self._parse_combined_analysis(result.get('response') or '')
+        if 'summary' not in fields:
+            return None
+        return {'summary': fields['summary'], 'topics': fields.get('topics', previous_topics or [])}
+    
+    def extract_topics(self, messages: List[Dict[str, str]]) -> List[str]:
+        """
+        Extract main topics from a conversation.
+        
+        Args:
+            messages: List of conversation messages
+        
+        Returns:
+            List of topic strings
+        """
+        result = self.chat(self._topics_prompt(messages))
+        return self._parse_topics(result.get('response', '[]'))
+    
+    async def aextract_topics(self, messages: List[Dict[str, str]]) -> List[str]:
+        """Async version of extract_topics()."""
+        result = await self.achat(self._topics_prompt(messages))
+        return self._parse_topics(result.get('response', '[]'))
+    
+    def analyze_sentiment(self, messages: List[Dict[str, str]]) -> str:
+        """
+        Analyze the overall sentiment of a conversation.
+        
+        Args:
+            messages: List of conversation messages
+        
+        Returns:
+            Sentiment string (e.g., 'positive', 'negative', 'neutral')
+        """
+        result = self.chat(self._sentiment_prompt(messages))
+        return self._parse_sentiment(result.get('response', 'neutral'))
+    
+    async def aanalyze_sentiment(self, messages: List[Dict[str, str]]) -> str:
+        """Async version of analyze_sentiment()."""
+        result = await self.achat(self._sentiment_prompt(messages))
+        return self._parse_sentiment(result.get('response', 'neutral'))
     
     def extract_key_points(self, messages: List[Dict[str, str]]) -> List[str]:
         """
         Extract key points, decisions, and action items from a conversation.
         
+        Long conversations are condensed chunk by chunk first (map-reduce).
+        
         Args:
             messages: List of conversation messages
         
         Returns:
             List of key point strings
         """
-        conversation_text = "\n".join([
-            f"{msg.get('sender', msg.get('role'))}: {msg['content']}"
-            for msg in messages
-        ])
+        try:
+            messages = self.condense_transcript(messages)
+        except AIServiceError:
+            return []
+        result = self.chat(self._key_points_prompt(messages))
+        return self._parse_key_points(result.get('response', '[]'))
+    
+    async def aextract_key_points(self, messages: List[Dict[str, str]]) -> List[str]:
+        """Async version of extract_key_points()."""
+        try:
+            messages = await self.acondense_transcript(messages)
+        except AIServiceError:
+            return []
+        result = await self.achat(self._key_points_prompt(messages))
+        return self._parse_key_points(result.get('response', '[]'))
+    
+    def _analysis_steps(self) -> Dict[str, Any]:
+        """Map each analysis field to its (prompt builder, response parser)."""
+        return {
+            'summary': (self._summary_prompt, str.strip),
+            'topics': (self._topics_prompt, self._parse_topics),
+            'sentiment': (self._sentiment_prompt, self._parse_sentiment),
+            'key_points': (self._key_points_prompt, self._parse_key_points),
+        }
+    
+    def _run_analysis(self, name: str, messages: List[Dict[str, str]]) -> Any:
+        """Run one analysis, raising AIServiceError if the provider call fails."""
+        build_prompt, parse = self._analysis_steps()[name]
+        result = self.chat(build_prompt(messages))
+        if result.get('error'):
+            raise AIServiceError(result.get('response', 'AI service error'))
+        return parse(result.get('response') or '')
+    
+    async def _arun_analysis(self, name: str, messages: List[Dict[str, str]]) -> Any:
+        """Async version of _run_analysis()."""
+        build_prompt, parse = self._analysis_steps()[name]
+        result = await self.achat(build_prompt(messages))
+        if result.get('error'):
+            raise AIServiceError(result.get('response', 'AI service error'))
+        return parse(result.get('response') or '')
+    
+    def _combined_analysis_prompt(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Build the prompt for a single call returning all analysis fields as JSON."""
+        conversation_text = self._format_transcript(messages)
         
-        keypoints_prompt = [
+        return [
             {
                 'role': 'system',
-                'content': 'You are an AI that extracts key points, decisions, and action items. Return a JSON array of strings.'
+                'content': (
+                    'You are an AI that analyzes conversations. Respond with only a JSON object with these keys: '
+                    '"summary" (a concise summary string), '
+                    '"topics" (array of 3-5 main topic strings), '
+                    '"sentiment" (one of "positive", "negative", "neutral"), '
+                    '"key_points" (array of key point, decision and action item strings).'
+                )
             },
             {
                 'role': 'user',
-                'content': f"Extract key points, decisions, and action items from this conversation as a JSON array:\n\n{conversation_text}"
+                'content': f"Analyze this conversation:\n\n{conversation_text}"
             }
         ]
+    
+    def _parse_combined_analysis(self, response_text: str) -> Dict[str, Any]:
+        """
+        Parse and validate a combined analysis response.
         
-        result = self.chat(keypoints_prompt)
-        response_text = result.get('response', '[]')
-        
+        Returns:
+            Dict with only the fields that match the schema; fields that are
+            missing or malformed are left out so they can be re-run separately.
+        """
+        text = response_text.strip()
+        # Tolerate code fences or text around the JSON object
+        start, end = text.find('{'), text.rfind('}')
         try:
-            key_points = json.loads(response_text)
-            if isinstance(key_points, list):
-                return key_points[:10]  # Limit to 10 key points
+            data = json.loads(text[start:end + 1]) if start != -1 else None
         except json.JSONDecodeError:
-            # Fallback: split by newlines or bullets
-            lines = response_text.split('\n')
-            key_points = [line.strip('- •*').strip() for line in lines if line.strip()]
-            return key_points[:10]
+            data = None
+        if not isinstance(data, dict):
+            return {}
         
-        return []
+        def is_string_list(value):
+            return isinstance(value, list) and all(isinstance(item, str) for item in value)
+        
+        results = {}
+        summary = data.get('summary')
+        if isinstance(summary, str) and summary.strip():
+            results['summary'] = summary.strip()
+        if is_string_list(data.get('topics')) and data['topics']:
+            results['topics'] = data['topics'][:5]
+        sentiment = data.get('sentiment')
+        if isinstance(sentiment, str) and sentiment.lower().strip() in ('positive', 'negative', 'neutral'):
+            results['sentiment'] = sentiment.lower().strip()
+        if is_string_list(data.get('key_points')):
+            results['key_points'] = data['key_points'][:10]
+        return results
+    
+    def _run_combined_analysis(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Request every analysis field in one call; returns the valid fields."""
+        result = self.chat(self._combined_analysis_prompt(messages))
+        if result.get('error'):
+            raise AIServiceError(result.get('response', 'AI service error'))
+        return self._parse_combined_analysis(result.get('response') or '')
     
-    def query_conversations(self, query: str, conversations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    async def _arun_combined_analysis(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Async version of _run_combined_analysis()."""
+        result = await self.achat(self._combined_analysis_prompt(messages))
+        if result.get('error'):
+            raise AIServiceError(result.get('response', 'AI service error'))
+        return self._parse_combined_analysis(result.get('response') or '')
+    
+    def analyze_conversation(self, messages: List[Dict[str, str]], timeout: Optional[float] = None) -> Dict[str, Any]:
         """
-        Query past conversations using natural language.
+        Run summary, topic, sentiment and key point analysis.
+        
+        In the default 'separate' AI_ANALYSIS_MODE each analysis is its own
+        provider call, all running concurrently, so ending a conversation takes
+        as long as the slowest analysis. In 'combined' mode a single call asks
+        for all four fields as JSON, sending the transcript once instead of
+        four times; only fields that fail validation are re-run separately.
+        
+        Transcripts longer than one map-reduce chunk are first condensed
+        chunk by chunk (see condense_transcript()), recorded as the 'map'
+        timing; the analyses then run on the condensed text.
+        
+        Analyses that fail or exceed the timeout are reported in 'errors'
+        without discarding the ones that succeeded.
         
         Args:
-            query: User's question about past conversations
-            conversations: List of conversation data to search through
+            messages: List of conversation messages
+            timeout: Overall seconds to wait (default: AI_ANALYSIS_TIMEOUT)
         
         Returns:
-            Dict containing AI response and relevant conversation excerpts
+            Dict with 'results' (field -> value for successful analyses),
+            'errors' (field -> error message) and 'timings' (call -> seconds)
         """
-        # Build context from conversations
+        timeout = settings.AI_ANALYSIS_TIMEOUT if timeout is None else timeout
+        deadline = time.perf_counter() + timeout
+        outcomes = []
+        
+        if self.needs_map_reduce(messages):
+            name, messages, error, seconds = self._run_tasks(
+                {'map': functools.partial(self.condense_transcript, messages)}, timeout
+            )[0]
+            outcomes.append((name, None, error, seconds))
+            if error is not None:
+                return self._collect_analysis(outcomes)
+        
+        if settings.AI_ANALYSIS_MODE == 'combined':
+            combined = self._run_tasks(
+                {'combined': lambda: self._run_combined_analysis(messages)},
+                max(deadline - time.perf_counter(), 0)
+            )
+            outcomes.extend(self._split_combined(combined[0]))
+        
+        # Fields the combined call did not produce (or all of them in 'separate' mode)
+        produced = {name for name, _, error, _ in outcomes if error is None}
+        remaining = [name for name in ANALYSIS_FIELDS if name not in produced]
+        if remaining:
+            outcomes.extend(self._run_tasks(
+                {name: functools.partial(self._run_analysis, name, messages) for name in remaining},
+                max(deadline - time.perf_counter(), 0)
+            ))
+        
+        return self._collect_analysis(outcomes)
+    
+    async def aanalyze_conversation(self, messages: List[Dict[str, str]], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Async version of analyze_conversation()."""
+        timeout = settings.AI_ANALYSIS_TIMEOUT if timeout is None else timeout
+        deadline = time.perf_counter() + timeout
+        outcomes = []
+        
+        if self.needs_map_reduce(messages):
+            name, messages, error, seconds = (await self._arun_tasks(
+                {'map': functools.partial(self.acondense_transcript, messages)}, timeout
+            ))[0]
+            outcomes.append((name, None, error, seconds))
+            if error is not None:
+                return self._collect_analysis(outcomes)
+        
+        if settings.AI_ANALYSIS_MODE == 'combined':
+            combined = await self._arun_tasks(
+                {'combined': lambda: self._arun_combined_analysis(messages)},
+                max(deadline - time.perf_counter(), 0)
+            )
+            outcomes.extend(self._split_combined(combined[0]))
+        
+        # Fields the combined call did not produce (or all of them in 'separate' mode)
+        produced = {name for name, _, error, _ in outcomes if error is None}
+        remaining = [name for name in ANALYSIS_FIELDS if name not in produced]
+        if remaining:
+            outcomes.extend(await self._arun_tasks(
+                {name: functools.partial(self._arun_analysis, name, messages) for name in remaining},
+                max(deadline - time.perf_counter(), 0)
+            ))
+        
+        return self._collect_analysis(outcomes)
+    
+    def _split_combined(self, outcome) -> List[tuple]:
+        """Turn the combined call's outcome into one successful outcome per valid field."""
+        _, fields, error, seconds = outcome
+        outcomes = [(name, value, None, None) for name, value in (fields or {}).items()]
+        # Timing of the single combined call; failures are retried per field
+        outcomes.append(('combined', None, error, seconds))
+        return outcomes
+    
+    def _run_tasks(self, tasks: Dict[str, Any], timeout: float) -> List[tuple]:
+        """
+        Run callables concurrently in threads, waiting at most timeout seconds.
+        
+        Returns:
+            List of (name, value, error, seconds) outcomes, one per task
+        """
+        started = time.perf_counter()
+        
+        def run(name, func):
+            task_started = time.perf_counter()
+            try:
+                return name, func(), None, time.perf_counter() - task_started
+            except Exception as e:
+                return name, None, str(e), time.perf_counter() - task_started
+        
+        executor = ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix='analysis')
+        futures = {executor.submit(run, name, func): name for name, func in tasks.items()}
+        done, _ = wait(futures, timeout=timeout)
+        # Don't wait for timed-out provider calls; their results are discarded
+        executor.shutdown(wait=False, cancel_futures=True)
+        
+        outcomes = []
+        for future, name in futures.items():
+            if future in done:
+                outcomes.append(future.result())
+            else:
+                outcomes.append((name, None, f'Timed out after {timeout:.1f}s', time.perf_counter() - started))
+        return outcomes
+    
+    async def _arun_tasks(self, tasks: Dict[str, Any], timeout: float) -> List[tuple]:
+        """Async version of _run_tasks(); tasks map names to coroutine functions."""
+        async def run(name, func):
+            task_started = time.perf_counter()
+            try:
+                value = await asyncio.wait_for(func(), timeout)
+                return name, value, None, time.perf_counter() - task_started
+            except asyncio.TimeoutError:
+                return name, None, f'Timed out after {timeout:.1f}s', time.perf_counter() - task_started
+            except Exception as e:
+                return name, None, str(e), time.perf_counter() - task_started
+        
+        return list(await asyncio.gather(*(run(name, func) for name, func in tasks.items())))
+    
+    def _collect_analysis(self, outcomes) -> Dict[str, Any]:
+        """Combine (name, value, error, seconds) outcomes into the analyze_conversation() result."""
+        analysis = {'results': {}, 'errors': {}, 'timings': {}}
+        for name, value, error, seconds in outcomes:
+            if name not in ANALYSIS_FIELDS:
+                # Stages such as 'map' and 'combined' only report errors and timings
+                if error is not None:
+                    analysis['errors'][name] = error
+            elif error is None:
+                analysis['results'][name] = value
+            else:
+                analysis['errors'][name] = error
+            if seconds is not None:
+                analysis['timings'][name] = round(seconds, 3)
+        return analysis
+    
+    def _query_prompt(self, query: str, excerpts: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """Build the prompt for query_conversations() from excerpts of past conversations."""
         context_parts = []
-        for conv in conversations:
-            conv_text = f"\n--- Conversation {conv['id']} ({conv['start_timestamp']}) ---\n"
-            conv_text += f"Title: {conv.get('title', 'Untitled')}\n"
-            conv_text += f"Summary: {conv.get('summary', 'No summary')}\n"
-            conv_text += f"Topics: {', '.join(conv.get('topics', []))}\n"
-            
-            # Include some message samples
-            messages = conv.get('messages', [])[:5]  # First 5 messages
-            for msg in messages:
-                conv_text += f"{msg['sender']}: {msg['content'][:200]}...\n"
-            
-            context_parts.append(conv_text)
+        current = None
+        for excerpt in excerpts:
+            if excerpt['conversation_id'] != current:
+                current = excerpt['conversation_id']
+                context_parts.append(
+                    f"\n[Conversation {current}] {excerpt.get('title') or 'Untitled'} ({excerpt['start_timestamp']})"
+                )
+            context_parts.append(f"{excerpt['text']}\n...")
         
         context = "\n".join(context_parts)
         
-        query_prompt = [
+        return [
             {
                 'role': 'system',
-                'content': 'You are an AI assistant that helps users find information in their past conversations. Provide clear, specific answers with references to conversation IDs when relevant.'
+                'content': 'You are an AI assistant that helps users find information in their past conversations. Answer only from the excerpts provided, and cite the conversations you use by their ID, like [Conversation 12].'
             },
             {
                 'role': 'user',
-                'content': f"Based on these past conversations:\n\n{context}\n\nUser question: {query}\n\nProvide a helpful answer with specific references."
+                'content': f"Excerpts from past conversations:\n{context}\n\nUser question: {query}\n\nProvide a helpful answer with citations."
             }
         ]
+    
+    def query_conversations(self, query: str, excerpts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Query past conversations using natural language.
         
-        result = self.chat(query_prompt)
+        Args:
+            query: User's question about past conversations
+            excerpts: Excerpts to answer from, with their conversation ids
+                (see retrieval.query_excerpts())
+        
+        Returns:
+            Dict containing AI response and the ids of the cited conversations
+        """
+        result = self.chat(self._query_prompt(query, excerpts))
         
         return {
             'answer': result.get('response', 'Unable to answer query'),
-            'relevant_conversations': [conv['id'] for conv in conversations],
+            'relevant_conversations': list(dict.fromkeys(e['conversation_id'] for e in excerpts)),
             'error': result.get('error', False)
         }
     
-    def semantic_search(self, query: str, conversations: List[Dict[str, Any]], limit: int = 5) -> List[Dict[str, Any]]:
+    def query_conversations_stream(self, query: str, excerpts: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
         """
-        Perform semantic search across conversations.
+        Streaming version of query_conversations().
         
-        Args:
-            query: Search query
-            conversations: List of all conversations
-            limit: Maximum number of results
+        Yields:
+            The chunks of chat_stream() for the answer
+        """
+        return self.chat_stream(self._query_prompt(query, excerpts))
+    
+    async def aquery_conversations(self, query: str, excerpts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Async version of query_conversations()."""
+        result = await self.achat(self._query_prompt(query, excerpts))
         
-        Returns:
-            List of relevant conversations ranked by relevance
-        """
-        # Simple keyword-based search for now
-        # In a production system, you would use embeddings and vector similarity
-        
-        query_lower = query.lower()
-        scored_conversations = []
-        
-        for conv in conversations:
-            score = 0
-            
-            # Check title
-            if conv.get('title') and query_lower in conv['title'].lower():
-                score += 5
-            
-            # Check summary
-            if conv.get('summary') and query_lower in conv['summary'].lower():
-                score += 3
-            
-            # Check topics
-            topics = conv.get('topics', [])
-            for topic in topics:
-                if query_lower in topic.lower():
-                    score += 2
-            
-            # Check messages
-            messages = conv.get('messages', [])
-            for msg in messages:
-                if query_lower in msg['content'].lower():
-                    score += 1
-            
-            if score > 0:
-                scored_conversations.append((score, conv))
-        
-        # Sort by score and return top results
-        scored_conversations.sort(key=lambda x: x[0], reverse=True)
-        return [conv for score, conv in scored_conversations[:limit]]
+        return {
+            'answer': result.get('response', 'Unable to answer query'),
+            'relevant_conversations': list(dict.fromkeys(e['conversation_id'] for e in excerpts)),
+            'error': result.get('error', False)
+        }
 
 
 # Singleton instance
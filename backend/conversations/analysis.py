@@ -0,0 +1,64 @@
+"""
+End-of-conversation analysis helpers.
+
+Shared by the sync and async end_conversation views and by the background
+analysis worker (jobs.py).
+"""
+import logging
+
+from django.utils import timezone
+
+from . import answer_cache
+from .retrieval import index_chunks
+from .vector_index import embed_conversation
+
+
+logger = logging.getLogger(__name__)
+
+
+def log_analysis(conversation_id, analysis):
+    """Log per-analysis timings and failures for an ended conversation."""
+    timings = ', '.join(f'{name}={seconds:.2f}s' for name, seconds in analysis['timings'].items())
+    logger.info('Conversation %s analysis timings: %s', conversation_id, timings)
+    for name, error in analysis['errors'].items():
+        logger.warning('Conversation %s %s analysis failed: %s', conversation_id, name, error)
+
+
+def analysis_messages(conversation):
+    """
+    Messages to analyze when a conversation ends.
+    
+    If the conversation has a running summary (see running_summary.py), only
+    the summary and the messages after it are returned, so the final analysis
+    covers a small delta instead of the whole transcript.
+    """
+    messages = conversation.messages.order_by('timestamp', 'id')
+    if not conversation.running_summary:
+        return list(messages.values('sender', 'content'))
+    
+    delta = messages.filter(timestamp__gt=conversation.running_summary_until)
+    return [
+        {'sender': 'summary of the earlier messages', 'content': conversation.running_summary}
+    ] + list(delta.values('sender', 'content'))
+
+
+def apply_analysis(conversation, analysis):
+    """
+    Mark a conversation as ended and store the analysis results that succeeded.
+
+    Fields whose analysis failed keep their defaults. The conversation is also
+    embedded and added to the vector index, and its message windows are
+    chunked and embedded for retrieval, and cached query answers are
+    invalidated. end_timestamp is kept if
+    already set, so a queued analysis records when the user ended the
+    conversation rather than when the worker finished.
+    """
+    conversation.status = 'ended'
+    conversation.end_timestamp = conversation.end_timestamp or timezone.now()
+    for field, value in analysis['results'].items():
+        setattr(conversation, field, value)
+    # Embed with the new summary and topics for query_conversations
+    embed_conversation(conversation, save=False)
+    conversation.save()
+    index_chunks(conversation)
+    answer_cache.bump_corpus_version()
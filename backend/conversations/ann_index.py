@@ -0,0 +1,433 @@
+"""
+Approximate nearest neighbour index (IVF-PQ) over conversation embeddings.
+
+Selected with AI_VECTOR_INDEX = 'ivfpq' for corpora too large for the exact
+scan in vector_index.py. Built offline by `python manage.py build_ann_index`
+and saved to AI_ANN_INDEX_DIR as .npy files that every process memory-maps,
+so gunicorn workers share the same pages instead of each holding a copy.
+
+IVF-PQ in brief:
+
+- k-means splits the vectors into `nlist` inverted lists (the coarse
+  quantizer); a query only scans the `nprobe` lists whose centroids are
+  closest to it;
+- each vector's residual from its list centroid is compressed by product
+  quantization to `m` one-byte codes (one per dim/m-dimensional subspace),
+  so a query scores a vector with m table lookups;
+- the best `AI_ANN_RERANK * k` candidates are re-scored exactly from the
+  full vectors, which are stored too but only read for those candidates.
+
+The saved index is read-only. ANNIndex layers an exact VectorIndex on top for
+conversations ended (or re-embedded) since the build, and a set of ids to
+hide for ones deleted since, in this process or, found on sync, in another;
+`build_ann_index --compact` folds both back in.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .embeddings import get_embedder
+from .models import Conversation
+from .vector_index import VectorIndex
+
+
+logger = logging.getLogger(__name__)
+
+# Pointer to the current version directory, replaced atomically on save
+CURRENT_FILE = 'CURRENT'
+
+# Rows per matrix product when assigning vectors to centroids
+BATCH_SIZE = 65536
+
+ARRAYS = ('centroids', 'codebooks', 'offsets', 'ids', 'starts', 'codes', 'vectors')
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid (L2) of each vector."""
+    squared_norms = np.einsum('ij,ij->i', centroids, centroids)
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), BATCH_SIZE):
+        batch = np.asarray(vectors[start:start + BATCH_SIZE], dtype=np.float32)
+        labels[start:start + len(batch)] = np.argmin(squared_norms - 2 * batch @ centroids.T, axis=1)
+    return labels
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """Lloyd's k-means; empty clusters are reseeded with random vectors."""
+    k = min(k, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        labels = _assign(vectors, centroids)
+        counts = np.bincount(labels, minlength=k)
+        order = np.argsort(labels, kind='stable')
+        nonempty = np.flatnonzero(counts)
+        sums = np.add.reduceat(vectors[order], np.cumsum(counts)[nonempty] - counts[nonempty])
+        centroids[nonempty] = sums / counts[nonempty, None]
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+    return centroids
+
+
+class IVFPQ:
+    """Read-only IVF-PQ arrays for inner product search over L2-normalized vectors."""
+
+    def __init__(self, centroids, codebooks, offsets, ids, starts, codes, vectors, built_at=None):
+        self.centroids = centroids   # (nlist, dim) float32
+        self.codebooks = codebooks   # (m, 256, dim / m) float32
+        self.offsets = offsets       # (nlist + 1,) int64: rows of list i are offsets[i]:offsets[i + 1]
+        self.ids = ids               # (n,) int64 conversation ids, grouped by list
+        self.starts = starts         # (n,) float64 conversation start times (POSIX)
+        self.codes = codes           # (n, m) uint8
+        self.vectors = vectors       # (n, dim) float32, for reranking
+        self.built_at = built_at
+
+    @property
+    def dim(self) -> int:
+        return self.centroids.shape[1]
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, nlist: int, m: int, train_size: int = 100000,
+              iterations: int = 15, seed: int = 0) -> 'IVFPQ':
+        """
+        Train the coarse quantizer and the product quantizer on a sample.
+
+        Returns:
+            An empty index with the trained quantizers; see encode()
+        """
+        dim = vectors.shape[1]
+        if dim % m:
+            raise ValueError(f'm={m} does not divide the dimension {dim}')
+        rng = np.random.default_rng(seed)
+        sample = vectors[np.sort(rng.choice(len(vectors), min(train_size, len(vectors)), replace=False))]
+        sample = np.asarray(sample, dtype=np.float32)
+
+        centroids = kmeans(sample, nlist, iterations, rng)
+        residuals = sample - centroids[_assign(sample, centroids)]
+        subspaces = residuals.reshape(len(sample), m, dim // m)
+        codebooks = np.zeros((m, 256, dim // m), dtype=np.float32)
+        for j in range(m):
+            trained = kmeans(np.ascontiguousarray(subspaces[:, j]), 256, iterations, rng)
+            codebooks[j, :len(trained)] = trained
+        return cls(centroids, codebooks, np.zeros(len(centroids) + 1, dtype=np.int64),
+                   np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros((0, m), dtype=np.uint8),
+                   np.zeros((0, dim), dtype=np.float32))
+
+    def encode(self, ids, starts, vectors, built_at=None) -> 'IVFPQ':
+        """Return an index of these vectors, encoded with this index's quantizers."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        m, _, sub_dim = self.codebooks.shape
+        labels = _assign(vectors, self.centroids)
+        codes = np.zeros((len(vectors), m), dtype=np.uint8)
+        for start in range(0, len(vectors), BATCH_SIZE):
+            batch = slice(start, start + BATCH_SIZE)
+            residuals = (vectors[batch] - self.centroids[labels[batch]]).reshape(-1, m, sub_dim)
+            for j in range(m):
+                codes[batch, j] = _assign(residuals[:, j], self.codebooks[j])
+
+        order = np.argsort(labels, kind='stable')
+        offsets = np.zeros(len(self.centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=len(self.centroids)), out=offsets[1:])
+        return IVFPQ(self.centroids, self.codebooks, offsets,
+                     np.asarray(ids, dtype=np.int64)[order], np.asarray(starts, dtype=np.float64)[order],
+                     codes[order], vectors[order], built_at=built_at)
+
+    def search(self, query_vector, k: int, nprobe: int, rerank: int, date_from=None, date_to=None,
+               exclude: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Find the k vectors with the highest inner product with the query.
+
+        Args:
+            query_vector: L2-normalized query embedding
+            k: Maximum number of results
+            nprobe: Number of inverted lists to scan
+            rerank: Re-score the best rerank * k candidates exactly (0: approximate scores)
+            date_from, date_to: Optional bounds on the conversation start time
+            exclude: Sorted conversation ids to leave out
+
+        Returns:
+            List of (conversation id, score), best first
+        """
+        if len(self) == 0 or k <= 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        m, _, sub_dim = self.codebooks.shape
+
+        centroid_scores = self.centroids @ query
+        distances = np.einsum('ij,ij->i', self.centroids, self.centroids) - 2 * centroid_scores
+        nprobe = min(nprobe, len(self.centroids))
+        probed = np.argpartition(distances, nprobe - 1)[:nprobe]
+        probed = probed[self.offsets[probed + 1] > self.offsets[probed]]
+        if not len(probed):
+            return []
+        ranges = [(self.offsets[i], self.offsets[i + 1]) for i in probed]
+        rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+
+        # q.x = q.centroid + q.residual, and q.residual is a sum over subspaces
+        # of q_j.codeword_j, read from a (m, 256) table
+        table = np.einsum('jkd,jd->jk', self.codebooks, query.reshape(m, sub_dim))
+        codes = np.concatenate([self.codes[start:end] for start, end in ranges])
+        scores = table[np.arange(m), codes].sum(axis=1) + np.repeat(
+            centroid_scores[probed], self.offsets[probed + 1] - self.offsets[probed]
+        )
+
+        keep = np.ones(len(rows), dtype=bool)
+        if date_from is not None or date_to is not None:
+            starts = self.starts[rows]
+            if date_from is not None:
+                keep &= starts >= date_from.timestamp()
+            if date_to is not None:
+                keep &= starts <= date_to.timestamp()
+        if exclude is not None and len(exclude):
+            keep &= ~np.isin(self.ids[rows], exclude)
+        rows, scores = rows[keep], scores[keep]
+
+        candidates = max(k, rerank * k)
+        if len(rows) > candidates:
+            top = np.argpartition(-scores, candidates - 1)[:candidates]
+            rows, scores = rows[top], scores[top]
+        if rerank:
+            # Sorted rows read the memory-mapped vectors sequentially
+            order = np.argsort(rows)
+            rows = rows[order]
+            scores = np.asarray(self.vectors[rows], dtype=np.float32) @ query
+        top = np.argsort(-scores, kind='stable')[:k]
+        return [(int(self.ids[rows[i]]), float(scores[i])) for i in top]
+
+    def save(self, directory: str, keep: Optional[int] = None) -> str:
+        """
+        Save to a new version directory under `directory` and make it current.
+
+        Args:
+            keep: Versions to keep on disk, the new one included (default:
+                AI_ANN_KEEP_VERSIONS); older ones are deleted
+
+        Returns:
+            Path of the version directory
+        """
+        os.makedirs(directory, exist_ok=True)
+        # Starts with the save time, so versions sort oldest first
+        version = f'{datetime.now().strftime("%Y%m%d%H%M%S%f")}-{uuid.uuid4().hex[:8]}'
+        path = os.path.join(directory, version)
+        os.makedirs(path)
+        for name in ARRAYS:
+            np.save(os.path.join(path, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({
+                'built_at': self.built_at.isoformat() if self.built_at else None,
+                'count': len(self),
+                'dim': self.dim,
+                'nlist': len(self.centroids),
+                'm': self.codebooks.shape[0],
+            }, f)
+
+        pointer = os.path.join(directory, f'{CURRENT_FILE}.{version}')
+        with open(pointer, 'w') as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer, os.path.join(directory, CURRENT_FILE))
+
+        prune_versions(directory, settings.AI_ANN_KEEP_VERSIONS if keep is None else keep)
+        return path
+
+    @classmethod
+    def load(cls, directory: str) -> Optional['IVFPQ']:
+        """Memory-map the current version saved under `directory`, or None if there is none."""
+        version = current_version(directory)
+        if version is None:
+            return None
+        path = os.path.join(directory, version)
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in ARRAYS}
+        # Small and read on every query
+        for name in ('centroids', 'codebooks', 'offsets'):
+            arrays[name] = np.array(arrays[name])
+        built_at = datetime.fromisoformat(meta['built_at']) if meta['built_at'] else None
+        index = cls(built_at=built_at, **arrays)
+        index.version = version
+        return index
+
+
+def prune_versions(directory: str, keep: int) -> List[str]:
+    """
+    Delete all but the `keep` newest saved versions; the current one is always kept.
+
+    Processes that map a deleted version keep their pages until they reload,
+    but one that read the CURRENT pointer just before it moved still needs
+    the previous version's files to load, hence keeping more than one.
+
+    Returns:
+        Names of the deleted versions
+    """
+    current = current_version(directory)
+    versions = sorted(
+        (name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name))),
+        reverse=True
+    )
+    deleted = [name for name in versions[max(keep, 1):] if name != current]
+    for name in deleted:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    return deleted
+
+
+def current_version(directory: str) -> Optional[str]:
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class ANNIndex:
+    """
+    Saved IVF-PQ index plus the changes made since it was built.
+
+    Has the same interface as VectorIndex, so get_vector_index() can return
+    either. Conversations ended or re-embedded after the build live in an
+    exact VectorIndex, and shadow their entry in the saved index.
+    """
+
+    def __init__(self, dim: int, directory: str):
+        self.dim = dim
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        ivf = IVFPQ.load(self.directory)
+        if ivf is not None and ivf.dim != self.dim:
+            logger.warning('Ignoring the ANN index in %s: dimension %s, expected %s',
+                           self.directory, ivf.dim, self.dim)
+            ivf = None
+        self.ivf = ivf
+        self.version = ivf.version if ivf is not None else None
+        self.delta = VectorIndex(self.dim)
+        if ivf is not None and ivf.built_at is not None:
+            # Only load what changed since the build (see VectorIndex.sync)
+            self.delta.synced_at = ivf.built_at
+        self._removed = set()
+        self._exclude = None
+
+    def __len__(self):
+        if self.ivf is None:
+            return len(self.delta)
+        shadowed = int(np.isin(self._excluded_ids(), self.ivf.ids).sum())
+        return len(self.ivf) - shadowed + len(self.delta)
+
+    def __contains__(self, conversation_id):
+        return conversation_id in self.delta
+
+    def add(self, conversation_id: int, start_timestamp, vector) -> None:
+        """Insert or replace the vector of a conversation."""
+        with self._lock:
+            self.delta.add(conversation_id, start_timestamp, vector)
+            self._removed.discard(conversation_id)
+            self._exclude = None
+
+    def remove(self, conversation_id: int) -> bool:
+        """Hide a conversation from search until the next build. Always returns True."""
+        with self._lock:
+            self.delta.remove(conversation_id)
+            self._removed.add(conversation_id)
+            self._exclude = None
+            return True
+
+    def _excluded_ids(self) -> np.ndarray:
+        with self._lock:
+            if self._exclude is None:
+                ids = self._removed.union(int(i) for i in self.delta._ids[:len(self.delta)])
+                self._exclude = np.array(sorted(ids), dtype=np.int64)
+            return self._exclude
+
+    def search(self, query_vector, k: int, date_from=None, date_to=None,
+               min_score: float = 0.0) -> List[Tuple[int, float]]:
+        """Approximate top k; same arguments and results as VectorIndex.search()."""
+        hits = self.delta.search(query_vector, k, date_from, date_to, min_score)
+        if self.ivf is not None:
+            hits += [
+                (conversation_id, score)
+                for conversation_id, score in self.ivf.search(
+                    query_vector, k, settings.AI_ANN_NPROBE, settings.AI_ANN_RERANK,
+                    date_from, date_to, exclude=self._excluded_ids()
+                )
+                if score > min_score
+            ]
+        return sorted(hits, key=lambda hit: hit[1], reverse=True)[:k]
+
+    def sync(self) -> int:
+        """
+        Reload a newly built index, then load conversations changed since its
+        build, and hide those no longer served (see VectorIndex.prune()).
+        """
+        if current_version(self.directory) != self.version:
+            with self._lock:
+                self._load()
+        count = self.delta.sync(prune=False)
+        live = self.delta.live_ids()
+        self.delta.prune(live)
+        with self._lock:
+            if self.ivf is not None:
+                self._removed.update(int(i) for i in self.ivf.ids[~np.isin(self.ivf.ids, live)])
+            self._exclude = None
+        return count
+
+    def refresh_if_stale(self) -> None:
+        """Sync if the delta's last sync is older than AI_VECTOR_INDEX_REFRESH seconds."""
+        if time.monotonic() - self.delta._last_refresh >= settings.AI_VECTOR_INDEX_REFRESH:
+            self.sync()
+
+
+def build_ann_index(compact: bool = False, nlist: Optional[int] = None, m: Optional[int] = None,
+                    train_size: int = 100000) -> IVFPQ:
+    """
+    Build the IVF-PQ index from the stored embeddings and save it to AI_ANN_INDEX_DIR.
+
+    Args:
+        compact: Reuse the quantizers of the current index instead of
+            retraining: re-encodes every embedding, dropping deleted
+            conversations and folding in new ones
+        nlist: Number of inverted lists (default: 4 * sqrt(n))
+        m: Number of PQ subspaces (default: dim / 8)
+        train_size: Vectors sampled to train the quantizers
+    """
+    dim = get_embedder().dim
+    # Conversations changed after this are loaded into ANNIndex.delta
+    built_at = timezone.now()
+    ids, starts, vectors = [], [], []
+    for conversation_id, start_timestamp, embedding in Conversation.objects.filter(
+        status='ended', embedding__isnull=False, embedding_model=get_embedder().version
+    ).values_list('id', 'start_timestamp', 'embedding').iterator(chunk_size=2000):
+        if len(embedding) == dim:
+            ids.append(conversation_id)
+            starts.append(start_timestamp.timestamp())
+            vectors.append(embedding)
+    vectors = np.array(vectors, dtype=np.float32).reshape(-1, dim)
+    if not len(vectors):
+        raise ValueError('No conversation embeddings to index; run embed_conversations first')
+
+    current = IVFPQ.load(settings.AI_ANN_INDEX_DIR) if compact else None
+    if current is not None and current.dim == dim:
+        trained = current
+    else:
+        if compact:
+            logger.warning('No compatible ANN index to compact; training a new one')
+        nlist = nlist or max(1, int(4 * np.sqrt(len(vectors))))
+        trained = IVFPQ.train(vectors, nlist, m or max(1, dim // 8), train_size=train_size)
+    index = trained.encode(ids, starts, vectors, built_at=built_at)
+    index.save(settings.AI_ANN_INDEX_DIR)
+    return index
@@ -0,0 +1,132 @@
+"""
+Cache of query_conversations results.
+
+Entries are keyed by the normalized query, date range, limit and a corpus
+version counter. The counter is bumped whenever a conversation ends or is
+deleted, so every older entry stops matching exactly when the conversations
+it was answered from change; stale entries are left to expire.
+
+Everything lives in Django's cache, which CACHE_BACKEND makes shared by
+all workers (database or Redis), so a bump in one process, e.g. the
+analysis worker, invalidates the answers of every other. With the database
+backend incr() is a read then a write: concurrent bumps may land as one,
+but each still moves the version. Entries expire after
+AI_QUERY_CACHE_TIMEOUT seconds, and an LRU list of entry keys bounds their
+number to AI_QUERY_CACHE_SIZE. Updates to the list from concurrent workers
+can race, so the bound is approximate; the TTL still applies to every entry.
+
+Hits and misses are counted for cache_stats() (see the query_cache_stats
+management command).
+"""
+import hashlib
+import json
+import re
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+KEY_PREFIX = 'query-answer'
+VERSION_KEY = f'{KEY_PREFIX}:corpus-version'
+LRU_KEY = f'{KEY_PREFIX}:lru'
+HITS_KEY = f'{KEY_PREFIX}:hits'
+MISSES_KEY = f'{KEY_PREFIX}:misses'
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase a query and drop punctuation and extra whitespace."""
+    return ' '.join(re.findall(r'\w+', query.lower()))
+
+
+def corpus_version() -> int:
+    """Current corpus version (0 until a conversation first ends or is deleted)."""
+    return cache.get(VERSION_KEY, 0)
+
+
+def bump_corpus_version():
+    """Invalidate every cached answer once the current transaction commits."""
+    def bump():
+        # incr() fails on a missing key; add() is a no-op on an existing one
+        cache.add(VERSION_KEY, 0, None)
+        cache.incr(VERSION_KEY)
+    transaction.on_commit(bump)
+
+
+def _digest(query: str, date_from, date_to, limit: int) -> str:
+    parts = [
+        corpus_version(), normalize_query(query),
+        date_from.isoformat() if date_from else None,
+        date_to.isoformat() if date_to else None,
+        limit,
+    ]
+    return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()[:32]
+
+
+def _entry_key(digest: str) -> str:
+    return f'{KEY_PREFIX}:entry:{digest}'
+
+
+def _count(key: str):
+    cache.add(key, 0, None)
+    cache.incr(key)
+
+
+def _touch(digest: str):
+    """Move an entry to the most recently used end of the LRU list, evicting the oldest."""
+    order = cache.get(LRU_KEY, [])
+    if digest in order:
+        order.remove(digest)
+    order.append(digest)
+    size = settings.AI_QUERY_CACHE_SIZE
+    if len(order) > size:
+        cache.delete_many([_entry_key(evicted) for evicted in order[:-size]])
+        order = order[-size:]
+    cache.set(LRU_KEY, order, None)
+
+
+def get_answer(query: str, date_from, date_to, limit: int) -> Optional[Dict[str, Any]]:
+    """
+    Look up a cached query_conversations result.
+
+    Returns:
+        The cached response data, or None on a miss or if the cache is disabled
+    """
+    if settings.AI_QUERY_CACHE_SIZE <= 0:
+        return None
+    digest = _digest(query, date_from, date_to, limit)
+    result = cache.get(_entry_key(digest))
+    if result is None:
+        _count(MISSES_KEY)
+        return None
+    _count(HITS_KEY)
+    _touch(digest)
+    return result
+
+
+def set_answer(query: str, date_from, date_to, limit: int, result: Dict[str, Any]):
+    """Cache a query_conversations result for the current corpus version."""
+    if settings.AI_QUERY_CACHE_SIZE <= 0:
+        return
+    digest = _digest(query, date_from, date_to, limit)
+    cache.set(_entry_key(digest), result, settings.AI_QUERY_CACHE_TIMEOUT)
+    _touch(digest)
+
+
+def cache_stats() -> Dict[str, Any]:
+    """Hits, misses, hit rate, entry count and corpus version of the answer cache."""
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+        'entries': len(cache.get(LRU_KEY, [])),
+        'corpus_version': corpus_version(),
+    }
+
+
+def reset_stats():
+    """Zero the hit and miss counters."""
+    cache.delete_many([HITS_KEY, MISSES_KEY])
@@ -5,3 +5,5 @@ class ConversationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'conversations'
 
+    def ready(self):
+        from . import signals  # noqa: F401
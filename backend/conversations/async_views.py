@@ -0,0 +1,286 @@
+"""
+Async API Views for Chat Portal.
+
+Non-blocking counterparts of the send_message, end_conversation and
+query_conversations actions in views.py, for ASGI deployments
+(e.g. ``uvicorn chat_portal.asgi:application``). While a request is waiting on
+the AI provider the event loop keeps serving other requests, so a single
+process can hold many in-flight LLM calls instead of one per worker.
+
+DRF viewsets are sync-only, so these are plain Django async views that reuse
+the DRF serializers for validation and output and keep the same response format.
+"""
+import functools
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.urls import reverse
+
+from .models import Conversation, Message
+from .serializers import (
+    AnalysisJobSerializer,
+    ConversationDetailSerializer,
+    MessageSerializer,
+    ChatMessageSerializer,
+    EndConversationSerializer,
+    QueryConversationsSerializer
+)
+from . import answer_cache
+from .ai_service import get_ai_service
+from .analysis import analysis_messages, apply_analysis, log_analysis
+from .context import abuild_chat_messages
+from .jobs import enqueue_analysis
+from .retrieval import query_excerpts, timed
+from .running_summary import maybe_schedule_running_summary
+from .views import find_relevant_conversations
+
+
+def async_post_view(view):
+    """
+    Wrap an async view as a CSRF-exempt JSON POST endpoint.
+
+    The wrapped view receives the decoded request body as its second argument.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'POST':
+            return JsonResponse({
+                'success': False,
+                'error': f'Method "{request.method}" not allowed.'
+            }, status=405)
+
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'error': 'Invalid JSON body'
+            }, status=400)
+
+        return await view(request, data, *args, **kwargs)
+
+    # Same behaviour as DRF's APIView, which is CSRF-exempt for API clients
+    wrapper.csrf_exempt = True
+    return wrapper
+
+
+@async_post_view
+async def send_message(request, data):
+    """
+    POST /api/async/conversations/send_message/
+    Async version of ConversationViewSet.send_message.
+    """
+    serializer = ChatMessageSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse({
+            'success': False,
+            'errors': serializer.errors
+        }, status=400)
+
+    conversation_id = serializer.validated_data['conversation_id']
+    user_message = serializer.validated_data['message']
+
+    try:
+        conversation = await Conversation.objects.aget(id=conversation_id)
+
+        if conversation.status != 'active':
+            return JsonResponse({
+                'success': False,
+                'error': 'Conversation is not active'
+            }, status=400)
+
+        # Save user message
+        user_msg = await Message.objects.acreate(
+            conversation=conversation,
+            content=user_message,
+            sender='user'
+        )
+
+        # Get conversation history for context, within the token budget
+        ai_service = get_ai_service()
+        ai_messages = await abuild_chat_messages(conversation, ai_service)
+
+        # Get AI response without blocking the event loop
+        ai_result = await ai_service.achat(ai_messages)
+
+        if ai_result.get('error'):
+            return JsonResponse({
+                'success': False,
+                'error': ai_result.get('response', 'AI service error')
+            }, status=500)
+
+        # Save AI response
+        ai_msg = await Message.objects.acreate(
+            conversation=conversation,
+            content=ai_result['response'],
+            sender='ai',
+            tokens_used=ai_result.get('tokens_used'),
+            model_used=ai_result.get('model')
+        )
+
+        # Update conversation title if it's the first exchange
+        if not conversation.title and await conversation.messages.acount() == 2:
+            conversation.title = user_message[:50] + ('...' if len(user_message) > 50 else '')
+            await conversation.asave()
+        await sync_to_async(maybe_schedule_running_summary)(conversation)
+
+        return JsonResponse({
+            'success': True,
+            'user_message': MessageSerializer(user_msg).data,
+            'ai_response': MessageSerializer(ai_msg).data
+        })
+
+    except Conversation.DoesNotExist:
+        return JsonResponse({
+            'success': False,
+            'error': 'Conversation not found'
+        }, status=404)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Error processing message: {str(e)}'
+        }, status=500)
+
+
+@async_post_view
+async def end_conversation(request, data):
+    """
+    POST /api/async/conversations/end_conversation/
+    Async version of ConversationViewSet.end_conversation.
+    """
+    serializer = EndConversationSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse({
+            'success': False,
+            'errors': serializer.errors
+        }, status=400)
+
+    conversation_id = serializer.validated_data['conversation_id']
+
+    try:
+        conversation = await Conversation.objects.aget(id=conversation_id)
+
+        if conversation.status == 'ended':
+            return JsonResponse({
+                'success': False,
+                'error': 'Conversation is already ended'
+            }, status=400)
+
+        # Get all messages for analysis
+        messages = await sync_to_async(analysis_messages)(conversation)
+
+        if not messages:
+            return JsonResponse({
+                'success': False,
+                'error': 'Cannot end conversation with no messages'
+            }, status=400)
+
+        if settings.ANALYSIS_QUEUE_ENABLED:
+            job = await sync_to_async(enqueue_analysis)(conversation)
+            return JsonResponse({
+                'success': True,
+                'job': AnalysisJobSerializer(job).data,
+                'status_url': request.build_absolute_uri(reverse('analysis-job-detail', args=[job.id])),
+                'message': 'Conversation analysis queued'
+            }, status=202)
+
+        # Generate AI analysis (summary, topics, sentiment, key points) concurrently
+        ai_service = get_ai_service()
+        analysis = await ai_service.aanalyze_conversation(messages)
+        log_analysis(conversation.id, analysis)
+
+        if not analysis['results']:
+            return JsonResponse({
+                'success': False,
+                'error': 'AI analysis failed',
+                'analysis': analysis
+            }, status=502)
+
+        # Update conversation, keeping defaults for analyses that failed
+        await sync_to_async(apply_analysis)(conversation, analysis)
+
+        conversation_data = await sync_to_async(
+            lambda: ConversationDetailSerializer(conversation).data
+        )()
+
+        return JsonResponse({
+            'success': True,
+            'conversation': conversation_data,
+            'analysis': {'timings': analysis['timings'], 'errors': analysis['errors']},
+            'message': 'Conversation ended and analyzed successfully'
+        })
+
+    except Conversation.DoesNotExist:
+        return JsonResponse({
+            'success': False,
+            'error': 'Conversation not found'
+        }, status=404)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Error ending conversation: {str(e)}'
+        }, status=500)
+
+
+@async_post_view
+async def query_conversations(request, data):
+    """
+    POST /api/async/conversations/query_conversations/
+    Async version of ConversationViewSet.query_conversations.
+    """
+    serializer = QueryConversationsSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse({
+            'success': False,
+            'errors': serializer.errors
+        }, status=400)
+
+    query = serializer.validated_data['query']
+    date_from = serializer.validated_data.get('date_from')
+    date_to = serializer.validated_data.get('date_to')
+    limit = serializer.validated_data.get('limit', 5)
+
+    try:
+        timings = {}
+        cached = await sync_to_async(timed)(timings, 'cache', answer_cache.get_answer, query, date_from, date_to, limit)
+        if cached is not None:
+            return JsonResponse({**cached, 'query': query, 'metadata': {'cached': True, 'timings_ms': timings}})
+
+        # Hybrid lexical and vector search over ended conversations
+        relevant_conversations = await sync_to_async(find_relevant_conversations)(
+            query, limit, date_from, date_to, timings
+        )
+
+        ai_service = get_ai_service()
+
+        if relevant_conversations:
+            excerpts = await sync_to_async(timed)(
+                timings, 'chunks', query_excerpts, query, relevant_conversations
+            )
+            started = time.perf_counter()
+            result = await ai_service.aquery_conversations(query, excerpts)
+            timings['answer'] = round((time.perf_counter() - started) * 1000, 2)
+            answer = result['answer']
+        else:
+            answer = 'No relevant conversations found for your query.'
+
+        payload = {
+            'success': True,
+            'query': query,
+            'answer': answer,
+            'relevant_conversations': relevant_conversations,
+            'count': len(relevant_conversations)
+        }
+        # Provider errors come back as the answer text; never cache them
+        if not relevant_conversations or not result.get('error'):
+            await sync_to_async(answer_cache.set_answer)(query, date_from, date_to, limit, payload)
+        return JsonResponse({**payload, 'metadata': {'cached': False, 'timings_ms': timings}})
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Error querying conversations: {str(e)}'
+        }, status=500)
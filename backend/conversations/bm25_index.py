@@ -0,0 +1,597 @@
+"""
+In-process BM25 index over message and conversation text.
+
+An alternative to PostgreSQL full-text search (search.py) for keyword
+retrieval, selected with AI_LEXICAL_BACKEND = 'bm25'. The index is built from
+the Message and Conversation tables on first use and then kept current:
+
+- by the post_save and post_delete handlers in signals.py for changes made
+  in this process;
+- every AI_VECTOR_INDEX_REFRESH seconds a search first pulls messages and
+  conversations that other processes created or changed, and removes the
+  conversations they deleted, found by comparing the indexed conversations
+  with the conversation ids (see prune()).
+
+Every message is a document, and so is each conversation's title, summary
+and topics (its header). A conversation scores the BM25 score of its header
+plus that of its best matching message, like full_text_search().
+
+Postings are kept in flat NumPy arrays, CSR style: the documents containing
+term t are docs[starts[t]:starts[t + 1]], with their term frequencies in tfs
+and their token positions (for phrase queries) in positions. New postings
+are appended to a delta log with the same columns, which is merged into the
+main arrays once it holds AI_BM25_MERGE_THRESHOLD postings. Removing or
+replacing a document only marks it deleted; the merge drops its postings.
+
+Query syntax: plain words (any may match), "quoted phrases" (must occur in
+order within one message) and prefix* words.
+"""
+import logging
+import math
+import re
+import threading
+import time
+import zlib
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import timedelta
+from typing import List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .embeddings import STOP_WORDS, TOKEN_RE
+from .models import Conversation, Message
+
+
+logger = logging.getLogger(__name__)
+
+# BM25 parameters: term frequency saturation and document length normalization
+K1 = 1.2
+B = 0.75
+
+# Most frequent vocabulary terms a prefix* query expands to
+PREFIX_EXPANSIONS = 64
+
+INITIAL_CAPACITY = 1024
+
+# Messages with ids this far below the highest one seen are re-read on sync,
+# to pick up transactions that committed late
+SYNC_ID_OVERLAP = 1000
+SYNC_OVERLAP = timedelta(seconds=30)
+
+QUERY_RE = re.compile(r'"([^"]*)"|(\w+)(\*?)', re.UNICODE)
+
+# One query clause: words (one word, or a phrase) or a prefix
+Clause = namedtuple('Clause', 'words prefix')
+
+# Postings of one term; position_starts index the main positions for the
+# first main_count postings and the delta log's positions for the rest
+Postings = namedtuple('Postings', 'docs tfs position_starts main_count')
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def header_text(title, summary, topics) -> str:
+    """Text indexed for a conversation's title, summary and topics."""
+    return '\n'.join([title or '', summary or '', ' '.join(map(str, topics or []))])
+
+
+def parse_query(text: str) -> List[Clause]:
+    """
+    Parse a query into clauses.
+
+    Stop words are dropped from plain words (unless the query has nothing
+    else) but kept inside phrases.
+    """
+    clauses, words = [], []
+    for phrase, word, star in QUERY_RE.findall(text):
+        if phrase:
+            tokens = tokenize(phrase)
+            if len(tokens) > 1:
+                clauses.append(Clause(tuple(tokens), False))
+            else:
+                words.extend(tokens)
+        elif star:
+            clauses.append(Clause((word.lower(),), True))
+        else:
+            words.append(word.lower())
+    content_words = [word for word in words if word not in STOP_WORDS] or words
+    clauses.extend(Clause((word,), False) for word in dict.fromkeys(content_words))
+    return clauses
+
+
+def _grown(array: np.ndarray, size: int, fill=0) -> np.ndarray:
+    """Return `array`, or a copy at least twice as large if it has fewer than `size` slots."""
+    if size <= len(array):
+        return array
+    new = np.full(max(size, 2 * len(array)), fill, dtype=array.dtype)
+    new[:len(array)] = array
+    return new
+
+
+class BM25Index:
+    """BM25 index over messages and conversation headers, with phrase and prefix queries."""
+
+    def __init__(self, merge_threshold: Optional[int] = None):
+        self.merge_threshold = merge_threshold or settings.AI_BM25_MERGE_THRESHOLD
+        self._lock = threading.Lock()
+
+        # Vocabulary: term -> term id, plus the terms sorted for prefix lookups
+        # (terms added since the last merge are not sorted in yet)
+        self._terms = {}
+        self._sorted_terms = []
+        self._new_terms = []
+
+        # Main postings, grouped by term id
+        self._starts = np.zeros(1, dtype=np.int64)
+        self._position_starts = np.zeros(1, dtype=np.int64)
+        self._docs = np.zeros(0, dtype=np.int32)
+        self._tfs = np.zeros(0, dtype=np.int32)
+        self._positions = np.zeros(0, dtype=np.int32)
+        self._new_delta()
+
+        # Documents, by document id
+        self.doc_count = 0
+        self.live_docs = 0
+        self.total_length = 0
+        self._doc_conversation = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self._doc_length = np.zeros(INITIAL_CAPACITY, dtype=np.int32)
+        self._doc_alive = np.zeros(INITIAL_CAPACITY, dtype=bool)
+        self._doc_is_header = np.zeros(INITIAL_CAPACITY, dtype=bool)
+
+        # Current document of each message and conversation header, by id (-1: none)
+        self._message_docs = np.full(INITIAL_CAPACITY, -1, dtype=np.int32)
+        self._header_docs = np.full(INITIAL_CAPACITY, -1, dtype=np.int32)
+        self._header_hashes = np.zeros(INITIAL_CAPACITY, dtype=np.uint32)
+        # Conversation start times as POSIX timestamps and ended flags, for filters
+        self._conversation_starts = np.zeros(INITIAL_CAPACITY, dtype=np.float64)
+        self._conversation_ended = np.zeros(INITIAL_CAPACITY, dtype=bool)
+
+        self.synced_at = None
+        self._max_message_id = 0
+        self._last_refresh = 0.0
+
+    def _new_delta(self):
+        # A fresh log rather than a reset one, so searches holding the old
+        # arrays are unaffected by a merge
+        self._delta_count = 0
+        self._delta_position_count = 0
+        self._delta_terms = np.zeros(INITIAL_CAPACITY, dtype=np.int32)
+        self._delta_docs = np.zeros(INITIAL_CAPACITY, dtype=np.int32)
+        self._delta_tfs = np.zeros(INITIAL_CAPACITY, dtype=np.int32)
+        self._delta_position_starts = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self._delta_positions = np.zeros(INITIAL_CAPACITY, dtype=np.int32)
+
+    def __len__(self):
+        return self.live_docs
+
+    # Updates
+
+    def add_message(self, message_id: int, conversation_id: int, content: str) -> None:
+        """Index a message, replacing its previous content if it was indexed."""
+        with self._lock:
+            self._message_docs = _grown(self._message_docs, message_id + 1, fill=-1)
+            self._remove_doc(self._message_docs[message_id])
+            self._message_docs[message_id] = self._add_doc(conversation_id, content, is_header=False)
+            self._max_message_id = max(self._max_message_id, message_id)
+            self._merge_if_full()
+
+    def set_conversation(self, conversation_id: int, start_timestamp, ended: bool,
+                         title='', summary='', topics=None) -> None:
+        """Index a conversation's header and update its start time and status."""
+        text = header_text(title, summary, topics)
+        text_hash = zlib.crc32(text.encode('utf-8'))
+        with self._lock:
+            size = conversation_id + 1
+            self._header_docs = _grown(self._header_docs, size, fill=-1)
+            self._header_hashes = _grown(self._header_hashes, size)
+            self._conversation_starts = _grown(self._conversation_starts, size)
+            self._conversation_ended = _grown(self._conversation_ended, size)
+
+            self._conversation_starts[conversation_id] = start_timestamp.timestamp()
+            self._conversation_ended[conversation_id] = ended
+            old = self._header_docs[conversation_id]
+            if old >= 0 and self._header_hashes[conversation_id] == text_hash:
+                return
+            self._remove_doc(old)
+            self._header_docs[conversation_id] = self._add_doc(conversation_id, text, is_header=True)
+            self._header_hashes[conversation_id] = text_hash
+            self._merge_if_full()
+
+    def remove_conversation(self, conversation_id: int) -> None:
+        """Remove a conversation's header and messages."""
+        with self._lock:
+            docs = np.flatnonzero(
+                (self._doc_conversation[:self.doc_count] == conversation_id) & self._doc_alive[:self.doc_count]
+            )
+            for doc in docs:
+                self._remove_doc(doc)
+            if conversation_id < len(self._header_docs):
+                self._header_docs[conversation_id] = -1
+                self._conversation_ended[conversation_id] = False
+
+    def _add_doc(self, conversation_id: int, text: str, is_header: bool) -> int:
+        tokens = tokenize(text)
+        doc = self.doc_count
+        size = doc + 1
+        self._doc_conversation = _grown(self._doc_conversation, size)
+        self._doc_length = _grown(self._doc_length, size)
+        self._doc_alive = _grown(self._doc_alive, size)
+        self._doc_is_header = _grown(self._doc_is_header, size)
+        self._doc_conversation[doc] = conversation_id
+        self._doc_length[doc] = len(tokens)
+        self._doc_alive[doc] = True
+        self._doc_is_header[doc] = is_header
+        self.doc_count = size
+        self.live_docs += 1
+        self.total_length += len(tokens)
+
+        positions = {}
+        for position, token in enumerate(tokens):
+            positions.setdefault(token, []).append(position)
+        if not positions:
+            return doc
+
+        term_ids = [self._term_id(term) for term in positions]
+        tfs = [len(p) for p in positions.values()]
+        start, end = self._delta_count, self._delta_count + len(term_ids)
+        position_start = self._delta_position_count
+        position_end = position_start + len(tokens)
+
+        self._delta_terms = _grown(self._delta_terms, end)
+        self._delta_docs = _grown(self._delta_docs, end)
+        self._delta_tfs = _grown(self._delta_tfs, end)
+        self._delta_position_starts = _grown(self._delta_position_starts, end)
+        self._delta_positions = _grown(self._delta_positions, position_end)
+
+        self._delta_terms[start:end] = term_ids
+        self._delta_docs[start:end] = doc
+        self._delta_tfs[start:end] = tfs
+        self._delta_position_starts[start:end] = position_start + np.cumsum([0] + tfs[:-1])
+        self._delta_positions[position_start:position_end] = [
+            position for term_positions in positions.values() for position in term_positions
+        ]
+        self._delta_count = end
+        self._delta_position_count = position_end
+        return doc
+
+    def _remove_doc(self, doc: int) -> None:
+        if doc >= 0 and self._doc_alive[doc]:
+            self._doc_alive[doc] = False
+            self.live_docs -= 1
+            self.total_length -= int(self._doc_length[doc])
+
+    def _term_id(self, term: str) -> int:
+        term_id = self._terms.get(term)
+        if term_id is None:
+            term_id = self._terms[term] = len(self._terms)
+            self._new_terms.append(term)
+        return term_id
+
+    def _merge_if_full(self):
+        if self._delta_count >= self.merge_threshold:
+            self._merge()
+
+    def merge(self) -> None:
+        """Merge the delta log into the main postings, dropping deleted documents."""
+        with self._lock:
+            self._merge()
+
+    def _merge(self):
+        term_count = len(self._terms)
+        main_terms = np.repeat(np.arange(len(self._starts) - 1, dtype=np.int32), np.diff(self._starts))
+        delta = slice(0, self._delta_count)
+        terms = np.concatenate([main_terms, self._delta_terms[delta]])
+        docs = np.concatenate([self._docs, self._delta_docs[delta]])
+        tfs = np.concatenate([self._tfs, self._delta_tfs[delta]])
+        # Both logs store positions contiguously in posting order
+        positions = np.concatenate([self._positions, self._delta_positions[:self._delta_position_count]])
+
+        kept = np.flatnonzero(self._doc_alive[docs])
+        # Stable, so postings of a term stay in document order
+        kept = kept[np.argsort(terms[kept], kind='stable')]
+        new_index = np.full(len(docs), -1, dtype=np.int64)
+        new_index[kept] = np.arange(len(kept))
+        owners = new_index[np.repeat(np.arange(len(docs)), tfs)]
+        position_order = np.flatnonzero(owners >= 0)
+        position_order = position_order[np.argsort(owners[position_order], kind='stable')]
+
+        terms, self._docs, self._tfs = terms[kept], docs[kept], tfs[kept]
+        self._positions = positions[position_order]
+        self._starts = np.zeros(term_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=term_count), out=self._starts[1:])
+        self._position_starts = np.zeros(term_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, weights=self._tfs, minlength=term_count).astype(np.int64),
+                  out=self._position_starts[1:])
+
+        self._sorted_terms = sorted(self._sorted_terms + self._new_terms)
+        self._new_terms = []
+        self._new_delta()
+
+    # Search
+
+    def search(self, query: str, k: int, date_from=None, date_to=None) -> List[Tuple[int, float]]:
+        """
+        Find the ended conversations that best match a query.
+
+        Args:
+            query: Words, "quoted phrases" and prefix* words
+            k: Maximum number of results
+            date_from, date_to: Optional bounds on the conversation start time
+
+        Returns:
+            List of (conversation id, score), best first
+        """
+        clauses = parse_query(query)
+        with self._lock:
+            # The main arrays are replaced, never modified, by a merge, and
+            # the delta log is append-only, so these stay consistent
+            snapshot = _Snapshot(self)
+        if not clauses or snapshot.live_docs == 0 or k <= 0:
+            return []
+
+        matched_docs, matched_scores = [], []
+        for clause in clauses:
+            if clause.prefix:
+                term_ids = self._expand_prefix(snapshot, clause.words[0])
+                for term_id in term_ids:
+                    postings = snapshot.postings(term_id)
+                    matched_docs.append(postings.docs)
+                    matched_scores.append(snapshot.bm25(postings.docs, postings.tfs, snapshot.idf(len(postings.docs))))
+                continue
+            term_ids = [self._terms.get(word) for word in clause.words]
+            if None in term_ids:
+                continue
+            if len(term_ids) == 1:
+                docs, tfs = snapshot.postings(term_ids[0])[:2]
+                idf = snapshot.idf(len(docs))
+            else:
+                docs, tfs, idf = snapshot.phrase_postings(term_ids)
+            matched_docs.append(docs)
+            matched_scores.append(snapshot.bm25(docs, tfs, idf))
+
+        if not matched_docs:
+            return []
+        docs, inverse = np.unique(np.concatenate(matched_docs), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(matched_scores))
+
+        conversations = snapshot.doc_conversation[docs]
+        keep = snapshot.doc_alive[docs] & (conversations < len(snapshot.conversation_ended))
+        conversations = np.where(keep, conversations, 0)
+        keep &= snapshot.conversation_ended[conversations]
+        starts = snapshot.conversation_starts[conversations]
+        if date_from is not None:
+            keep &= starts >= date_from.timestamp()
+        if date_to is not None:
+            keep &= starts <= date_to.timestamp()
+        docs, conversations, scores = docs[keep], conversations[keep], scores[keep]
+        if len(docs) == 0:
+            return []
+
+        ids, inverse = np.unique(conversations, return_inverse=True)
+        is_header = snapshot.doc_is_header[docs]
+        totals = np.bincount(inverse, weights=np.where(is_header, scores, 0.0), minlength=len(ids))
+        best_message = np.zeros(len(ids))
+        np.maximum.at(best_message, inverse[~is_header], scores[~is_header])
+        totals += best_message
+
+        top = np.argsort(-totals, kind='stable')[:k]
+        return [(int(ids[i]), float(totals[i])) for i in top]
+
+    def _expand_prefix(self, snapshot, prefix: str) -> List[int]:
+        sorted_terms = snapshot.sorted_terms
+        candidates = []
+        for term in sorted_terms[bisect_left(sorted_terms, prefix):]:
+            if not term.startswith(prefix):
+                break
+            candidates.append(self._terms[term])
+        candidates += [self._terms[term] for term in snapshot.new_terms if term.startswith(prefix)]
+        if len(candidates) <= PREFIX_EXPANSIONS:
+            return candidates
+        return sorted(candidates, key=snapshot.document_frequency, reverse=True)[:PREFIX_EXPANSIONS]
+
+    # Sync
+
+    def sync(self) -> int:
+        """
+        Load messages and conversations created or changed since the last sync.
+
+        Returns:
+            Number of messages and conversations read
+        """
+        started = timezone.now()
+        conversations = Conversation.objects.all()
+        messages = Message.objects.filter(id__gt=self._max_message_id - SYNC_ID_OVERLAP)
+        if self.synced_at is not None:
+            conversations = conversations.filter(updated_at__gte=self.synced_at - SYNC_OVERLAP)
+
+        count = 0
+        for conversation_id, start_timestamp, conversation_status, title, summary, topics in (
+            conversations.values_list('id', 'start_timestamp', 'status', 'title', 'summary', 'topics')
+            .iterator(chunk_size=2000)
+        ):
+            self.set_conversation(conversation_id, start_timestamp, conversation_status == 'ended',
+                                  title, summary, topics)
+            count += 1
+
+        for message_id, conversation_id, content in (
+            messages.order_by('id').values_list('id', 'conversation_id', 'content').iterator(chunk_size=2000)
+        ):
+            if message_id < len(self._message_docs) and self._message_docs[message_id] >= 0:
+                continue
+            self.add_message(message_id, conversation_id, content)
+            count += 1
+        if self.synced_at is not None:
+            self.prune()
+
+        self.synced_at = started
+        self._last_refresh = time.monotonic()
+        return count
+
+    def prune(self) -> int:
+        """
+        Remove the conversations deleted since they were indexed, with their
+        messages. Conversations indexed while the ids are read are kept.
+
+        Returns:
+            Number of conversations removed
+        """
+        with self._lock:
+            indexed = np.flatnonzero(self._header_docs >= 0)
+        live = np.fromiter(Conversation.objects.values_list('id', flat=True).iterator(chunk_size=10000),
+                           dtype=np.int64)
+        stale = indexed[~np.isin(indexed, live)]
+        for conversation_id in stale:
+            self.remove_conversation(int(conversation_id))
+        return len(stale)
+
+    def refresh_if_stale(self) -> None:
+        """Sync with the database if the last sync is older than AI_VECTOR_INDEX_REFRESH seconds."""
+        if time.monotonic() - self._last_refresh >= settings.AI_VECTOR_INDEX_REFRESH:
+            self.sync()
+
+    def nbytes(self) -> int:
+        """Bytes held in postings and document arrays (excluding the vocabulary)."""
+        return sum(
+            value.nbytes for value in vars(self).values() if isinstance(value, np.ndarray)
+        )
+
+
+class _Snapshot:
+    """Consistent view of a BM25Index for one search, taken under its lock."""
+
+    def __init__(self, index: BM25Index):
+        self.live_docs = index.live_docs
+        self.average_length = index.total_length / max(index.live_docs, 1)
+        self.starts = index._starts
+        self.position_starts = index._position_starts
+        self.docs = index._docs
+        self.tfs = index._tfs
+        self.positions = index._positions
+        delta = slice(0, index._delta_count)
+        self.delta_terms = index._delta_terms[delta]
+        self.delta_docs = index._delta_docs[delta]
+        self.delta_tfs = index._delta_tfs[delta]
+        self.delta_position_starts = index._delta_position_starts[delta]
+        self.delta_positions = index._delta_positions[:index._delta_position_count]
+        self.doc_conversation = index._doc_conversation[:index.doc_count]
+        self.doc_length = index._doc_length[:index.doc_count]
+        self.doc_alive = index._doc_alive[:index.doc_count]
+        self.doc_is_header = index._doc_is_header[:index.doc_count]
+        self.conversation_starts = index._conversation_starts
+        self.conversation_ended = index._conversation_ended
+        self.sorted_terms = index._sorted_terms
+        self.new_terms = list(index._new_terms)
+
+    def postings(self, term_id: int) -> Postings:
+        """Postings of a term from the main arrays and the delta log, in document order."""
+        if term_id + 1 < len(self.starts):
+            start, end = self.starts[term_id], self.starts[term_id + 1]
+        else:
+            start = end = 0
+        in_delta = np.flatnonzero(self.delta_terms == term_id)
+        tfs = self.tfs[start:end]
+        main_position_starts = self.position_starts[term_id] + np.cumsum(tfs) - tfs if end > start else tfs
+        return Postings(
+            docs=np.concatenate([self.docs[start:end], self.delta_docs[in_delta]]),
+            tfs=np.concatenate([tfs, self.delta_tfs[in_delta]]),
+            position_starts=np.concatenate([main_position_starts, self.delta_position_starts[in_delta]]),
+            main_count=end - start,
+        )
+
+    def document_frequency(self, term_id: int) -> int:
+        if term_id + 1 < len(self.starts):
+            return int(self.starts[term_id + 1] - self.starts[term_id])
+        return 0
+
+    def occurrences(self, postings: Postings, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Token positions of the given postings.
+
+        Returns:
+            (document, position) arrays with one entry per occurrence
+        """
+        tfs = postings.tfs[rows]
+        occurrences = np.repeat(np.arange(len(rows)), tfs)
+        # Index of each occurrence within its posting's run of positions
+        within = np.arange(len(occurrences)) - (np.cumsum(tfs) - tfs)[occurrences]
+        indexes = postings.position_starts[rows][occurrences] + within
+        in_main = (rows < postings.main_count)[occurrences]
+        positions = np.empty(len(occurrences), dtype=np.int64)
+        positions[in_main] = self.positions[indexes[in_main]]
+        positions[~in_main] = self.delta_positions[indexes[~in_main]]
+        return postings.docs[rows][occurrences], positions
+
+    def phrase_postings(self, term_ids: List[int]):
+        """Documents containing the terms in order, with the phrase's frequency and idf."""
+        postings = [self.postings(term_id) for term_id in term_ids]
+        idf = sum(self.idf(len(p.docs)) for p in postings)
+        docs = postings[0].docs
+        for other in postings[1:]:
+            docs = np.intersect1d(docs, other.docs, assume_unique=True)
+
+        # Phrase starts as (document << 32 | position) keys: the positions of
+        # the i-th word, shifted back by i, that every word has in common
+        starts = None
+        for offset, term_postings in enumerate(postings):
+            term_docs, positions = self.occurrences(term_postings, np.searchsorted(term_postings.docs, docs))
+            positions -= offset
+            valid = positions >= 0
+            keys = (term_docs[valid].astype(np.int64) << 32) | positions[valid]
+            starts = keys if starts is None else np.intersect1d(starts, keys, assume_unique=True)
+            if not len(starts):
+                break
+        phrase_docs, phrase_tfs = np.unique(starts >> 32, return_counts=True)
+        return phrase_docs, phrase_tfs, idf
+
+    def idf(self, document_frequency: int) -> float:
+        # Counts postings of deleted documents until the next merge
+        return max(0.0, math.log(1 + (self.live_docs - document_frequency + 0.5) / (document_frequency + 0.5)))
+
+    def bm25(self, docs, tfs, idf) -> np.ndarray:
+        norms = K1 * (1 - B + B * self.doc_length[docs] / self.average_length)
+        return idf * tfs * (K1 + 1) / (tfs + norms)
+
+
+# Singleton instance
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_bm25_index() -> BM25Index:
+    """Get the process-wide index, building it from the database on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            # One merge at the end rather than one per AI_BM25_MERGE_THRESHOLD postings
+            index = BM25Index(merge_threshold=2 ** 62)
+            started = time.perf_counter()
+            count = index.sync()
+            index.merge()
+            index.merge_threshold = settings.AI_BM25_MERGE_THRESHOLD
+            logger.debug('Indexed %s messages and conversations in %.2fs', count, time.perf_counter() - started)
+            _index = index
+    return _index
+
+
+def reset_bm25_index() -> None:
+    """Drop the process-wide index; it is rebuilt on next use."""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def search_conversations(query: str, limit: int = 5, date_from=None, date_to=None) -> List[Tuple[int, float]]:
+    """
+    Rank ended conversations for a query with BM25.
+
+    Returns:
+        List of (conversation id, score), best first
+    """
+    index = get_bm25_index()
+    index.refresh_if_stale()
+    return index.search(query, limit, date_from=date_from, date_to=date_to)
@@ -0,0 +1,137 @@
+"""
+Conditional GET for conversation resources.
+
+Validators are computed from a few columns read in one query, never from the
+serialized payload, so answering an unchanged resource with 304 Not Modified
+costs that query alone:
+
+- A conversation's ETag covers its version (moved by database triggers on
+  every shown change and every message write, see migration 0009) and
+  updated_at. Last-Modified is the later of updated_at and the newest
+  message's timestamp.
+- A keyset list page's ETag covers the query parameters (filters, cursor)
+  and the ids, versions and updated_at of its rows and of the row that
+  follows, read with the page's own bounded range query, plus the count on
+  the first page, which reports it. It moves when a conversation on the
+  page is added, deleted or changed, or gets a new message, and the cost
+  does not grow with the number of conversations.
+- A search page's ETag covers the query parameters and the count, latest
+  updated_at and summed versions of the matches, which are counted for
+  every search page anyway.
+
+Responses are sent with `Cache-Control: private, no-cache`, so browsers keep
+them but revalidate with If-None-Match / If-Modified-Since on every request.
+
+The serialized detail of ended conversations is also cached server side,
+under their ETag, so a stale entry can never be served.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, OuterRef, Subquery, Sum, Window
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import Message
+from .pagination import keyset_page
+
+
+def make_etag(*parts) -> str:
+    """A quoted ETag digesting `parts` (JSON-serializable, datetimes allowed)."""
+    raw = json.dumps(parts, default=str, separators=(',', ':')).encode('utf-8')
+    return quote_etag(hashlib.md5(raw).hexdigest())
+
+
+def conversation_validators(queryset, pk):
+    """
+    Compute a conversation's validators with one query.
+
+    Returns:
+        (etag, last modified as a Unix timestamp, status)
+
+    Raises:
+        Http404: If the conversation does not exist
+    """
+    last_message = Message.objects.filter(conversation=OuterRef('pk')).order_by('-timestamp').values('timestamp')[:1]
+    row = get_object_or_404(
+        queryset.values('id', 'version', 'updated_at', 'status').annotate(last_message=Subquery(last_message)),
+        pk=pk
+    )
+    etag = make_etag('conversation', row['id'], row['version'], row['updated_at'])
+    last_modified = max(filter(None, [row['updated_at'], row['last_message']]))
+    return etag, int(last_modified.timestamp()), row['status']
+
+
+def list_validators(queryset, params, page_size: int):
+    """
+    Compute the ETag of a conversation list page with one query.
+
+    Args:
+        queryset: The filtered conversations
+        params: The request's query parameters
+        page_size: Conversations per keyset page
+
+    Returns:
+        (etag, number of conversations in `queryset`, or None on cursor pages)
+
+    Raises:
+        InvalidCursor: If ?cursor= cannot be decoded
+    """
+    key = ['conversations', sorted(params.lists())]
+    if params.get('search'):
+        state = queryset.order_by().aggregate(count=Count('id'), updated=Max('updated_at'), versions=Sum('version'))
+        return make_etag(*key, state['count'], state['updated'], state['versions']), state['count']
+
+    cursor = params.get('cursor')
+    rows = queryset.values('id', 'version', 'updated_at', 'start_timestamp')
+    if not cursor:
+        # Counted over all the rows, before the page's LIMIT
+        rows = rows.annotate(total=Window(Count('id')))
+    rows, next_cursor = keyset_page(rows, 'start_timestamp', page_size, cursor)
+    total = None if cursor else (rows[0]['total'] if rows else 0)
+    etag = make_etag(*key, [(row['id'], row['version'], row['updated_at']) for row in rows], next_cursor, total)
+    return etag, total
+
+
+def not_modified(request, etag, last_modified=None):
+    """
+    A 304 response if the request's validators match, otherwise None.
+
+    If-None-Match takes precedence over If-Modified-Since.
+    """
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        return None
+    return set_validators(response, etag, last_modified)
+
+
+def set_validators(response, etag, last_modified=None):
+    """Add the ETag, Last-Modified and revalidation headers to a response."""
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def cached_detail(etag, url, build):
+    """
+    The serialized detail of an ended conversation, from the cache if present.
+
+    Args:
+        etag: The conversation's ETag, which changes with its content
+        url: Absolute request URL (the payload holds absolute links)
+        build: Callable returning the payload on a miss
+    """
+    timeout = settings.CONVERSATION_CACHE_TIMEOUT
+    if not timeout:
+        return build()
+    key = 'conversation-detail:' + hashlib.md5(f'{etag}:{url}'.encode('utf-8')).hexdigest()
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, timeout)
+    return data
@@ -0,0 +1,228 @@
+"""
+Chat context window management.
+
+Builds the message list sent to the AI provider on each chat turn under a
+token budget (settings.AI_CONTEXT_TOKEN_BUDGET) instead of replaying the whole
+conversation history:
+
+- The system prompt and the most recent turns are always sent verbatim.
+- With the 'summary' strategy, older turns that no longer fit are folded into
+  Conversation.context_summary, which is sent in their place. They are
+  folded oldest first, in batches that fit the budget, at most
+  AI_CONTEXT_FOLD_STEPS batches per turn; until the summary has caught up
+  (e.g. on a long conversation from before summaries existed), the turns
+  between it and the newest ones are dropped.
+- With the 'truncate' strategy, older turns that no longer fit are dropped.
+
+Only the messages that end up in the prompt (plus, when folding, the
+batches being folded) are read from the database.
+"""
+from typing import Dict, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+
+
+SYSTEM_PROMPT = 'You are a helpful AI assistant.'
+
+# Rough per-message cost of role markers and separators in chat formats
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# History is read newest first in batches of this size until the budget is full
+FETCH_BATCH_SIZE = 20
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in text (about 4 characters per token)."""
+    return (len(text or '') + 3) // 4
+
+
+def message_tokens(content: str) -> int:
+    """Estimate the prompt cost of one chat message."""
+    return estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def get_token_budget(provider: str, model: Optional[str] = None) -> int:
+    """Return the prompt token budget for a model, falling back to its provider."""
+    budgets = settings.AI_CONTEXT_TOKEN_BUDGET
+    for key in (model, provider):
+        if key in budgets:
+            return budgets[key]
+    return budgets['default']
+
+
+def build_chat_messages(conversation, ai_service) -> List[Dict[str, str]]:
+    """
+    Build the provider message list for the next AI reply in a conversation.
+
+    Args:
+        conversation: Conversation whose latest message is the new user message
+        ai_service: AIService used for the budget lookup and for folding turns
+
+    Returns:
+        List of message dicts with 'role' and 'content'
+    """
+    recent, kept, fold_budget = _read_context(conversation, ai_service)
+    caught_up = False
+    if kept is not None:
+        for _ in range(settings.AI_CONTEXT_FOLD_STEPS):
+            batch, more = _fold_batch(conversation, kept[-1], fold_budget)
+            summary = ai_service.update_summary(conversation.context_summary, _fold_messages(batch, fold_budget))
+            if summary is None:
+                break
+            _store_summary(conversation, summary, batch)
+            if not more:
+                caught_up = True
+                break
+    return _chat_messages(conversation, kept if caught_up else _unsummarized(conversation, recent))
+
+
+async def abuild_chat_messages(conversation, ai_service) -> List[Dict[str, str]]:
+    """
+    Async version of build_chat_messages().
+
+    Only the database reads and writes run in the thread-sensitive sync
+    thread; summary updates await the provider's async client, so a slow
+    fold does not hold up every other async request.
+    """
+    recent, kept, fold_budget = await sync_to_async(_read_context)(conversation, ai_service)
+    caught_up = False
+    if kept is not None:
+        for _ in range(settings.AI_CONTEXT_FOLD_STEPS):
+            batch, more = await sync_to_async(_fold_batch)(conversation, kept[-1], fold_budget)
+            summary = await ai_service.aupdate_summary(
+                conversation.context_summary, _fold_messages(batch, fold_budget)
+            )
+            if summary is None:
+                break
+            await sync_to_async(_store_summary)(conversation, summary, batch)
+            if not more:
+                caught_up = True
+                break
+    return _chat_messages(conversation, kept if caught_up else _unsummarized(conversation, recent))
+
+
+def _read_context(conversation, ai_service):
+    """
+    Read the newest turns that fit the token budget.
+
+    Returns:
+        (messages that fit, newest first; the newest of them to keep verbatim
+        once the older turns are folded, or None if nothing needs folding;
+        token budget of one fold)
+    """
+    strategy = settings.AI_CONTEXT_STRATEGY
+    summary = conversation.context_summary if strategy == 'summary' else None
+    budget = get_token_budget(ai_service.provider, ai_service.model)
+    history_budget = budget - message_tokens(_system_content(summary))
+
+    history = conversation.messages.order_by('-timestamp', '-id').only(
+        'id', 'sender', 'content', 'timestamp'
+    )
+    if summary is not None and conversation.context_summary_until:
+        history = history.filter(timestamp__gt=conversation.context_summary_until)
+
+    recent, overflow = _take_within(history, history_budget)
+    if not overflow or strategy != 'summary':
+        return recent, None, history_budget
+    return recent, _keep_newest(recent, history_budget), history_budget
+
+
+def _chat_messages(conversation, messages) -> List[Dict[str, str]]:
+    """The system prompt with the rolling summary, then `messages` (newest first) oldest first."""
+    summary = conversation.context_summary if settings.AI_CONTEXT_STRATEGY == 'summary' else None
+    ai_messages = [{'role': 'system', 'content': _system_content(summary)}]
+    for msg in reversed(messages):
+        role = 'user' if msg.sender == 'user' else 'assistant'
+        ai_messages.append({'role': role, 'content': msg.content})
+    return ai_messages
+
+
+def _unsummarized(conversation, messages):
+    """Drop the messages that a partial fold has already put into the rolling summary."""
+    until = conversation.context_summary_until
+    if until is None or settings.AI_CONTEXT_STRATEGY != 'summary':
+        return messages
+    return [msg for msg in messages if msg.timestamp > until]
+
+
+def _system_content(summary: Optional[str]) -> str:
+    """System prompt, followed by the rolling summary of earlier turns if any."""
+    if not summary:
+        return SYSTEM_PROMPT
+    return f"{SYSTEM_PROMPT}\n\nSummary of the earlier conversation:\n{summary}"
+
+
+def _take_within(messages, budget: int):
+    """
+    Read messages in the queryset's order until the token budget is used up.
+
+    Returns:
+        (messages read, whether more were left out). The first message is
+        always included, even if it exceeds the budget.
+    """
+    taken = []
+    used = 0
+    offset = 0
+    while True:
+        batch = list(messages[offset:offset + FETCH_BATCH_SIZE])
+        for msg in batch:
+            cost = message_tokens(msg.content)
+            if taken and used + cost > budget:
+                return taken, True
+            taken.append(msg)
+            used += cost
+        if len(batch) < FETCH_BATCH_SIZE:
+            return taken, False
+        offset += FETCH_BATCH_SIZE
+
+
+def _keep_newest(recent, history_budget: int):
+    """
+    The newest messages within AI_CONTEXT_KEEP_RATIO of the budget, which stay
+    verbatim while everything older is folded into the rolling summary.
+
+    Keeping only part of the budget verbatim leaves headroom, so the summary
+    is rebuilt once per half window of new messages rather than on every turn.
+    """
+    keep_budget = history_budget * settings.AI_CONTEXT_KEEP_RATIO
+    kept = []
+    used = 0
+    for msg in recent:
+        cost = message_tokens(msg.content)
+        if kept and used + cost > keep_budget:
+            break
+        kept.append(msg)
+        used += cost
+    return kept
+
+
+def _fold_batch(conversation, oldest_kept, budget: int):
+    """
+    The oldest messages not yet summarized and older than `oldest_kept`, up
+    to `budget` tokens, so one update_summary call stays within the model's
+    context however long the unsummarized history is.
+
+    Returns:
+        (messages oldest first, whether older unsummarized messages remain after them)
+    """
+    older = conversation.messages.filter(
+        Q(timestamp__lt=oldest_kept.timestamp) |
+        Q(timestamp=oldest_kept.timestamp, id__lt=oldest_kept.id)
+    )
+    if conversation.context_summary_until:
+        older = older.filter(timestamp__gt=conversation.context_summary_until)
+    return _take_within(older.order_by('timestamp', 'id').only('id', 'sender', 'content', 'timestamp'), budget)
+
+
+def _fold_messages(batch, budget: int) -> List[Dict[str, str]]:
+    """Messages for update_summary(); a single message over the budget is cut to it."""
+    return [{'sender': msg.sender, 'content': msg.content[:budget * 4]} for msg in batch]
+
+
+def _store_summary(conversation, summary: str, batch) -> None:
+    """Record that the rolling summary now covers the folded batch."""
+    conversation.context_summary = summary
+    conversation.context_summary_until = batch[-1].timestamp
+    conversation.save(update_fields=['context_summary', 'context_summary_until'])
@@ -0,0 +1,197 @@
+"""
+Text embeddings for conversation search.
+
+The embedder is selected with settings.AI_EMBEDDER, as `name` or
+`name:model`:
+
+- 'hashing': local feature-hashing embedder (word unigrams and bigrams with
+  sublinear term frequency). Needs no model download or network access.
+- 'openai': OpenAI embeddings API ('openai:<model>' picks the model).
+
+The same string is an embedder's `version`, recorded with every stored
+embedding (see the embed_conversations command).
+
+All embedders return L2-normalized float32 vectors, so cosine similarity is a
+plain dot product.
+"""
+import math
+import re
+import zlib
+from collections import Counter
+from typing import List
+
+import numpy as np
+from django.conf import settings
+
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Words too common to say anything about a conversation's content
+STOP_WORDS = frozenset('''
+    a an and are as at be but by can could do does for from had has have how i
+    if in is it its me my of on or our so that the their them then there these
+    they this to was we were what when where which who will with would you your
+'''.split())
+
+# Upper bound on the text embedded per conversation
+MAX_EMBEDDING_CHARS = 20000
+
+
+class Embedder:
+    """Base class for embedders. Subclasses set name and dim and implement embed()."""
+
+    name = ''
+    dim = 0
+
+    @property
+    def version(self) -> str:
+        """Identifies the vectors this embedder produces (see make_embedder())."""
+        return self.name
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed a batch of texts.
+
+        Returns:
+            float32 array of shape (len(texts), dim) with L2-normalized rows
+        """
+        raise NotImplementedError
+
+    def embed_one(self, text: str) -> np.ndarray:
+        """Embed a single text."""
+        return self.embed([text])[0]
+
+
+class HashingEmbedder(Embedder):
+    """
+    Offline embedder based on signed feature hashing.
+
+    Each word (except stop words) and word bigram is hashed to one of `dim` buckets with a sign
+    taken from the hash, weighted by 1 + log(term frequency). Texts that
+    share words get a positive cosine similarity; unrelated texts are close
+    to orthogonal.
+    """
+
+    name = 'hashing'
+
+    def __init__(self, dim: int = 128):
+        self.dim = dim
+
+    def _features(self, text: str) -> Counter:
+        words = [word for word in TOKEN_RE.findall(text.lower()) if word not in STOP_WORDS]
+        features = Counter(words)
+        features.update(f'{a} {b}' for a, b in zip(words, words[1:]))
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            vector = vectors[row]
+            for feature, count in self._features(text).items():
+                h = zlib.crc32(feature.encode('utf-8'))
+                sign = 1.0 if h & 0x80000000 else -1.0
+                vector[h % self.dim] += sign * (1.0 + math.log(count))
+        return _normalize(vectors)
+
+
+class OpenAIEmbedder(Embedder):
+    """Embedder backed by the OpenAI embeddings API."""
+
+    name = 'openai'
+    dim = 1536
+
+    def __init__(self, model: str = 'text-embedding-ada-002'):
+        try:
+            import openai
+        except ImportError:
+            raise ImportError("OpenAI library not installed. Run: pip install openai")
+        openai.api_key = settings.OPENAI_API_KEY
+        self.client = openai
+        self.model = model
+
+    @property
+    def version(self) -> str:
+        return f'{self.name}:{self.model}'
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        response = self.client.Embedding.create(model=self.model, input=texts)
+        rows = sorted(response['data'], key=lambda item: item['index'])
+        return _normalize(np.array([row['embedding'] for row in rows], dtype=np.float32))
+
+
+EMBEDDERS = {
+    'hashing': HashingEmbedder,
+    'openai': OpenAIEmbedder,
+}
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows in place; all-zero rows are left as zeros."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+def conversation_text(conversation, messages=None) -> str:
+    """
+    Text that represents a conversation for embedding.
+
+    Args:
+        conversation: Conversation instance
+        messages: Message contents to include (default: read from the database)
+    """
+    if messages is None:
+        messages = conversation.messages.order_by('timestamp', 'id').values_list('content', flat=True)
+    parts = [
+        conversation.title or '',
+        conversation.summary or '',
+        ' '.join(map(str, conversation.topics or [])),
+        ' '.join(map(str, conversation.key_points or [])),
+        *messages,
+    ]
+    return '\n'.join(part for part in parts if part)[:MAX_EMBEDDING_CHARS]
+
+
+# Singleton instance
+_embedder = None
+
+
+def make_embedder(version: str) -> Embedder:
+    """
+    Create an embedder from a version string: an EMBEDDERS name, optionally
+    followed by ':' and a model name.
+
+    Raises:
+        ValueError: If the name is unknown or the embedder takes no model
+    """
+    name, _, model = version.partition(':')
+    if name not in EMBEDDERS:
+        raise ValueError(f"Unknown embedder '{name}' (choose from {', '.join(EMBEDDERS)})")
+    try:
+        return EMBEDDERS[name](model=model) if model else EMBEDDERS[name]()
+    except TypeError:
+        raise ValueError(f"Embedder '{name}' does not take a model")
+
+
+def get_embedder() -> Embedder:
+    """Get or create the configured embedder."""
+    global _embedder
+    if _embedder is None:
+        _embedder = make_embedder(settings.AI_EMBEDDER)
+    return _embedder
+
+
+# Embedders created by embed_batch(), per process
+_batch_embedders = {}
+
+
+def embed_batch(version: str, texts: List[str]) -> List[List[float]]:
+    """
+    Embed texts with the embedder of the given version, returning plain lists.
+
+    Module-level so it can run in process pool workers, each of which creates
+    its embedder once.
+    """
+    if version not in _batch_embedders:
+        _batch_embedders[version] = make_embedder(version)
+    return _batch_embedders[version].embed(texts).tolist()
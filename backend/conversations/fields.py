@@ -0,0 +1,102 @@
+"""
+Custom model fields for the conversations app.
+"""
+import struct
+from base64 import b64encode
+
+import numpy as np
+from django.conf import settings
+from django.db import models
+
+
+# First byte of an encoded embedding
+EMBEDDING_FORMATS = {'float32': 1, 'float16': 2, 'int8': 3}
+_FORMAT_NAMES = {code: name for name, code in EMBEDDING_FORMATS.items()}
+
+# The format byte is padded to 4 bytes so float32 data stays aligned
+HEADER = struct.Struct('<B3x')
+INT8_SCALE = struct.Struct('<f')
+
+
+def encode_embedding(vector, dtype: str = 'float32') -> bytes:
+    """
+    Encode a vector as a format byte (padded to 4) followed by its values.
+
+    - 'float32': 4 bytes per value, exact
+    - 'float16': 2 bytes per value
+    - 'int8': 1 byte per value, plus a float32 scale (symmetric quantization:
+      value = code * scale)
+    """
+    if dtype not in EMBEDDING_FORMATS:
+        raise ValueError(f"Unknown embedding dtype '{dtype}' (choose from {', '.join(EMBEDDING_FORMATS)})")
+    vector = np.asarray(vector, dtype=np.float32)
+    header = HEADER.pack(EMBEDDING_FORMATS[dtype])
+    if dtype == 'int8':
+        peak = float(np.abs(vector).max()) if vector.size else 0.0
+        scale = peak / 127 if peak else 1.0
+        codes = np.round(vector / scale).astype(np.int8)
+        return header + INT8_SCALE.pack(scale) + codes.tobytes()
+    return header + vector.astype(f'<{"f4" if dtype == "float32" else "f2"}').tobytes()
+
+
+def decode_embedding(data) -> np.ndarray:
+    """
+    Decode an encoded embedding into a float32 array.
+
+    float32 data is not copied: the array is a read-only view of `data`.
+    float16 and int8 data are converted into a new array.
+    """
+    code, = HEADER.unpack_from(data)
+    dtype = _FORMAT_NAMES.get(code)
+    if dtype == 'float32':
+        return np.frombuffer(data, dtype='<f4', offset=HEADER.size)
+    if dtype == 'float16':
+        return np.frombuffer(data, dtype='<f2', offset=HEADER.size).astype(np.float32)
+    if dtype == 'int8':
+        scale, = INT8_SCALE.unpack_from(data, HEADER.size)
+        codes = np.frombuffer(data, dtype=np.int8, offset=HEADER.size + INT8_SCALE.size)
+        return codes.astype(np.float32) * np.float32(scale)
+    raise ValueError(f'Unknown embedding format {code}')
+
+
+class EmbeddingField(models.BinaryField):
+    """
+    A vector stored as compact binary (see encode_embedding()).
+
+    Values are read as float32 NumPy arrays and can be assigned as arrays or
+    lists. They are written in `dtype`, or settings.AI_EMBEDDING_DTYPE if
+    None. Every stored value records its own format, so rows written with
+    different dtypes can be read together.
+    """
+
+    def __init__(self, *args, dtype=None, **kwargs):
+        self.dtype = dtype
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.dtype is not None:
+            kwargs['dtype'] = self.dtype
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else decode_embedding(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, np.ndarray):
+            return value
+        if isinstance(value, str):
+            # Serialized with value_to_string()
+            value = super().to_python(value)
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return decode_embedding(value)
+        return np.asarray(value, dtype=np.float32)
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, (bytes, bytearray, memoryview)):
+            return value
+        return encode_embedding(value, self.dtype or settings.AI_EMBEDDING_DTYPE)
+
+    def value_to_string(self, obj):
+        value = self.get_prep_value(self.value_from_object(obj))
+        return None if value is None else b64encode(value).decode('ascii')
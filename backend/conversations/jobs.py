@@ -0,0 +1,179 @@
+"""
+Database-backed job queue for conversation analysis.
+
+When settings.ANALYSIS_QUEUE_ENABLED is on, end_conversation marks the
+conversation as 'ending', enqueues an AnalysisJob and returns 202 right away.
+`python manage.py run_analysis_worker` processes the jobs, with no external
+broker:
+
+- Claiming uses SELECT ... FOR UPDATE SKIP LOCKED, so concurrent workers never
+  pick the same job.
+- A claimed job is leased to one worker until lease_expires_at. If the worker
+  crashes, the job is claimed again after the lease expires.
+- Every claim increments `attempts`, and results are only committed while the
+  worker still holds that exact lease (same locked_by and attempts). A worker
+  whose lease expired cannot overwrite the work of the worker that took over.
+- Failed attempts are retried with exponential backoff up to max_attempts.
+  After that the conversation goes back to 'active' so the user can retry.
+"""
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .ai_service import get_ai_service
+from .analysis import analysis_messages, apply_analysis, log_analysis
+from .models import AnalysisJob
+
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_analysis(conversation) -> AnalysisJob:
+    """
+    Mark a conversation as ending and queue its analysis.
+
+    Returns the conversation's pending job if one already exists, so repeated
+    end requests do not queue the analysis twice.
+    """
+    with transaction.atomic():
+        pending = conversation.analysis_jobs.filter(status__in=['queued', 'running']).first()
+        if pending:
+            return pending
+
+        conversation.status = 'ending'
+        conversation.end_timestamp = timezone.now()
+        conversation.save(update_fields=['status', 'end_timestamp', 'updated_at'])
+        return AnalysisJob.objects.create(
+            conversation=conversation,
+            max_attempts=settings.ANALYSIS_JOB_MAX_ATTEMPTS
+        )
+
+
+def claim_job(worker_id: str, lease_seconds: float = None):
+    """
+    Claim the next runnable job for a worker.
+
+    Runnable jobs are queued jobs whose backoff has passed and running jobs
+    whose lease has expired (their worker is presumed dead).
+
+    Returns:
+        The claimed AnalysisJob, or None if there is nothing to do
+    """
+    lease_seconds = settings.ANALYSIS_JOB_LEASE_SECONDS if lease_seconds is None else lease_seconds
+    now = timezone.now()
+
+    with transaction.atomic():
+        job = (
+            AnalysisJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(
+                Q(status='queued', run_after__lte=now) |
+                Q(status='running', lease_expires_at__lt=now)
+            )
+            .order_by('run_after', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+
+        job.status = 'running'
+        job.attempts += 1
+        job.locked_by = worker_id
+        job.lease_expires_at = now + timedelta(seconds=lease_seconds)
+        job.save(update_fields=['status', 'attempts', 'locked_by', 'lease_expires_at', 'updated_at'])
+        return job
+
+
+def run_job(job: AnalysisJob, worker_id: str) -> bool:
+    """
+    Run a claimed job and record the outcome.
+
+    Returns:
+        True if the outcome was recorded, False if the lease had already been
+        lost to another worker (the result is then discarded)
+    """
+    if job.attempts > job.max_attempts:
+        # Reclaimed after a crash on its final attempt
+        return _fail(job, worker_id, job.last_error or 'Worker lease expired')
+
+    conversation = job.conversation
+    try:
+        messages = analysis_messages(conversation)
+        analysis = get_ai_service().analyze_conversation(messages)
+        log_analysis(conversation.id, analysis)
+    except Exception as e:
+        logger.exception('Analysis job %s failed', job.id)
+        return _retry_or_fail(job, worker_id, str(e))
+
+    if not analysis['results']:
+        return _retry_or_fail(job, worker_id, '; '.join(
+            f'{name}: {error}' for name, error in analysis['errors'].items()
+        ))
+
+    with transaction.atomic():
+        if not _lock_if_owned(job, worker_id):
+            return False
+        apply_analysis(conversation, analysis)
+        job.status = 'succeeded'
+        job.result = {'timings': analysis['timings'], 'errors': analysis['errors']}
+        job.finished_at = timezone.now()
+        job.lease_expires_at = None
+        job.save(update_fields=['status', 'result', 'finished_at', 'lease_expires_at', 'updated_at'])
+    return True
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter, in seconds, after the given attempt number."""
+    base = settings.ANALYSIS_JOB_RETRY_BACKOFF * (2 ** (attempts - 1))
+    return min(base, 3600) * random.uniform(1.0, 1.25)
+
+
+def _lock_if_owned(job: AnalysisJob, worker_id: str) -> bool:
+    """Lock the job row inside the current transaction if this worker still holds its lease."""
+    return AnalysisJob.objects.select_for_update().filter(
+        pk=job.pk, status='running', locked_by=worker_id, attempts=job.attempts
+    ).exists()
+
+
+def _retry_or_fail(job: AnalysisJob, worker_id: str, error: str) -> bool:
+    """Schedule another attempt after a backoff, or give up after max_attempts."""
+    if job.attempts >= job.max_attempts:
+        return _fail(job, worker_id, error)
+
+    with transaction.atomic():
+        if not _lock_if_owned(job, worker_id):
+            return False
+        job.status = 'queued'
+        job.last_error = error
+        job.run_after = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+        job.locked_by = ''
+        job.lease_expires_at = None
+        job.save(update_fields=['status', 'last_error', 'run_after', 'locked_by', 'lease_expires_at', 'updated_at'])
+    logger.warning('Analysis job %s attempt %s failed, retrying at %s: %s',
+                   job.id, job.attempts, job.run_after, error)
+    return True
+
+
+def _fail(job: AnalysisJob, worker_id: str, error: str) -> bool:
+    """Mark a job as failed and reopen its conversation so it can be ended again."""
+    with transaction.atomic():
+        if not _lock_if_owned(job, worker_id):
+            return False
+        job.status = 'failed'
+        job.last_error = error
+        job.finished_at = timezone.now()
+        job.lease_expires_at = None
+        job.save(update_fields=['status', 'last_error', 'finished_at', 'lease_expires_at', 'updated_at'])
+
+        conversation = job.conversation
+        if conversation.status == 'ending':
+            conversation.status = 'active'
+            conversation.end_timestamp = None
+            conversation.save(update_fields=['status', 'end_timestamp', 'updated_at'])
+    logger.error('Analysis job %s failed after %s attempts: %s', job.id, job.attempts, error)
+    return True
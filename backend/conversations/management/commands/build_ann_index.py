@@ -0,0 +1,47 @@
+"""
+Build the approximate nearest neighbour index used when AI_VECTOR_INDEX = 'ivfpq'.
+
+Usage:
+    python manage.py build_ann_index             # train the quantizers and index every embedding
+    python manage.py build_ann_index --compact   # re-encode with the current quantizers
+
+Compacting folds in conversations ended since the last build and drops
+deleted ones without retraining; rebuild from scratch after the corpus has
+grown a lot or after changing AI_EMBEDDER. Running processes switch to the
+new index on their next sync (AI_VECTOR_INDEX_REFRESH).
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from conversations.ann_index import build_ann_index
+
+
+class Command(BaseCommand):
+    help = 'Build or compact the IVF-PQ conversation index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compact', action='store_true',
+                            help='Reuse the quantizers of the current index instead of retraining')
+        parser.add_argument('--nlist', type=int, default=None,
+                            help='Number of inverted lists (default: 4 * sqrt(conversations))')
+        parser.add_argument('--m', type=int, default=None,
+                            help='Bytes per compressed vector; must divide the dimension (default: dim / 8)')
+        parser.add_argument('--train-size', type=int, default=100000,
+                            help='Embeddings sampled to train the quantizers')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            index = build_ann_index(
+                compact=options['compact'], nlist=options['nlist'], m=options['m'],
+                train_size=options['train_size']
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {len(index)} conversations in {len(index.centroids)} lists '
+            f'({index.codebooks.shape[0]} bytes per code) in {time.perf_counter() - started:.1f}s '
+            f'to {settings.AI_ANN_INDEX_DIR}'
+        ))
@@ -0,0 +1,194 @@
+"""
+Compute embeddings for ended conversations in bulk.
+
+Usage:
+    python manage.py embed_conversations          # only missing embeddings
+    python manage.py embed_conversations --all    # re-embed everything (e.g. after changing AI_EMBEDDER)
+
+    # Re-embed with another embedder in the background while search keeps
+    # serving the current vectors, then switch over
+    python manage.py embed_conversations --model-version openai:text-embedding-3-small
+    python manage.py embed_conversations --activate openai:text-embedding-3-small
+
+Conversations are streamed from the database in id order and embedded in
+batches across a process pool, together with their message windows
+(ConversationChunk); results are written back with bulk_update.
+Progress is checkpointed after every batch, so an interrupted run resumes
+where it stopped (--restart ignores the checkpoint).
+
+--model-version stores the new vectors in next_embedding, of conversations
+and chunks alike. --activate copies them into embedding in one transaction;
+set AI_EMBEDDER to the same version when deploying the switch, since queries
+must be embedded the same way (the indexes only load embeddings of the
+configured version).
+"""
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Prefetch
+from django.utils import timezone
+
+from conversations.embeddings import conversation_text, embed_batch, get_embedder, make_embedder
+from conversations.models import Conversation, ConversationChunk, Message
+
+
+class Command(BaseCommand):
+    help = 'Compute embeddings for ended conversations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Re-embed conversations that already have an embedding')
+        parser.add_argument('--model-version', default=None,
+                            help='Embed into next_embedding with this embedder (name or name:model) '
+                                 'instead of replacing the served embeddings')
+        parser.add_argument('--activate', metavar='MODEL_VERSION', default=None,
+                            help='Promote next_embedding vectors of this version to the served embeddings')
+        parser.add_argument('--batch-size', type=int, default=64,
+                            help='Conversations per embedding batch')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Conversations fetched from the database per query')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Embedding processes (1 embeds in this process)')
+        parser.add_argument('--checkpoint', default=str(settings.BASE_DIR / '.embed_checkpoint.json'),
+                            help='File recording progress for resuming')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore the checkpoint and start from the first conversation')
+
+    def handle(self, *args, **options):
+        if options['activate']:
+            return self.activate(options['activate'])
+
+        staged = options['model_version'] is not None
+        version = options['model_version'] or get_embedder().version
+        try:
+            make_embedder(version)
+        except (ValueError, ImportError) as e:
+            raise CommandError(str(e))
+
+        conversations = Conversation.objects.filter(status='ended')
+        if staged:
+            conversations = conversations.exclude(next_embedding_model=version, next_embedding__isnull=False)
+        elif not options['all']:
+            conversations = conversations.filter(embedding__isnull=True)
+
+        # Resume after the last conversation written by an interrupted run of the same job
+        job = f"{'next' if staged else 'all' if options['all'] else 'missing'}:{version}"
+        checkpoint = options['checkpoint']
+        after = 0 if options['restart'] else self.read_checkpoint(checkpoint, job)
+        if after:
+            self.stdout.write(f'Resuming after conversation {after}')
+
+        rows = conversations.filter(id__gt=after).order_by('id').only(
+            'id', 'title', 'summary', 'topics', 'key_points'
+        ).prefetch_related(
+            Prefetch('messages', queryset=Message.objects.order_by('timestamp', 'id').only('conversation_id', 'content')),
+            Prefetch('chunks', queryset=ConversationChunk.objects.order_by('position').only('conversation_id', 'text'))
+        ).iterator(chunk_size=options['chunk_size'])
+
+        started = time.perf_counter()
+        embedded = 0
+        pool = ProcessPoolExecutor(options['workers'], initializer=django.setup) if options['workers'] > 1 else None
+        # Batches in flight, written back in submission (id) order so the
+        # checkpoint only ever moves past completed work
+        pending = deque()
+        try:
+            for batch in self.batches(rows, options['batch_size']):
+                # Each conversation's text, then the text of every chunk of the batch
+                texts = [conversation_text(c, [m.content for m in c.messages.all()]) for c in batch]
+                texts += [chunk.text for c in batch for chunk in c.chunks.all()]
+                if pool is None:
+                    self.save(batch, embed_batch(version, texts), version, staged)
+                    embedded += len(batch)
+                    self.write_checkpoint(checkpoint, job, batch[-1].id)
+                    continue
+                pending.append((batch, pool.submit(embed_batch, version, texts)))
+                while len(pending) > options['workers'] * 2:
+                    embedded += self.complete(pending.popleft(), version, staged, checkpoint, job)
+            while pending:
+                embedded += self.complete(pending.popleft(), version, staged, checkpoint, job)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        elapsed = time.perf_counter() - started
+        target = 'next_embedding' if staged else 'embedding'
+        self.stdout.write(self.style.SUCCESS(
+            f'Embedded {embedded} conversations with {version} into {target} in {elapsed:.1f}s '
+            f'({embedded / elapsed if elapsed else 0:.0f}/s)'
+        ))
+
+    def batches(self, rows, size):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def complete(self, item, version, staged, checkpoint, job):
+        """Write back one finished batch and advance the checkpoint past it."""
+        batch, future = item
+        self.save(batch, future.result(), version, staged)
+        self.write_checkpoint(checkpoint, job, batch[-1].id)
+        return len(batch)
+
+    def save(self, batch, vectors, version, staged):
+        """Store the vectors of a batch's conversations and, after them, of its chunks."""
+        chunks = [chunk for conversation in batch for chunk in conversation.chunks.all()]
+        prefix = 'next_' if staged else ''
+        fields = [f'{prefix}embedding', f'{prefix}embedding_model']
+        for row, vector in zip(batch + chunks, vectors):
+            setattr(row, f'{prefix}embedding', vector)
+            setattr(row, f'{prefix}embedding_model', version)
+        if not staged:
+            # Bump updated_at so running processes pick the embeddings up on their next sync
+            now = timezone.now()
+            for conversation in batch:
+                conversation.updated_at = now
+        with transaction.atomic():
+            Conversation.objects.bulk_update(batch, fields + ([] if staged else ['updated_at']))
+            ConversationChunk.objects.bulk_update(chunks, fields)
+
+    def activate(self, version):
+        with transaction.atomic():
+            promoted = Conversation.objects.filter(next_embedding_model=version, next_embedding__isnull=False).update(
+                embedding=F('next_embedding'), embedding_model=version,
+                next_embedding=None, next_embedding_model='', updated_at=timezone.now()
+            )
+            ConversationChunk.objects.filter(next_embedding_model=version, next_embedding__isnull=False).update(
+                embedding=F('next_embedding'), embedding_model=version,
+                next_embedding=None, next_embedding_model=''
+            )
+        remaining = Conversation.objects.filter(status='ended').exclude(embedding_model=version).count()
+        remaining_chunks = ConversationChunk.objects.filter(conversation__status='ended').exclude(
+            embedding_model=version
+        ).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Promoted {promoted} {version} embeddings ({remaining} ended conversations and '
+            f'{remaining_chunks} chunks still use another version)'
+        ))
+
+    def read_checkpoint(self, path, job):
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        return state['after'] if state.get('job') == job else 0
+
+    def write_checkpoint(self, path, job, after):
+        # Write then rename, so an interruption never leaves a partial file
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump({'job': job, 'after': after}, f)
+        os.replace(f'{path}.tmp', path)
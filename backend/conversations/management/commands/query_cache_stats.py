@@ -0,0 +1,31 @@
+"""
+Report the hit rate of the query_conversations answer cache.
+
+Usage:
+    python manage.py query_cache_stats           # print hits, misses and hit rate
+    python manage.py query_cache_stats --reset   # print, then zero the counters
+
+Counters are shared by every worker using the same cache backend.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from conversations.answer_cache import cache_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Report the query_conversations answer cache hit rate'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the hit and miss counters after reporting')
+
+    def handle(self, *args, **options):
+        stats = cache_stats()
+        self.stdout.write(
+            f"hits: {stats['hits']}  misses: {stats['misses']}  hit rate: {stats['hit_rate']:.1%}\n"
+            f"entries: {stats['entries']} of {settings.AI_QUERY_CACHE_SIZE}  "
+            f"corpus version: {stats['corpus_version']}"
+        )
+        if options['reset']:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
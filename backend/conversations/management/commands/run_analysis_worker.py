@@ -0,0 +1,80 @@
+"""
+Run the background worker that processes queued conversation analyses.
+
+Usage:
+    python manage.py run_analysis_worker --concurrency 4
+
+Run as many worker processes as needed; jobs are claimed with
+SELECT ... FOR UPDATE SKIP LOCKED, so workers never share a job.
+"""
+import os
+import signal
+import socket
+import threading
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from conversations.jobs import claim_job, run_job
+
+
+class Command(BaseCommand):
+    help = 'Process queued conversation analysis jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Number of jobs to run in parallel (threads)')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait between polls when the queue is empty')
+        parser.add_argument('--lease-seconds', type=float, default=None,
+                            help='Lease duration for claimed jobs (default: ANALYSIS_JOB_LEASE_SECONDS)')
+        parser.add_argument('--once', action='store_true',
+                            help='Process every runnable job, then exit')
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self._request_stop)
+
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+        threads = [
+            threading.Thread(
+                target=self._work,
+                args=(f'{prefix}:{n}:{uuid.uuid4().hex[:8]}', options),
+                name=f'analysis-worker-{n}'
+            )
+            for n in range(max(1, options['concurrency']))
+        ]
+        self.stdout.write(f'Starting {len(threads)} analysis worker thread(s)')
+        for thread in threads:
+            thread.start()
+
+        # Join with a timeout so the main thread keeps receiving signals
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=0.5)
+        self.stdout.write('Analysis worker stopped')
+
+    def _request_stop(self, signum, frame):
+        self.stdout.write('Stopping after the current jobs finish...')
+        self.stop.set()
+
+    def _work(self, worker_id, options):
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                job = claim_job(worker_id, options['lease_seconds'])
+                if job is None:
+                    if options['once']:
+                        return
+                    self.stop.wait(options['poll_interval'])
+                    continue
+
+                self.stdout.write(f'[{worker_id}] Running job {job.id} (attempt {job.attempts})')
+                if not run_job(job, worker_id):
+                    self.stderr.write(f'[{worker_id}] Lost the lease on job {job.id}')
+                job.refresh_from_db()
+                self.stdout.write(f'[{worker_id}] Job {job.id} is {job.status}')
+        finally:
+            connections.close_all()
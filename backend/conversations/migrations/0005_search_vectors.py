@@ -0,0 +1,100 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:44
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# search_vector is computed in the database, so it is also current for rows
+# written with bulk_create() or QuerySet.update(). The text search
+# configuration must match SEARCH_CONFIG in conversations/search.py.
+CREATE_TRIGGERS = """
+CREATE FUNCTION conversations_conversation_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+        setweight(jsonb_to_tsvector('english', coalesce(NEW.topics, '[]'::jsonb), '["string"]'), 'B') ||
+        setweight(to_tsvector('english', coalesce(NEW.summary, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER conversations_conversation_search_vector_update
+    BEFORE INSERT OR UPDATE ON conversations_conversation
+    FOR EACH ROW EXECUTE FUNCTION conversations_conversation_search_vector();
+
+CREATE FUNCTION conversations_message_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := to_tsvector('english', coalesce(NEW.content, ''));
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER conversations_message_search_vector_update
+    BEFORE INSERT OR UPDATE OF content ON conversations_message
+    FOR EACH ROW EXECUTE FUNCTION conversations_message_search_vector();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS conversations_conversation_search_vector_update ON conversations_conversation;
+DROP FUNCTION IF EXISTS conversations_conversation_search_vector();
+DROP TRIGGER IF EXISTS conversations_message_search_vector_update ON conversations_message;
+DROP FUNCTION IF EXISTS conversations_message_search_vector();
+"""
+
+BACKFILL_CHUNK_SIZE = 5000
+
+
+def backfill_search_vectors(apps, schema_editor):
+    """
+    Fill search_vector for existing rows, one id range per transaction.
+
+    Touching a row fires its trigger, which computes the vector. Committing
+    chunk by chunk keeps locks and WAL bursts small on large tables.
+    """
+    connection = schema_editor.connection
+    for table, column in (('conversations_conversation', 'title'), ('conversations_message', 'content')):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT min(id), max(id) FROM {table}')
+            low, high = cursor.fetchone()
+        if low is None:
+            continue
+        for start in range(low, high + 1, BACKFILL_CHUNK_SIZE):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {table} SET {column} = {column} WHERE id >= %s AND id < %s',
+                    [start, start + BACKFILL_CHUNK_SIZE]
+                )
+
+
+class Migration(migrations.Migration):
+
+    # Let the backfill commit chunk by chunk instead of in one transaction
+    atomic = False
+
+    dependencies = [
+        ('conversations', '0004_conversation_running_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='conversation_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='message_search_idx'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+        migrations.RunPython(backfill_search_vectors, migrations.RunPython.noop),
+    ]
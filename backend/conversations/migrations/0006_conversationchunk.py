@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0005_search_vectors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('text', models.TextField()),
+                ('message_count', models.PositiveIntegerField()),
+                ('embedding', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='conversations.conversation')),
+            ],
+            options={
+                'ordering': ['conversation', 'position'],
+                'indexes': [models.Index(fields=['created_at'], name='conversatio_created_7000bb_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0006_conversationchunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='embedding_model',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='next_embedding',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='next_embedding_model',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.db import migrations
+
+import conversations.fields
+from conversations.fields import encode_embedding
+
+
+# (model, field) pairs converted from JSON float lists to EmbeddingField
+EMBEDDING_FIELDS = [
+    ('conversation', 'embedding'),
+    ('conversation', 'next_embedding'),
+    ('conversationchunk', 'embedding'),
+]
+
+BATCH_SIZE = 1000
+
+
+def copy_embeddings(apps, source, target, convert):
+    """Copy every non-null `source` value into `target` through `convert`, in batches."""
+    for model_name, field in EMBEDDING_FIELDS:
+        model = apps.get_model('conversations', model_name)
+        rows = model.objects.filter(**{f'{source(field)}__isnull': False}).values_list('id', source(field))
+        batch = []
+        for pk, value in rows.iterator(chunk_size=BATCH_SIZE):
+            batch.append(model(id=pk, **{target(field): convert(value)}))
+            if len(batch) == BATCH_SIZE:
+                model.objects.bulk_update(batch, [target(field)])
+                batch = []
+        model.objects.bulk_update(batch, [target(field)])
+
+
+def to_binary(apps, schema_editor):
+    copy_embeddings(apps, lambda field: field, lambda field: f'{field}_binary',
+                    lambda value: encode_embedding(value, settings.AI_EMBEDDING_DTYPE))
+
+
+def to_json(apps, schema_editor):
+    # Binary values are decoded to arrays by EmbeddingField.from_db_value()
+    copy_embeddings(apps, lambda field: f'{field}_binary', lambda field: field,
+                    lambda value: value.tolist())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0007_conversation_embedding_model'),
+    ]
+
+    operations = [
+        *[
+            migrations.AddField(
+                model_name=model_name,
+                name=f'{field}_binary',
+                field=conversations.fields.EmbeddingField(blank=True, null=True),
+            )
+            for model_name, field in EMBEDDING_FIELDS
+        ],
+        migrations.RunPython(to_binary, to_json),
+        *[
+            migrations.RemoveField(model_name=model_name, name=field)
+            for model_name, field in EMBEDDING_FIELDS
+        ],
+        *[
+            migrations.RenameField(model_name=model_name, old_name=f'{field}_binary', new_name=field)
+            for model_name, field in EMBEDDING_FIELDS
+        ],
+    ]
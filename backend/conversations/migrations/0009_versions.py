@@ -0,0 +1,69 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:19
+
+from django.db import migrations, models
+
+
+# Versions are kept in the database, so they also move for rows written with
+# bulk_create() or QuerySet.update(). A conversation's version goes up by one
+# on every update of a column clients show, and on every message insert or
+# update, which takes the new version as its own. The row lock taken by that
+# UPDATE makes message versions increase in commit order, so a client that has
+# seen version N has seen every message with version <= N.
+CREATE_TRIGGERS = """
+CREATE FUNCTION conversations_conversation_version() RETURNS trigger AS $$
+BEGIN
+    NEW.version := OLD.version + 1;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER conversations_conversation_version_update
+    BEFORE UPDATE OF title, status, start_timestamp, end_timestamp, summary, topics, key_points,
+        sentiment, running_summary, running_topics ON conversations_conversation
+    FOR EACH ROW EXECUTE FUNCTION conversations_conversation_version();
+
+CREATE FUNCTION conversations_message_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE conversations_conversation SET version = version + 1
+        WHERE id = NEW.conversation_id
+        RETURNING version INTO NEW.version;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER conversations_message_version_update
+    BEFORE INSERT OR UPDATE OF content, sender, timestamp ON conversations_message
+    FOR EACH ROW EXECUTE FUNCTION conversations_message_version();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS conversations_conversation_version_update ON conversations_conversation;
+DROP FUNCTION IF EXISTS conversations_conversation_version();
+DROP TRIGGER IF EXISTS conversations_message_version_update ON conversations_message;
+DROP FUNCTION IF EXISTS conversations_message_version();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0008_binary_embeddings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'version'], name='conversatio_convers_cfdb5a_idx'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
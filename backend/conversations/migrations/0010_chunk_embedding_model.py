@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:35
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+import conversations.fields
+from conversations.embeddings import make_embedder
+
+
+def record_embedding_models(apps, schema_editor):
+    """
+    Record the embedder of embeddings stored before versions were: the
+    configured one for conversations, and their conversation's for chunks.
+    """
+    Conversation = apps.get_model('conversations', 'Conversation')
+    ConversationChunk = apps.get_model('conversations', 'ConversationChunk')
+    unrecorded = Conversation.objects.filter(embedding__isnull=False, embedding_model='')
+    if unrecorded.exists():
+        unrecorded.update(embedding_model=make_embedder(settings.AI_EMBEDDER).version)
+    ConversationChunk.objects.filter(embedding__isnull=False).update(embedding_model=Subquery(
+        Conversation.objects.filter(pk=OuterRef('conversation_id')).values('embedding_model')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0009_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationchunk',
+            name='embedding_model',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='conversationchunk',
+            name='next_embedding',
+            field=conversations.fields.EmbeddingField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversationchunk',
+            name='next_embedding_model',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.RunPython(record_embedding_models, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+
+# Only recompute a conversation's search vector when a searched column is
+# written: the version trigger (migration 0009) updates the conversation row
+# on every message insert, which used to re-run to_tsvector each time.
+RESTRICT_TRIGGER = """
+DROP TRIGGER conversations_conversation_search_vector_update ON conversations_conversation;
+CREATE TRIGGER conversations_conversation_search_vector_update
+    BEFORE INSERT OR UPDATE OF title, summary, topics ON conversations_conversation
+    FOR EACH ROW EXECUTE FUNCTION conversations_conversation_search_vector();
+"""
+
+UNRESTRICT_TRIGGER = """
+DROP TRIGGER conversations_conversation_search_vector_update ON conversations_conversation;
+CREATE TRIGGER conversations_conversation_search_vector_update
+    BEFORE INSERT OR UPDATE ON conversations_conversation
+    FOR EACH ROW EXECUTE FUNCTION conversations_conversation_search_vector();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0010_chunk_embedding_model'),
+    ]
+
+    operations = [
+        migrations.RunSQL(RESTRICT_TRIGGER, UNRESTRICT_TRIGGER),
+    ]
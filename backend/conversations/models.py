@@ -1,9 +1,13 @@
 """
 Database models for the Chat Portal application.
 """
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils import timezone
 
+from .fields import EmbeddingField
+
 
 class Conversation(models.Model):
     """
@@ -12,6 +16,7 @@ class Conversation(models.Model):
     """
     STATUS_CHOICES = [
         ('active', 'Active'),
+        ('ending', 'Ending'),  # Ended by the user, analysis still running
         ('ended', 'Ended'),
     ]
     
@@ -26,8 +31,35 @@ class Conversation(models.Model):
     key_points = models.JSONField(default=list, blank=True)  # List of key points/decisions
     sentiment = models.CharField(max_length=50, blank=True, null=True)  # Overall sentiment
     
-    # Embedding for semantic search (stored as JSON array)
-    embedding = models.JSONField(null=True, blank=True)
+    # Rolling summary of older turns that no longer fit in the chat context window
+    # (see context.py); covers all messages up to context_summary_until
+    context_summary = models.TextField(blank=True, null=True)
+    context_summary_until = models.DateTimeField(null=True, blank=True)
+    
+    # Live summary and topics of an active conversation, updated in the
+    # background every AI_RUNNING_SUMMARY_INTERVAL messages (see
+    # running_summary.py); covers all messages up to running_summary_until
+    running_summary = models.TextField(blank=True, null=True)
+    running_topics = models.JSONField(default=list, blank=True)
+    running_summary_until = models.DateTimeField(null=True, blank=True)
+    
+    # Embedding for semantic search (compact binary, see fields.py), and the
+    # version of the embedder that computed it (see embeddings.py)
+    embedding = EmbeddingField(null=True, blank=True)
+    embedding_model = models.CharField(max_length=100, blank=True, default='')
+    
+    # Embedding computed by another embedder version in the background, served
+    # only once promoted (`embed_conversations --activate`)
+    next_embedding = EmbeddingField(null=True, blank=True)
+    next_embedding_model = models.CharField(max_length=100, blank=True, default='')
+    
+    # Full-text search document over title, summary and topics, maintained by
+    # a database trigger (see migration 0005 and search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+    
+    # Incremented by database triggers whenever a field clients show or one
+    # of the messages changes (see migration 0009 and the changes action)
+    version = models.PositiveBigIntegerField(default=0, editable=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -37,6 +69,7 @@ class Conversation(models.Model):
         indexes = [
             models.Index(fields=['-start_timestamp']),
             models.Index(fields=['status']),
+            GinIndex(fields=['search_vector'], name='conversation_search_idx'),
         ]
     
     def __str__(self):
@@ -76,15 +109,106 @@ class Message(models.Model):
     tokens_used = models.IntegerField(null=True, blank=True)  # Track token usage for AI responses
     model_used = models.CharField(max_length=100, blank=True, null=True)  # Track which AI model was used
     
+    # Full-text search document over content, maintained by a database trigger
+    search_vector = SearchVectorField(null=True, editable=False)
+    
+    # Conversation version at which this message was last written, set by a
+    # database trigger
+    version = models.PositiveBigIntegerField(default=0, editable=False)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['timestamp']
         indexes = [
             models.Index(fields=['conversation', 'timestamp']),
+            models.Index(fields=['conversation', 'version']),
             models.Index(fields=['sender']),
+            GinIndex(fields=['search_vector'], name='message_search_idx'),
         ]
     
     def __str__(self):
         return f"{self.sender}: {self.content[:50]}..."
 
+
+
+class ConversationChunk(models.Model):
+    """
+    Overlapping window of consecutive messages of an ended conversation,
+    embedded on its own so query_conversations can retrieve the part of a
+    conversation that answers a question (see retrieval.py).
+    """
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        related_name='chunks'
+    )
+    position = models.PositiveIntegerField()  # Window number within the conversation
+    text = models.TextField()  # "sender: content" lines
+    message_count = models.PositiveIntegerField()
+    
+    # Embedding and embedder version, with the vector staged for the next
+    # version, as on Conversation (see the embed_conversations command)
+    embedding = EmbeddingField(null=True, blank=True)
+    embedding_model = models.CharField(max_length=100, blank=True, default='')
+    next_embedding = EmbeddingField(null=True, blank=True)
+    next_embedding_model = models.CharField(max_length=100, blank=True, default='')
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['conversation', 'position']
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+    
+    def __str__(self):
+        return f"Chunk {self.position} of conversation {self.conversation_id}"
+
+
+class AnalysisJob(models.Model):
+    """
+    Background job that analyzes a conversation after it has been ended.
+    
+    Jobs are claimed by `manage.py run_analysis_worker` processes under a
+    time-limited lease; a job whose worker crashed is picked up again once
+    its lease expires.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        related_name='analysis_jobs'
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    
+    # Retry bookkeeping
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)  # Not claimed before this time (backoff)
+    last_error = models.TextField(blank=True, default='')
+    
+    # Lease held by the worker currently running the job
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    
+    result = models.JSONField(null=True, blank=True)  # Analysis timings and errors
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+    
+    def __str__(self):
+        return f"AnalysisJob {self.id} ({self.status}) for conversation {self.conversation_id}"
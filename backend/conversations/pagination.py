@@ -0,0 +1,68 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are ordered newest first on (timestamp field, id), and a cursor is the
+key of the last row of the previous page. Each page is one indexed range
+query, unlike OFFSET pagination, whose cost grows with the page number, and
+rows inserted since the first page never shift later pages.
+"""
+import base64
+import json
+from typing import List, Optional, Tuple
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    """The cursor was not produced by this paginator."""
+
+
+def encode_cursor(timestamp, pk: int) -> str:
+    """Encode a (timestamp, id) key as an opaque URL-safe string."""
+    raw = json.dumps([timestamp.isoformat(), pk]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple:
+    """Decode a cursor from encode_cursor() into (timestamp, id)."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, pk = json.loads(raw)
+        timestamp = parse_datetime(timestamp)
+        if timestamp is None or not isinstance(pk, int):
+            raise ValueError
+    except (ValueError, TypeError):
+        raise InvalidCursor(f'Invalid cursor: {cursor!r}')
+    return timestamp, pk
+
+
+def keyset_page(queryset, field: str, page_size: int, cursor: Optional[str] = None) -> Tuple[List, Optional[str]]:
+    """
+    Fetch one page of a queryset, newest first on (field, id).
+
+    Args:
+        queryset: Rows to page through (model instances, or dicts from
+            values() including `field` and 'id'); its ordering is replaced
+        field: Timestamp field to order by, e.g. 'start_timestamp'
+        page_size: Rows per page
+        cursor: Cursor returned with the previous page (None: first page)
+
+    Returns:
+        (rows, next cursor), where the next cursor is None on the last page
+
+    Raises:
+        InvalidCursor: If the cursor cannot be decoded
+    """
+    if cursor:
+        timestamp, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'id__lt': pk}))
+    # One extra row tells whether there is a next page
+    rows = list(queryset.order_by(f'-{field}', '-id')[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    if isinstance(last, dict):
+        return rows, encode_cursor(last[field], last['id'])
+    return rows, encode_cursor(getattr(last, field), last.id)
@@ -0,0 +1,85 @@
+"""
+Custom DRF renderers and parsers for the Chat Portal API.
+"""
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # Optional: the stdlib-based JSONRenderer and JSONParser are used instead
+    orjson = None
+
+
+def format_sse(event: str, data) -> str:
+    """Format a single Server-Sent Event with a JSON-encoded data payload."""
+    payload = json.dumps(data, cls=DjangoJSONEncoder)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Renderer for ``text/event-stream`` clients.
+
+    Streaming actions return a StreamingHttpResponse directly, so this renderer
+    only handles regular Response objects (validation errors, 404s) by sending
+    them as a single ``error`` event.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_sse('error', data).encode(self.charset)
+
+
+def _require_orjson():
+    if orjson is None:
+        raise ImportError("orjson not installed. Run: pip install orjson")
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer backed by orjson, several times faster on large payloads.
+
+    The output is the same as JSONRenderer's with the default COMPACT_JSON
+    and UNICODE_JSON settings: datetimes in UTC end in 'Z', and types orjson
+    does not know natively (Decimal, timedelta, lazy strings, ...) are
+    converted by DRF's JSONEncoder, so Decimal renders as a number. NaN and
+    infinities render as null, where JSONRenderer raises. Any requested
+    indent (e.g. 'application/json; indent=4') is rendered as two spaces.
+    """
+    _default = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        _require_orjson()
+        option = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            option |= orjson.OPT_INDENT_2
+        ret = orjson.dumps(data, default=self._default, option=option)
+        # Escape U+2028 and U+2029 like JSONRenderer, so the output stays a
+        # strict JavaScript subset
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class ORJSONParser(JSONParser):
+    """JSONParser backed by orjson; NaN and infinities are rejected, as with STRICT_JSON."""
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        _require_orjson()
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        data = stream.read()
+        try:
+            if encoding.lower().replace('-', '') != 'utf8':
+                data = data.decode(encoding)
+            return orjson.loads(data)
+        except (ValueError, LookupError) as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
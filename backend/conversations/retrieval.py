@@ -0,0 +1,311 @@
+"""
+Retrieval pipeline for query_conversations.
+
+1. Conversations are ranked by a lexical retriever (search.keyword_search:
+   Postgres full-text search or BM25) and a vector retriever
+   (vector_index) running concurrently, fused with reciprocal rank fusion,
+   and optionally reranked locally (rank_conversations()).
+2. The answer's context comes from message windows: when a conversation
+   ends, its messages are split into overlapping windows of
+   AI_RETRIEVAL_WINDOW_MESSAGES messages, starting every
+   AI_RETRIEVAL_WINDOW_STRIDE messages (ConversationChunk), and each window
+   is embedded. A query scores the windows of the ranked conversations,
+   read from the database, and packs the best into the prompt under a token
+   budget, each tagged with its conversation id so the answer can cite it.
+
+Each stage's latency is recorded in a `timings` dict (milliseconds), which
+query_conversations returns as response metadata.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from .context import estimate_tokens
+from .embeddings import STOP_WORDS, TOKEN_RE, get_embedder
+from .models import Conversation, ConversationChunk
+from .search import keyword_search
+from .vector_index import get_vector_index
+
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on a window's text, so one long message cannot take the whole budget
+MAX_CHUNK_CHARS = 4000
+
+# Prompt cost of an excerpt's citation header
+EXCERPT_OVERHEAD_TOKENS = 12
+
+# Reciprocal rank fusion constant: a result at rank r scores 1 / (RRF_K + r)
+RRF_K = 60
+
+# Runs the vector retriever while the request thread runs the lexical one
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='retrieval')
+
+
+def timed(timings: Dict[str, float], stage: str, function, *args):
+    """Call function(*args), recording its duration in milliseconds as timings[stage]."""
+    started = time.perf_counter()
+    try:
+        return function(*args)
+    finally:
+        timings[stage] = round((time.perf_counter() - started) * 1000, 2)
+
+
+def reciprocal_rank_fusion(rankings: List[List[Tuple[int, float]]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """
+    Fuse ranked lists of (id, score) by reciprocal rank.
+
+    Only ranks matter, so scores on different scales (BM25, cosine) combine
+    without normalization.
+
+    Returns:
+        List of (id, fused score), best first
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, (key, _) in enumerate(ranking, start=1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def rerank(query: str, hits: List[Tuple[int, float]]) -> List[Tuple[int, float]]:
+    """
+    Reorder fused hits by how many of the query's words appear in each
+    conversation's title, summary, topics and key points.
+
+    The new score averages that word coverage with the fused score relative
+    to the best one. Costs one query for the candidates' metadata.
+    """
+    if not hits:
+        return hits
+    words = {word for word in TOKEN_RE.findall(query.lower()) if word not in STOP_WORDS}
+    rows = Conversation.objects.filter(id__in=[key for key, _ in hits]).values_list(
+        'id', 'title', 'summary', 'topics', 'key_points'
+    )
+    coverage = {}
+    for conversation_id, title, summary, topics, key_points in rows:
+        text = ' '.join([title or '', summary or '', *map(str, topics or []), *map(str, key_points or [])])
+        found = words.intersection(TOKEN_RE.findall(text.lower()))
+        coverage[conversation_id] = len(found) / len(words) if words else 0.0
+    best = hits[0][1]
+    scored = [(key, 0.5 * coverage.get(key, 0.0) + 0.5 * score / best) for key, score in hits]
+    return sorted(scored, key=lambda item: item[1], reverse=True)
+
+
+def _vector_hits(index, query, k, date_from, date_to):
+    """Embed the query and search the index; returns (hits, elapsed milliseconds)."""
+    started = time.perf_counter()
+    hits = index.search(get_embedder().embed_one(query), k, date_from=date_from, date_to=date_to,
+                        min_score=settings.AI_VECTOR_MIN_SCORE)
+    return hits, round((time.perf_counter() - started) * 1000, 2)
+
+
+def rank_conversations(query: str, limit: int, date_from=None, date_to=None,
+                       timings: Optional[Dict[str, float]] = None) -> List[Tuple[int, float]]:
+    """
+    Rank ended conversations for a query by hybrid lexical and vector retrieval.
+
+    Each retriever returns its best AI_HYBRID_CANDIDATES; the lists are
+    fused with reciprocal rank fusion and, if AI_HYBRID_RERANK is set, the
+    fused list is reranked (see rerank()).
+
+    Args:
+        timings: Filled with the 'vector_sync' (loading or syncing the
+            vector index), 'lexical', 'vector' (embedding the query and
+            searching), 'fusion' and 'rerank' stage latencies in milliseconds
+
+    Returns:
+        List of (conversation id, score), best first
+    """
+    timings = {} if timings is None else timings
+    candidates = max(limit, settings.AI_HYBRID_CANDIDATES)
+
+    # Load or sync the index in this thread, so the worker thread only embeds
+    # the query and scans memory, and needs no database connection
+    started = time.perf_counter()
+    index = get_vector_index()
+    index.refresh_if_stale()
+    timings['vector_sync'] = round((time.perf_counter() - started) * 1000, 2)
+    vector_future = _executor.submit(_vector_hits, index, query, candidates, date_from, date_to)
+
+    lexical = timed(timings, 'lexical', keyword_search, query, candidates, date_from, date_to)
+    vector, timings['vector'] = vector_future.result()
+
+    fused = timed(timings, 'fusion', reciprocal_rank_fusion, [lexical, vector])
+    if settings.AI_HYBRID_RERANK:
+        fused = timed(timings, 'rerank', rerank, query, fused[:candidates])
+    return fused[:limit]
+
+
+def message_windows(messages: List[Dict[str, str]], size: int, stride: int) -> List[List[Dict[str, str]]]:
+    """
+    Split messages into windows of `size` messages starting every `stride`.
+
+    The last window ends with the last message; consecutive windows share
+    size - stride messages.
+    """
+    if not messages:
+        return []
+    starts = list(range(0, max(len(messages) - size, 0) + 1, stride))
+    if starts[-1] + size < len(messages):
+        starts.append(len(messages) - size)
+    return [messages[start:start + size] for start in starts]
+
+
+def chunk_text(messages: List[Dict[str, str]]) -> str:
+    return '\n'.join(f"{message['sender']}: {message['content']}" for message in messages)[:MAX_CHUNK_CHARS]
+
+
+def index_chunks(conversation) -> int:
+    """
+    Replace the chunks of a conversation and embed them.
+
+    Embedding failures are logged and leave the chunks
+    unembedded (they are not retrieved), so they never prevent a
+    conversation from ending.
+
+    Returns:
+        Number of chunks created
+    """
+    messages = list(conversation.messages.order_by('timestamp', 'id').values('sender', 'content'))
+    windows = message_windows(
+        messages, settings.AI_RETRIEVAL_WINDOW_MESSAGES, settings.AI_RETRIEVAL_WINDOW_STRIDE
+    )
+    chunks = [
+        ConversationChunk(conversation=conversation, position=position,
+                          text=chunk_text(window), message_count=len(window))
+        for position, window in enumerate(windows)
+    ]
+    embedder = get_embedder()
+    try:
+        vectors = embedder.embed([chunk.text for chunk in chunks]) if chunks else []
+    except Exception:
+        logger.exception('Could not embed the chunks of conversation %s', conversation.id)
+        vectors = [None] * len(chunks)
+    for chunk, vector in zip(chunks, vectors):
+        chunk.embedding = vector
+        if vector is not None:
+            chunk.embedding_model = embedder.version
+
+    conversation.chunks.all().delete()
+    ConversationChunk.objects.bulk_create(chunks)
+    return len(chunks)
+
+
+def retrieve_chunks(query: str, conversation_ids: List[int]) -> List[ConversationChunk]:
+    """
+    Find the AI_RETRIEVAL_CANDIDATES chunks of the ranked conversations most
+    similar to a query.
+
+    Only the embeddings of those conversations' chunks are read, and scored
+    with one matrix-vector product, so the answer cannot cite a conversation
+    that was not ranked and no process holds the chunks of the whole corpus.
+    Chunks scoring below AI_RETRIEVAL_RELATIVE_SCORE times the best score are
+    left out.
+
+    Returns:
+        Chunks with their conversation loaded, best first
+    """
+    rows = list(ConversationChunk.objects.filter(
+        conversation_id__in=conversation_ids, conversation__status='ended',
+        embedding__isnull=False, embedding_model=get_embedder().version
+    ).values_list('id', 'embedding'))
+    if not rows:
+        return []
+    ids = np.array([chunk_id for chunk_id, _ in rows], dtype=np.int64)
+    scores = np.stack([embedding for _, embedding in rows]) @ get_embedder().embed_one(query)
+
+    top = np.argsort(scores)[::-1][:settings.AI_RETRIEVAL_CANDIDATES]
+    hits = [(int(ids[i]), float(scores[i])) for i in top if scores[i] > settings.AI_VECTOR_MIN_SCORE]
+    if hits:
+        # Weak matches only pad the prompt
+        cutoff = hits[0][1] * settings.AI_RETRIEVAL_RELATIVE_SCORE
+        hits = [(chunk_id, score) for chunk_id, score in hits if score >= cutoff]
+    chunks = ConversationChunk.objects.select_related('conversation').only(
+        'id', 'position', 'text', 'conversation__id', 'conversation__title', 'conversation__start_timestamp'
+    ).in_bulk([chunk_id for chunk_id, _ in hits])
+    # Deleted since the embeddings were read
+    return [chunks[chunk_id] for chunk_id, _ in hits if chunk_id in chunks]
+
+
+def pack_excerpts(chunks: List[ConversationChunk], conversations: List[Dict[str, Any]],
+                  budget: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Choose the excerpts to put in the prompt under a token budget.
+
+    Chunks are taken best first while they fit, skipping windows that
+    overlap one already taken. Then, for relevant
+    conversations that no chunk came from (e.g. ended before chunking was
+    enabled), their title, summary and topics are added while they fit.
+
+    Args:
+        chunks: Retrieved chunks, best first
+        conversations: Serialized relevant conversations, best first
+        budget: Token budget (default: AI_RETRIEVAL_CONTEXT_TOKENS)
+
+    Returns:
+        List of excerpts: dicts with conversation_id, title, start_timestamp
+        and text, grouped by conversation, chunks in conversation order
+    """
+    budget = settings.AI_RETRIEVAL_CONTEXT_TOKENS if budget is None else budget
+    used = 0
+    selected = []
+    # Windows closer than this share messages with each other
+    overlap = -(-settings.AI_RETRIEVAL_WINDOW_MESSAGES // settings.AI_RETRIEVAL_WINDOW_STRIDE)
+    taken = set()
+    for chunk in chunks:
+        cost = estimate_tokens(chunk.text) + EXCERPT_OVERHEAD_TOKENS
+        if used + cost > budget:
+            continue
+        if any((chunk.conversation_id, chunk.position + offset) in taken for offset in range(1 - overlap, overlap)):
+            # Its best messages are already in a better window
+            continue
+        selected.append(chunk)
+        taken.add((chunk.conversation_id, chunk.position))
+        used += cost
+
+    # Group by conversation, in the order of each conversation's best chunk
+    order = {}
+    for chunk in selected:
+        order.setdefault(chunk.conversation_id, len(order))
+    selected.sort(key=lambda chunk: (order[chunk.conversation_id], chunk.position))
+    excerpts = [
+        {
+            'conversation_id': chunk.conversation_id,
+            'title': chunk.conversation.title,
+            'start_timestamp': chunk.conversation.start_timestamp.isoformat(),
+            'text': chunk.text,
+        }
+        for chunk in selected
+    ]
+
+    for conv in conversations:
+        if conv['id'] in order:
+            continue
+        text = '\n'.join(part for part in (
+            f"Summary: {conv['summary']}" if conv.get('summary') else '',
+            f"Topics: {', '.join(conv['topics'])}" if conv.get('topics') else '',
+        ) if part)
+        cost = estimate_tokens(text) + EXCERPT_OVERHEAD_TOKENS
+        if text and used + cost <= budget:
+            excerpts.append({
+                'conversation_id': conv['id'],
+                'title': conv.get('title'),
+                'start_timestamp': conv['start_timestamp'],
+                'text': text,
+            })
+            used += cost
+    return excerpts
+
+
+def query_excerpts(query: str, conversations: List[Dict[str, Any]]):
+    """
+    Retrieve and pack the excerpts for a query from the ranked `conversations`;
+    see retrieve_chunks() and pack_excerpts().
+    """
+    chunks = retrieve_chunks(query, [conv['id'] for conv in conversations])
+    return pack_excerpts(chunks, conversations)
@@ -0,0 +1,118 @@
+"""
+Live summary of active conversations.
+
+When settings.AI_RUNNING_SUMMARY_INTERVAL is set, send_message schedules a
+background update once that many messages have arrived since the last one.
+The update sends only the new messages plus the previous summary and topics,
+and stores the result on the conversation (running_summary, running_topics),
+where the dashboard shows it while the conversation is still active.
+
+end_conversation then analyzes the running summary plus the few messages
+after it instead of the whole transcript (see analysis.analysis_messages()).
+
+Updates run in a small in-process thread pool after the request's
+transaction commits. They are best effort: a failed or skipped update is
+simply retried after the next messages.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .ai_service import get_ai_service
+from .models import Conversation
+
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='running-summary')
+# Conversations with an update queued or in progress
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def unsummarized_messages(conversation):
+    """Messages of a conversation that are not covered by its running summary yet."""
+    messages = conversation.messages.all()
+    if conversation.running_summary_until:
+        messages = messages.filter(timestamp__gt=conversation.running_summary_until)
+    return messages
+
+
+def maybe_schedule_running_summary(conversation) -> bool:
+    """
+    Schedule a running summary update if enough new messages have arrived.
+
+    Returns:
+        True if an update was scheduled
+    """
+    interval = settings.AI_RUNNING_SUMMARY_INTERVAL
+    if not interval or unsummarized_messages(conversation).count() < interval:
+        return False
+    conversation_id = conversation.id
+    transaction.on_commit(lambda: _submit(conversation_id))
+    return True
+
+
+def _submit(conversation_id):
+    """Queue an update unless one is already pending for the conversation."""
+    with _pending_lock:
+        if conversation_id in _pending:
+            return
+        _pending.add(conversation_id)
+    _executor.submit(_run, conversation_id)
+
+
+def _run(conversation_id):
+    try:
+        update_running_summary(conversation_id)
+    except Exception:
+        logger.exception('Running summary update failed for conversation %s', conversation_id)
+    finally:
+        with _pending_lock:
+            _pending.discard(conversation_id)
+        # Each pool thread has its own connection; don't leave it open
+        connection.close()
+
+
+def update_running_summary(conversation_id) -> bool:
+    """
+    Fold the new messages of an active conversation into its running summary.
+
+    The update is only saved if no other update moved the summary forward in
+    the meantime.
+
+    Returns:
+        True if the running summary was updated
+    """
+    conversation = Conversation.objects.get(pk=conversation_id)
+    if conversation.status != 'active':
+        return False
+
+    new_messages = list(
+        unsummarized_messages(conversation)
+        .order_by('timestamp', 'id')
+        .values('sender', 'content', 'timestamp')
+    )
+    if not new_messages:
+        return False
+
+    result = get_ai_service().update_running_analysis(
+        conversation.running_summary,
+        conversation.running_topics,
+        [{'sender': msg['sender'], 'content': msg['content']} for msg in new_messages]
+    )
+    if result is None:
+        return False
+
+    updated = Conversation.objects.filter(
+        pk=conversation_id,
+        running_summary_until=conversation.running_summary_until
+    ).update(
+        running_summary=result['summary'],
+        running_topics=result['topics'],
+        running_summary_until=new_messages[-1]['timestamp']
+    )
+    return bool(updated)
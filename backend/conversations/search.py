@@ -0,0 +1,120 @@
+"""
+PostgreSQL full-text search over conversations and messages.
+
+Conversation.search_vector (title, summary and topics) and
+Message.search_vector (content) are kept current by database triggers
+(migration 0005) and backed by GIN indexes. Queries use websearch syntax:
+quoted phrases, OR and -excluded words.
+"""
+import re
+from typing import List, Tuple
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db.models import Case, F, FloatField, OuterRef, Q, Subquery, TextField, Value, When
+from django.db.models.functions import Coalesce
+
+from . import bm25_index
+from .models import Conversation, Message
+
+
+# Text search configuration used by the triggers in migration 0005
+SEARCH_CONFIG = 'english'
+
+HIGHLIGHT_OPTIONS = {
+    'start_sel': '<mark>',
+    'stop_sel': '</mark>',
+    'max_words': 30,
+    'min_words': 10,
+    'config': SEARCH_CONFIG,
+}
+
+
+def parse_query(text: str) -> SearchQuery:
+    """Build a full-text query from user input (websearch syntax: all words must match)."""
+    return SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+
+
+def any_word_query(text: str) -> SearchQuery:
+    """
+    Build a full-text query matching any word of a natural language question.
+
+    Requiring every word of a question such as "what did I say about
+    travel?" would miss most relevant conversations; ranking still favours
+    the ones that match more words.
+    """
+    words = re.findall(r'\w+', text)
+    return SearchQuery(' OR '.join(words), search_type='websearch', config=SEARCH_CONFIG)
+
+
+def search_matches(query: SearchQuery) -> Q:
+    """Condition for conversations whose title, summary or topics, or any message, match `query`."""
+    return Q(search_vector=query) | Q(id__in=Message.objects.filter(search_vector=query).values('conversation_id'))
+
+
+def full_text_search(queryset, query: SearchQuery, highlight: bool = True):
+    """
+    Filter and rank conversations that match a full-text query.
+
+    A conversation matches if its title, summary or topics match, or any of
+    its messages does. The rank adds the conversation's own rank to the rank
+    of its best matching message.
+
+    Args:
+        queryset: Conversations to search
+        query: Full-text query (see parse_query() and any_word_query())
+        highlight: Annotate `highlight` with a snippet of the summary, or of
+            the best matching message if the summary does not match
+
+    Returns:
+        Queryset annotated with `rank` (and `highlight`), best match first
+    """
+    best_message = Message.objects.filter(conversation=OuterRef('pk'), search_vector=query).annotate(
+        rank=SearchRank(F('search_vector'), query)
+    ).order_by('-rank')
+
+    conversations = queryset.filter(search_matches(query)).annotate(
+        rank=(
+            Coalesce(SearchRank(F('search_vector'), query), Value(0.0), output_field=FloatField()) +
+            Coalesce(Subquery(best_message.values('rank')[:1]), Value(0.0), output_field=FloatField())
+        )
+    )
+
+    if highlight:
+        best_message_snippet = best_message.annotate(
+            snippet=SearchHeadline('content', query, **HIGHLIGHT_OPTIONS)
+        ).values('snippet')[:1]
+        conversations = conversations.annotate(
+            highlight=Case(
+                When(summary__search=query, then=SearchHeadline('summary', query, **HIGHLIGHT_OPTIONS)),
+                # Matched on a message, or else on the title or topics
+                default=Coalesce(
+                    Subquery(best_message_snippet),
+                    SearchHeadline('title', query, **HIGHLIGHT_OPTIONS)
+                ),
+                output_field=TextField()
+            )
+        )
+    return conversations.order_by('-rank', '-start_timestamp')
+
+
+def keyword_search(text: str, limit: int = 5, date_from=None, date_to=None) -> List[Tuple[int, float]]:
+    """
+    Rank ended conversations for a natural language query with full-text search.
+
+    Uses the in-process BM25 index instead when AI_LEXICAL_BACKEND is 'bm25'.
+
+    Returns:
+        List of (conversation id, rank), best first
+    """
+    if not re.search(r'\w', text):
+        return []
+    if settings.AI_LEXICAL_BACKEND == 'bm25':
+        return bm25_index.search_conversations(text, limit, date_from, date_to)
+    conversations = Conversation.objects.filter(status='ended')
+    if date_from:
+        conversations = conversations.filter(start_timestamp__gte=date_from)
+    if date_to:
+        conversations = conversations.filter(start_timestamp__lte=date_to)
+    ranked = full_text_search(conversations, any_word_query(text), highlight=False)
+    return [(conversation_id, rank) for conversation_id, rank in ranked.values_list('id', 'rank')[:limit]]
@@ -1,8 +1,14 @@
 """
 DRF Serializers for Conversations and Messages.
 """
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Substr
 from rest_framework import serializers
-from .models import Conversation, Message
+from .models import AnalysisJob, Conversation, Message
+
+
+# Characters of the last message shown in conversation lists
+LAST_MESSAGE_PREVIEW_CHARS = 100
 
 
 class MessageSerializer(serializers.ModelSerializer):
@@ -18,9 +24,41 @@ class MessageSerializer(serializers.ModelSerializer):
             'timestamp',
             'tokens_used',
             'model_used',
+            'version',
             'created_at'
         ]
-        read_only_fields = ['id', 'timestamp', 'created_at']
+        read_only_fields = ['id', 'timestamp', 'version', 'created_at']
+
+
+def message_count_subquery():
+    """Number of messages of the outer conversation, as an annotation (0 when empty)."""
+    messages = Message.objects.filter(conversation=OuterRef('pk'))
+    return Coalesce(
+        Subquery(
+            messages.order_by().values('conversation').annotate(count=Count('id')).values('count'),
+            output_field=IntegerField()
+        ),
+        Value(0)
+    )
+
+
+def annotate_list_fields(queryset):
+    """
+    Annotate conversations with what ConversationListSerializer shows about
+    their messages, so a page of conversations is read in a single query.
+
+    Adds message_count and the last message's preview (last_message_content,
+    last_message_sender, last_message_timestamp), from correlated subqueries
+    that use the (conversation, timestamp) index.
+    """
+    messages = Message.objects.filter(conversation=OuterRef('pk'))
+    last = messages.order_by('-timestamp', '-id')[:1]
+    return queryset.annotate(
+        message_count=message_count_subquery(),
+        last_message_content=Subquery(last.values(preview=Substr('content', 1, LAST_MESSAGE_PREVIEW_CHARS))),
+        last_message_sender=Subquery(last.values('sender')),
+        last_message_timestamp=Subquery(last.values('timestamp')),
+    )
 
 
 class ConversationListSerializer(serializers.ModelSerializer):
@@ -42,6 +80,8 @@ class ConversationListSerializer(serializers.ModelSerializer):
             'last_message',
             'topics',
             'sentiment',
+            'running_summary',
+            'running_topics',
             'created_at',
             'updated_at'
         ]
@@ -49,6 +89,8 @@ class ConversationListSerializer(serializers.ModelSerializer):
     
     def get_message_count(self, obj):
         """Get the total number of messages in the conversation."""
+        if hasattr(obj, 'message_count'):
+            return obj.message_count
         return obj.get_message_count()
     
     def get_duration(self, obj):
@@ -56,10 +98,23 @@ class ConversationListSerializer(serializers.ModelSerializer):
         return obj.get_duration()
     
     def get_last_message(self, obj):
-        """Get the last message content preview."""
-        last_message = obj.messages.last()
+        """
+        Get the last message content preview.
+        
+        Read from the annotate_list_fields() annotations when present,
+        otherwise with one query.
+        """
+        if hasattr(obj, 'last_message_sender'):
+            if obj.last_message_sender is None:
+                return None
+            return {
+                'content': obj.last_message_content,
+                'sender': obj.last_message_sender,
+                'timestamp': obj.last_message_timestamp
+            }
+        last_message = obj.messages.order_by('timestamp', 'id').last()
         if last_message:
-            content = last_message.content[:100]
+            content = last_message.content[:LAST_MESSAGE_PREVIEW_CHARS]
             return {
                 'content': content,
                 'sender': last_message.sender,
@@ -86,9 +141,12 @@ class ConversationDetailSerializer(serializers.ModelSerializer):
             'topics',
             'key_points',
             'sentiment',
+            'running_summary',
+            'running_topics',
             'message_count',
             'duration',
             'messages',
+            'version',
             'created_at',
             'updated_at'
         ]
@@ -103,6 +161,16 @@ class ConversationDetailSerializer(serializers.ModelSerializer):
         return obj.get_duration()
 
 
+class ConversationRetrieveSerializer(ConversationDetailSerializer):
+    """
+    ConversationDetailSerializer without the messages, for the retrieve
+    action, which pages them separately.
+    """
+    
+    class Meta(ConversationDetailSerializer.Meta):
+        fields = [field for field in ConversationDetailSerializer.Meta.fields if field != 'messages']
+
+
 class ConversationCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating a new conversation."""
     
@@ -112,6 +180,27 @@ class ConversationCreateSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'status']
 
 
+class AnalysisJobSerializer(serializers.ModelSerializer):
+    """Serializer for background analysis job status."""
+    
+    class Meta:
+        model = AnalysisJob
+        fields = [
+            'id',
+            'conversation',
+            'status',
+            'attempts',
+            'max_attempts',
+            'run_after',
+            'last_error',
+            'result',
+            'created_at',
+            'updated_at',
+            'finished_at'
+        ]
+        read_only_fields = fields
+
+
 class ChatMessageSerializer(serializers.Serializer):
     """Serializer for sending chat messages."""
     conversation_id = serializers.IntegerField()
@@ -130,3 +219,107 @@ class QueryConversationsSerializer(serializers.Serializer):
     date_to = serializers.DateTimeField(required=False, allow_null=True)
     limit = serializers.IntegerField(default=5, min_value=1, max_value=20)
 
+
+def parse_fieldset(params, available):
+    """
+    Fields selected with the ?fields= and ?exclude= query parameters.
+
+    Both take comma-separated field names; `fields` keeps only those and
+    `exclude` drops them. Returns the selection in the order of `available`.
+
+    Raises:
+        ValueError: If a parameter names a field not in `available`
+    """
+    def names(param):
+        value = params.get(param)
+        if not value:
+            return None
+        names = {name.strip() for name in value.split(',') if name.strip()}
+        unknown = sorted(names.difference(available))
+        if unknown:
+            raise ValueError(f"Unknown field(s) in {param}: {', '.join(unknown)}")
+        return names
+
+    only = names('fields')
+    excluded = names('exclude') or set()
+    return [field for field in available if (only is None or field in only) and field not in excluded]
+
+
+def conversation_duration(row):
+    """Conversation duration in seconds, as Conversation.get_duration()."""
+    if row['end_timestamp']:
+        return (row['end_timestamp'] - row['start_timestamp']).total_seconds()
+    return None
+
+
+class ValuesSerializer:
+    """
+    Read-only serializer over QuerySet.values(), for large responses.
+
+    Rows are read as dicts with only the columns the selected fields need,
+    and turned into output without a model or serializer instance per row.
+    The rendered output matches the ModelSerializer it replaces: datetimes
+    are left to the JSON renderer, which formats them the same way.
+
+    Subclasses list their `fields` and, in `sources`, the fields computed
+    from other columns: name -> (columns, function of the row).
+    """
+    fields = []
+    sources = {}
+
+    def __init__(self, fields=None):
+        self.selected = list(self.fields if fields is None else fields)
+
+    def values(self, queryset, *required):
+        """`queryset`.values() with the columns of the selected fields, plus `required` ones."""
+        columns = dict.fromkeys(required)
+        for name in self.selected:
+            columns.update(dict.fromkeys(self.sources[name][0] if name in self.sources else [name]))
+        return queryset.values(*columns)
+
+    def to_representation(self, row):
+        return {
+            name: self.sources[name][1](row) if name in self.sources else row[name]
+            for name in self.selected
+        }
+
+    def serialize(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+
+class MessageValuesSerializer(ValuesSerializer):
+    """
+    MessageSerializer over values(), for messages listed under their
+    conversation (so without the `conversation` id).
+    """
+    fields = ['id', 'content', 'sender', 'timestamp', 'tokens_used', 'model_used', 'version', 'created_at']
+
+
+class ConversationListValuesSerializer(ValuesSerializer):
+    """
+    ConversationListSerializer over values(), for querysets annotated with
+    annotate_list_fields().
+    """
+    fields = ConversationListSerializer.Meta.fields
+    sources = {
+        'duration': (['start_timestamp', 'end_timestamp'], conversation_duration),
+        'last_message': (
+            ['last_message_content', 'last_message_sender', 'last_message_timestamp'],
+            lambda row: None if row['last_message_sender'] is None else {
+                'content': row['last_message_content'],
+                'sender': row['last_message_sender'],
+                'timestamp': row['last_message_timestamp']
+            }
+        ),
+    }
+
+
+class ConversationValuesSerializer(ValuesSerializer):
+    """
+    ConversationRetrieveSerializer over values(), for querysets annotated
+    with message_count (see message_count_subquery()).
+    """
+    fields = ConversationRetrieveSerializer.Meta.fields
+    sources = {
+        'duration': (['start_timestamp', 'end_timestamp'], conversation_duration),
+    }
@@ -0,0 +1,50 @@
+"""
+Signal handlers for the conversations app.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import answer_cache, bm25_index, vector_index
+from .models import Conversation, Message
+
+
+@receiver(post_delete, sender=Conversation)
+def remove_from_vector_index(sender, instance, **kwargs):
+    """Drop a deleted conversation from this process's vector index."""
+    if vector_index._index is not None:
+        vector_index._index.remove(instance.id)
+
+
+@receiver(post_delete, sender=Conversation)
+def invalidate_answer_cache(sender, instance, **kwargs):
+    """Stop serving cached query answers that may cite a deleted conversation."""
+    answer_cache.bump_corpus_version()
+
+
+@receiver(post_delete, sender=Conversation)
+def remove_from_bm25_index(sender, instance, **kwargs):
+    """Drop a deleted conversation and its messages from this process's BM25 index."""
+    if bm25_index._index is not None:
+        bm25_index._index.remove_conversation(instance.id)
+
+
+@receiver(post_save, sender=Conversation)
+def index_conversation(sender, instance, **kwargs):
+    """Re-index a saved conversation's header, status and start time once committed."""
+    def update():
+        if bm25_index._index is not None:
+            bm25_index._index.set_conversation(
+                instance.id, instance.start_timestamp, instance.status == 'ended',
+                instance.title, instance.summary, instance.topics
+            )
+    transaction.on_commit(update)
+
+
+@receiver(post_save, sender=Message)
+def index_message(sender, instance, **kwargs):
+    """Index a saved message once committed."""
+    def update():
+        if bm25_index._index is not None:
+            bm25_index._index.add_message(instance.id, instance.conversation_id, instance.content)
+    transaction.on_commit(update)
@@ -3,11 +3,64 @@ Unit tests for the Conversations app.
 
 Run tests with: python manage.py test conversations
 """
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.signals import request_finished
+from django.db import close_old_connections, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
-from rest_framework.test import APITestCase
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, APITestCase
 from rest_framework import status
-from .models import Conversation, Message
+from .ai_service import AIService, AIServiceError
+from .ann_index import ANNIndex, IVFPQ
+from .analysis import analysis_messages, apply_analysis
+from .answer_cache import MISSES_KEY, VERSION_KEY, cache_stats
+from .bm25_index import BM25Index, reset_bm25_index
+from .context import abuild_chat_messages, build_chat_messages, message_tokens
+from .embeddings import HashingEmbedder
+from .fields import decode_embedding, encode_embedding
+from .jobs import claim_job, run_job
+from .models import AnalysisJob, Conversation, ConversationChunk, Message
+from .retrieval import (
+    index_chunks, message_windows, pack_excerpts, query_excerpts, rank_conversations, reciprocal_rank_fusion,
+    retrieve_chunks
+)
+from .running_summary import update_running_summary
+from .renderers import ORJSONParser, ORJSONRenderer
+from .search import keyword_search
+from .serializers import (
+    ConversationListSerializer,
+    ConversationListValuesSerializer,
+    ConversationRetrieveSerializer,
+    MessageSerializer,
+    annotate_list_fields
+)
+from .vector_index import (
+    VectorIndex, embed_conversation, get_vector_index, reset_vector_index, search_conversations
+)
+from .views import ConversationViewSet, find_relevant_conversations
+
+
+# Chunks are condensed in worker threads, whose database connections do not
+# see the test transaction, and a cache hit must cost no query: tests of those
+# use an in-memory cache instead of the configured shared one
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
 
 
 class ConversationModelTest(TestCase):
@@ -148,6 +201,210 @@ class ConversationAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['count'], 1)
         self.assertEqual(response.data['conversations'][0]['status'], 'active')
+    
+    def test_list_query_count_does_not_grow_with_page(self):
+        """Message counts and last-message previews come from annotations: two queries per page."""
+        def list_conversations():
+            with self.assertNumQueries(2):
+                return self.client.get('/api/conversations/').data['conversations']
+        
+        list_conversations()
+        for i in range(10):
+            conversation = Conversation.objects.create(title=f'Conversation {i}')
+            Message.objects.bulk_create([
+                Message(conversation=conversation, content='First', sender='user',
+                        timestamp=timezone.now() - timedelta(minutes=1)),
+                Message(conversation=conversation, content='Latest ' + 'x' * 200, sender='ai'),
+            ])
+        conversations = list_conversations()
+        
+        self.assertEqual(len(conversations), 11)
+        self.assertEqual(conversations[0]['message_count'], 2)
+        self.assertEqual(conversations[0]['last_message']['sender'], 'ai')
+        self.assertEqual(len(conversations[0]['last_message']['content']), 100)
+        empty = Conversation.objects.create(title='Empty')
+        latest = list_conversations()[0]
+        self.assertEqual((latest['id'], latest['message_count'], latest['last_message']), (empty.id, 0, None))
+    
+    def test_list_is_keyset_paginated(self):
+        """The list returns PAGE_SIZE conversations per page; newer conversations never shift later pages."""
+        Conversation.objects.bulk_create(Conversation(title=f'Conversation {i}') for i in range(50))
+        
+        first = self.client.get('/api/conversations/').data
+        Conversation.objects.create(title='Newer')
+        # The page, and the aggregate query behind its ETag
+        with self.assertNumQueries(2):
+            second = self.client.get(first['next']).data
+        
+        self.assertEqual((first['count'], len(first['conversations'])), (51, 50))
+        self.assertEqual([c['id'] for c in second['conversations']], [self.conversation.id])
+        self.assertIsNone(second['count'])
+        self.assertIsNone(second['next'])
+        self.assertEqual(self.client.get('/api/conversations/?cursor=nonsense').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+    
+    def test_retrieve_returns_newest_messages_and_pages_back(self):
+        """Retrieve holds the newest page of messages; `next` links walk back to the first message."""
+        now = timezone.now()
+        # 119 more messages, several sharing a timestamp, so pages split ties by id
+        Message.objects.bulk_create(
+            Message(conversation=self.conversation, content=f'Message {i}', sender='user',
+                    timestamp=now + timedelta(seconds=i // 3))
+            for i in range(119)
+        )
+        
+        conversation = self.client.get(f'/api/conversations/{self.conversation.id}/').data['conversation']
+        contents = [m['content'] for m in conversation['messages']]
+        self.assertEqual(contents, [f'Message {i}' for i in range(69, 119)])
+        
+        url = conversation['messages_next']
+        while url:
+            page = self.client.get(url).data
+            contents = [m['content'] for m in page['messages']] + contents
+            url = page['next']
+        self.assertEqual(contents, ['Test message'] + [f'Message {i}' for i in range(119)])
+        
+        page = self.client.get(f'/api/conversations/{self.conversation.id}/messages/?limit=5').data
+        self.assertEqual(len(page['messages']), 5)
+    
+    def test_list_honours_if_none_match(self):
+        """An unchanged list page returns 304 after one query; any change, or other filters, give a new ETag."""
+        url = '/api/conversations/'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        
+        self.assertNotEqual(self.client.get(url, {'status': 'active'})['ETag'], etag)
+        Message.objects.create(conversation=self.conversation, content='Another', sender='user')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+    
+    def test_cursor_page_etag_is_a_bounded_read(self):
+        """A cursor page's ETag reads the page's rows, not the whole list, and only moves with them."""
+        Conversation.objects.bulk_create(Conversation(title=f'Conversation {i}') for i in range(50))
+        url = self.client.get('/api/conversations/').data['next']
+        etag = self.client.get(url)['ETag']
+        
+        Conversation.objects.create(title='Newer')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('COUNT', queries[0]['sql'])
+        self.assertIn('LIMIT 51', queries[0]['sql'])
+        
+        Conversation.objects.filter(id=self.conversation.id).update(title='Renamed')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+    
+    def test_retrieve_honours_conditional_headers(self):
+        """An unchanged conversation returns 304 for its ETag or Last-Modified; a new message changes both."""
+        url = f'/api/conversations/{self.conversation.id}/'
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+        
+        Message.objects.create(conversation=self.conversation, content='Later', sender='ai',
+                               timestamp=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code,
+                         status.HTTP_200_OK)
+    
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_retrieve_caches_ended_conversations(self):
+        """An ended conversation is serialized once; changing it changes the cache key."""
+        cache.clear()
+        Conversation.objects.filter(pk=self.conversation.pk).update(status='ended', end_timestamp=timezone.now())
+        url = f'/api/conversations/{self.conversation.id}/'
+        first = self.client.get(url)
+        
+        with self.assertNumQueries(1):
+            second = self.client.get(url)
+        self.assertEqual(second.data, first.data)
+        
+        Conversation.objects.filter(pk=self.conversation.pk).update(summary='A new summary')
+        self.assertEqual(self.client.get(url).data['conversation']['summary'], 'A new summary')
+    
+    def test_values_serializers_render_like_model_serializers(self):
+        """The values() fast path renders the same JSON as the ModelSerializers it replaces."""
+        Conversation.objects.filter(pk=self.conversation.pk).update(
+            status='ended', end_timestamp=timezone.now(), summary='Summary', topics=['a', 'b'], sentiment='positive'
+        )
+        Message.objects.create(conversation=self.conversation, content='Reply', sender='ai', tokens_used=12)
+        conversation = annotate_list_fields(Conversation.objects.all()).get()
+        render = JSONRenderer().render
+        
+        self.assertEqual(
+            render(ConversationListValuesSerializer().serialize(
+                ConversationListValuesSerializer().values(annotate_list_fields(Conversation.objects.all()))
+            )),
+            render(ConversationListSerializer([conversation], many=True).data)
+        )
+        self.assertEqual(
+            render(self.client.get(f'/api/conversations/{conversation.id}/?exclude=messages').data['conversation']),
+            render(ConversationRetrieveSerializer(conversation).data)
+        )
+        expected = MessageSerializer(conversation.messages.all(), many=True).data
+        for message in expected:
+            del message['conversation']
+        self.assertEqual(
+            render(self.client.get(f'/api/conversations/{conversation.id}/messages/').data['messages']),
+            render(expected)
+        )
+    
+    def test_sparse_fieldsets(self):
+        """?fields= and ?exclude= select response fields; unknown names are rejected."""
+        listed = self.client.get('/api/conversations/', {'fields': 'id,title'}).data['conversations']
+        self.assertEqual(listed, [{'id': self.conversation.id, 'title': 'Test Conversation'}])
+        listed = self.client.get('/api/conversations/', {'exclude': 'last_message,topics'}).data['conversations']
+        self.assertNotIn('last_message', listed[0])
+        self.assertIn('message_count', listed[0])
+        
+        url = f'/api/conversations/{self.conversation.id}/'
+        self.assertEqual(set(self.client.get(url, {'fields': 'title,version'}).data['conversation']),
+                         {'title', 'version'})
+        detail = self.client.get(url, {'fields': 'id,messages'}).data['conversation']
+        self.assertEqual(set(detail), {'id', 'messages', 'messages_next'})
+        messages = self.client.get(f'{url}messages/', {'fields': 'content'}).data['messages']
+        self.assertEqual(messages, [{'content': 'Test message'}])
+        
+        self.assertEqual(self.client.get(url, {'fields': 'title,secret'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+    
+    def test_changes_returns_only_what_changed_since_a_version(self):
+        """Versions move with every change; changes() answers with the delta, or unchanged."""
+        url = f'/api/conversations/{self.conversation.id}/changes/'
+        version = self.client.get(f'/api/conversations/{self.conversation.id}/').data['conversation']['version']
+        self.assertEqual(version, 1)
+        
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'since': version})
+        self.assertEqual(response.data, {'success': True, 'changed': False, 'version': version})
+        
+        Message.objects.create(conversation=self.conversation, content='New message', sender='user')
+        Conversation.objects.filter(pk=self.conversation.pk).update(title='Renamed')
+        # Columns clients do not show leave the version alone
+        Conversation.objects.filter(pk=self.conversation.pk).update(context_summary='Earlier turns')
+        
+        response = self.client.get(url, {'since': version})
+        self.assertTrue(response.data['changed'])
+        self.assertFalse(response.data['reset'])
+        self.assertEqual(response.data['version'], 3)
+        self.assertEqual(response.data['conversation']['title'], 'Renamed')
+        self.assertEqual([m['content'] for m in response.data['messages']], ['New message'])
+        
+        self.assertTrue(self.client.get(url, {'since': 99}).data['reset'])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/api/conversations/0/changes/', {'since': 0}).status_code,
+                         status.HTTP_404_NOT_FOUND)
 
 
 class MessageAPITest(APITestCase):
@@ -180,6 +437,1487 @@ class MessageAPITest(APITestCase):
         pass
 
 
+def sse_events(response):
+    """Parse an SSE response into a list of (event, data) tuples."""
+    body = b''.join(response.streaming_content).decode()
+    events = []
+    for block in body.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+class StreamingMessageAPITest(APITestCase):
+    """Test cases for the Server-Sent Events chat endpoint."""
+    
+    url = '/api/conversations/send_message_stream/'
+    
+    def setUp(self):
+        """Set up test data and a stub AI service."""
+        self.conversation = Conversation.objects.create(status="active")
+        self.ai_service = MagicMock(model='stub-model')
+        patcher = patch('conversations.views.get_ai_service', return_value=self.ai_service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def _stream(self, *chunks):
+        """Make chat_stream yield the given chunks."""
+        self.ai_service.chat_stream.side_effect = lambda messages: (chunk for chunk in chunks)
+    
+    def test_streams_tokens_and_persists_ai_message(self):
+        """Tokens are emitted as events and the final message is saved."""
+        self._stream(
+            {'delta': 'Hello'},
+            {'delta': ' there'},
+            {'done': True, 'response': 'Hello there', 'tokens_used': 12,
+             'model': 'stub-model', 'error': False},
+        )
+        response = self.client.post(
+            self.url, {'conversation_id': self.conversation.id, 'message': 'Hi'}, format='json'
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = sse_events(response)
+        self.assertEqual([e for e, _ in events], ['user_message', 'token', 'token', 'done'])
+        self.assertEqual(events[1][1], {'delta': 'Hello'})
+        
+        ai_msg = self.conversation.messages.get(sender='ai')
+        self.assertEqual(ai_msg.content, 'Hello there')
+        self.assertEqual(ai_msg.tokens_used, 12)
+        self.assertEqual(ai_msg.model_used, 'stub-model')
+        self.assertEqual(events[-1][1]['ai_response']['id'], ai_msg.id)
+    
+    def test_client_disconnect_saves_partial_response(self):
+        """Closing the stream early keeps the tokens generated so far."""
+        self._stream(
+            {'delta': 'Partial'},
+            {'delta': ' answer'},
+            {'done': True, 'response': 'Partial answer', 'tokens_used': 5,
+             'model': 'stub-model', 'error': False},
+        )
+        view = ConversationViewSet.as_view({'post': 'send_message_stream'})
+        request = APIRequestFactory().post(
+            self.url, {'conversation_id': self.conversation.id, 'message': 'Hi'}, format='json'
+        )
+        response = view(request)
+        stream = iter(response.streaming_content)
+        next(stream)  # user_message
+        next(stream)  # first token
+        # Simulate the WSGI server closing the response when the client goes
+        # away, without letting request_finished close the test transaction.
+        request_finished.disconnect(close_old_connections)
+        try:
+            response.close()
+        finally:
+            request_finished.connect(close_old_connections)
+        
+        ai_msg = self.conversation.messages.get(sender='ai')
+        self.assertEqual(ai_msg.content, 'Partial')
+        self.assertEqual(ai_msg.model_used, 'stub-model')
+    
+    def test_gemini_chunks_without_text_are_skipped(self):
+        """Safety-blocked or finish-only Gemini chunks, whose .text raises, end the stream normally."""
+        class Chunk:
+            def __init__(self, text=None, usage=None):
+                self._text = text
+                self.usage_metadata = usage
+            
+            @property
+            def text(self):
+                if self._text is None:
+                    raise ValueError('The response has no text parts')
+                return self._text
+        
+        gemini_chunks = [Chunk('Hello'), Chunk(), Chunk(usage=MagicMock(total_token_count=7))]
+        service = make_ai_service(lambda messages, stream=False: {'stream': iter(gemini_chunks), 'model': 'gemini-pro'})
+        service.provider = 'gemini'
+        
+        chunks = list(service.chat_stream([{'role': 'user', 'content': 'Hi'}]))
+        
+        self.assertEqual(chunks[0], {'delta': 'Hello'})
+        self.assertEqual((chunks[-1]['response'], chunks[-1]['tokens_used'], chunks[-1]['error']), ('Hello', 7, False))
+    
+    def test_provider_error_emits_error_event(self):
+        """Provider failures are reported as an error event without an AI message."""
+        self._stream({'done': True, 'response': 'boom', 'error': True, 'model': 'stub-model'})
+        response = self.client.post(
+            self.url, {'conversation_id': self.conversation.id, 'message': 'Hi'}, format='json'
+        )
+        
+        events = sse_events(response)
+        self.assertEqual(events[-1][0], 'error')
+        self.assertFalse(self.conversation.messages.filter(sender='ai').exists())
+    
+    def test_inactive_conversation_rejected(self):
+        """Streaming into an ended conversation returns 400 before streaming."""
+        self.conversation.status = 'ended'
+        self.conversation.save()
+        response = self.client.post(
+            self.url, {'conversation_id': self.conversation.id, 'message': 'Hi'}, format='json'
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncConversationAPITest(TestCase):
+    """Test cases for the async (ASGI) API endpoints."""
+    
+    def setUp(self):
+        """Set up test data and a stub AI service."""
+        self.conversation = Conversation.objects.create(status="active")
+        self.ai_service = MagicMock(model='stub-model')
+        patcher = patch('conversations.async_views.get_ai_service', return_value=self.ai_service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    async def test_send_message(self):
+        """Async send_message saves both messages and awaits the provider."""
+        self.ai_service.achat = AsyncMock(return_value={
+            'response': 'Hi there!', 'tokens_used': 7, 'model': 'stub-model', 'error': False
+        })
+        response = await self.async_client.post(
+            '/api/async/conversations/send_message/',
+            {'conversation_id': self.conversation.id, 'message': 'Hello'},
+            content_type='application/json'
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['ai_response']['content'], 'Hi there!')
+        self.assertEqual(await Message.objects.filter(conversation=self.conversation).acount(), 2)
+        sent = self.ai_service.achat.await_args.args[0]
+        self.assertEqual(sent[-1], {'role': 'user', 'content': 'Hello'})
+        await self.conversation.arefresh_from_db()
+        self.assertEqual(self.conversation.title, 'Hello')
+    
+    async def test_send_message_not_found(self):
+        """Unknown conversations return 404."""
+        response = await self.async_client.post(
+            '/api/async/conversations/send_message/',
+            {'conversation_id': 999999, 'message': 'Hello'},
+            content_type='application/json'
+        )
+        
+        self.assertEqual(response.status_code, 404)
+    
+    async def test_end_conversation(self):
+        """Async end_conversation stores the analysis and ends the conversation."""
+        await Message.objects.acreate(conversation=self.conversation, content='Plan a trip', sender='user')
+        self.ai_service.aanalyze_conversation = AsyncMock(return_value={
+            'results': {'summary': 'A trip plan.', 'topics': ['travel'],
+                        'sentiment': 'positive', 'key_points': ['Book flights']},
+            'errors': {},
+            'timings': {'summary': 0.1, 'topics': 0.1, 'sentiment': 0.1, 'key_points': 0.1},
+        })
+        with self.assertLogs('conversations.analysis', level='INFO'):
+            response = await self.async_client.post(
+                '/api/async/conversations/end_conversation/',
+                {'conversation_id': self.conversation.id},
+                content_type='application/json'
+            )
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['conversation']['summary'], 'A trip plan.')
+        await self.conversation.arefresh_from_db()
+        self.assertEqual(self.conversation.status, 'ended')
+        self.assertEqual(self.conversation.topics, ['travel'])
+
+
+class ChatContextTest(TestCase):
+    """Test cases for the token-budgeted chat context builder."""
+    
+    def setUp(self):
+        """Create a conversation with ten 100-character messages."""
+        self.conversation = Conversation.objects.create(status="active")
+        start = timezone.now()
+        for i in range(10):
+            Message.objects.create(
+                conversation=self.conversation,
+                content=f"{i}".ljust(100, '.'),
+                sender='user' if i % 2 == 0 else 'ai',
+                timestamp=start + timezone.timedelta(seconds=i)
+            )
+        self.ai_service = MagicMock(provider='stub', model='stub-model')
+        self.ai_service.update_summary.return_value = 'Earlier summary.'
+        # System prompt plus four messages
+        self.budget = message_tokens('You are a helpful AI assistant.') + 4 * message_tokens('.' * 100)
+    
+    def _contents(self, ai_messages):
+        return [msg['content'][0] for msg in ai_messages[1:]]
+    
+    def test_short_history_is_sent_verbatim(self):
+        """Everything is sent when the history fits in the budget."""
+        ai_messages = build_chat_messages(self.conversation, self.ai_service)
+        
+        self.assertEqual(ai_messages[0]['role'], 'system')
+        self.assertEqual(self._contents(ai_messages), list('0123456789'))
+        self.assertEqual(ai_messages[1]['role'], 'user')
+        self.assertEqual(ai_messages[2]['role'], 'assistant')
+        self.ai_service.update_summary.assert_not_called()
+    
+    def test_truncate_strategy_keeps_most_recent_turns(self):
+        """Turns that do not fit are dropped, oldest first."""
+        with override_settings(AI_CONTEXT_STRATEGY='truncate',
+                               AI_CONTEXT_TOKEN_BUDGET={'default': self.budget}):
+            ai_messages = build_chat_messages(self.conversation, self.ai_service)
+        
+        self.assertEqual(self._contents(ai_messages), list('6789'))
+        self.ai_service.update_summary.assert_not_called()
+    
+    def test_summary_strategy_folds_older_turns(self):
+        """Older turns are folded into the stored rolling summary."""
+        with override_settings(AI_CONTEXT_STRATEGY='summary',
+                               AI_CONTEXT_TOKEN_BUDGET={'default': self.budget + 100}):
+            ai_messages = build_chat_messages(self.conversation, self.ai_service)
+        
+        folded = self.ai_service.update_summary.call_args.args[1]
+        kept = self._contents(ai_messages)
+        self.assertEqual([m['content'][0] for m in folded] + kept, list('0123456789'))
+        self.assertIn('Earlier summary.', ai_messages[0]['content'])
+        
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.context_summary, 'Earlier summary.')
+        last_folded = self.conversation.messages.get(content__startswith=folded[-1]['content'][0])
+        self.assertEqual(self.conversation.context_summary_until, last_folded.timestamp)
+    
+    def test_summary_is_reused_until_window_fills_again(self):
+        """The next turn reads only unsummarized messages and does not re-fold."""
+        with override_settings(AI_CONTEXT_STRATEGY='summary',
+                               AI_CONTEXT_TOKEN_BUDGET={'default': self.budget + 100}):
+            first = build_chat_messages(self.conversation, self.ai_service)
+            self.conversation.refresh_from_db()
+            Message.objects.create(
+                conversation=self.conversation, content='X', sender='user',
+                timestamp=self.conversation.messages.last().timestamp + timezone.timedelta(seconds=1)
+            )
+            second = build_chat_messages(self.conversation, self.ai_service)
+        
+        self.assertEqual(self.ai_service.update_summary.call_count, 1)
+        self.assertEqual(self._contents(second), self._contents(first) + ['X'])
+    
+    def test_long_unsummarized_history_is_folded_in_bounded_batches(self):
+        """Each summary update gets at most one budget of turns, and catching up spans turns."""
+        with override_settings(AI_CONTEXT_STRATEGY='summary', AI_CONTEXT_FOLD_STEPS=1,
+                               AI_CONTEXT_TOKEN_BUDGET={'default': self.budget}):
+            first = build_chat_messages(self.conversation, self.ai_service)
+            self.conversation.refresh_from_db()
+            second = build_chat_messages(self.conversation, self.ai_service)
+        
+        batches = [[m['content'][0] for m in call.args[1]] for call in self.ai_service.update_summary.call_args_list]
+        self.assertEqual(batches, [list('0123'), list('456')])
+        self.assertEqual(self._contents(first), list('6789'))
+        self.assertEqual(self._contents(second), list('789'))
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.context_summary_until,
+                         self.conversation.messages.get(content__startswith='6').timestamp)
+    
+    async def test_async_builder_folds_with_the_async_client(self):
+        """abuild_chat_messages awaits aupdate_summary instead of blocking on update_summary."""
+        self.ai_service.aupdate_summary = AsyncMock(return_value='Earlier summary.')
+        with override_settings(AI_CONTEXT_STRATEGY='summary',
+                               AI_CONTEXT_TOKEN_BUDGET={'default': self.budget + 100}):
+            ai_messages = await abuild_chat_messages(self.conversation, self.ai_service)
+        
+        folded = self.ai_service.aupdate_summary.await_args.args[1]
+        self.assertEqual([m['content'][0] for m in folded] + self._contents(ai_messages), list('0123456789'))
+        self.assertIn('Earlier summary.', ai_messages[0]['content'])
+        self.ai_service.update_summary.assert_not_called()
+        await self.conversation.arefresh_from_db()
+        self.assertEqual(self.conversation.context_summary, 'Earlier summary.')
+    
+    def test_failed_summary_falls_back_to_truncation(self):
+        """If the summary call fails, older turns are dropped and nothing is stored."""
+        self.ai_service.update_summary.return_value = None
+        with override_settings(AI_CONTEXT_STRATEGY='summary',
+                               AI_CONTEXT_TOKEN_BUDGET={'default': self.budget}):
+            ai_messages = build_chat_messages(self.conversation, self.ai_service)
+        
+        self.assertEqual(self._contents(ai_messages), list('6789'))
+        self.conversation.refresh_from_db()
+        self.assertIsNone(self.conversation.context_summary)
+
+
+def make_ai_service(chat):
+    """Create an AIService whose provider calls go to the given chat function."""
+    with patch.object(AIService, '_initialize_client'):
+        service = AIService()
+    service.model = 'stub-model'
+    service.chat = chat
+    return service
+
+
+class ConversationAnalysisTest(TestCase):
+    """Test cases for the concurrent end-of-conversation analysis."""
+    
+    messages = [
+        {'sender': 'user', 'content': 'I want to plan a trip to Japan.'},
+        {'sender': 'ai', 'content': 'Great, when are you going?'},
+    ]
+    
+    def _reply_for(self, prompt):
+        """Canned provider reply for each analysis prompt."""
+        system = prompt[0]['content']
+        if 'summaries' in system:
+            return 'Trip planning.'
+        if 'topics' in system:
+            return '["travel", "Japan"]'
+        if 'sentiment' in system:
+            return 'positive'
+        return '["Book flights"]'
+    
+    def test_analyses_run_concurrently(self):
+        """Four slow analyses finish in about the time of one."""
+        def chat(prompt, stream=False):
+            time.sleep(0.2)
+            return {'response': self._reply_for(prompt), 'error': False}
+        
+        started = time.perf_counter()
+        analysis = make_ai_service(chat).analyze_conversation(self.messages, timeout=5)
+        elapsed = time.perf_counter() - started
+        
+        self.assertLess(elapsed, 0.6)
+        self.assertEqual(analysis['results'], {
+            'summary': 'Trip planning.',
+            'topics': ['travel', 'Japan'],
+            'sentiment': 'positive',
+            'key_points': ['Book flights'],
+        })
+        self.assertEqual(analysis['errors'], {})
+        self.assertEqual(set(analysis['timings']), {'summary', 'topics', 'sentiment', 'key_points'})
+    
+    def test_slow_and_failed_analyses_keep_partial_results(self):
+        """A timeout or provider error only drops the affected analysis."""
+        def chat(prompt, stream=False):
+            system = prompt[0]['content']
+            if 'sentiment' in system:
+                time.sleep(1)
+            if 'topics' in system:
+                return {'response': 'Error communicating with AI: boom', 'error': True}
+            return {'response': self._reply_for(prompt), 'error': False}
+        
+        analysis = make_ai_service(chat).analyze_conversation(self.messages, timeout=0.3)
+        
+        self.assertEqual(set(analysis['results']), {'summary', 'key_points'})
+        self.assertIn('Timed out', analysis['errors']['sentiment'])
+        self.assertIn('boom', analysis['errors']['topics'])
+        self.assertGreaterEqual(analysis['timings']['sentiment'], 0.3)
+
+    
+    @override_settings(AI_ANALYSIS_MODE='combined')
+    def test_combined_mode_makes_one_call(self):
+        """Combined mode gets every field from a single provider call."""
+        prompts = []
+        
+        def chat(prompt, stream=False):
+            prompts.append(prompt)
+            return {'response': json.dumps({
+                'summary': 'Trip planning.',
+                'topics': ['travel', 'Japan'],
+                'sentiment': 'Positive',
+                'key_points': ['Book flights'],
+            }), 'error': False}
+        
+        analysis = make_ai_service(chat).analyze_conversation(self.messages, timeout=5)
+        
+        self.assertEqual(len(prompts), 1)
+        self.assertEqual(prompts[0][1]['content'].count('plan a trip to Japan'), 1)
+        self.assertEqual(analysis['results'], {
+            'summary': 'Trip planning.',
+            'topics': ['travel', 'Japan'],
+            'sentiment': 'positive',
+            'key_points': ['Book flights'],
+        })
+        self.assertEqual(analysis['errors'], {})
+        self.assertEqual(list(analysis['timings']), ['combined'])
+    
+    @override_settings(AI_ANALYSIS_MODE='combined')
+    def test_combined_mode_reruns_only_invalid_fields(self):
+        """Fields that fail validation fall back to their own analysis call."""
+        prompts = []
+        
+        def chat(prompt, stream=False):
+            prompts.append(prompt[0]['content'])
+            if len(prompts) == 1:
+                response = '```json\n{"summary": "Trip planning.", "topics": "travel", "key_points": ["Book flights"]}\n```'
+                return {'response': response, 'error': False}
+            return {'response': self._reply_for(prompt), 'error': False}
+        
+        analysis = make_ai_service(chat).analyze_conversation(self.messages, timeout=5)
+        
+        self.assertEqual(len(prompts), 3)
+        self.assertEqual(analysis['results']['summary'], 'Trip planning.')
+        self.assertEqual(analysis['results']['topics'], ['travel', 'Japan'])
+        self.assertEqual(analysis['results']['sentiment'], 'positive')
+        self.assertEqual(set(analysis['timings']), {'combined', 'topics', 'sentiment'})
+
+
+
+@override_settings(AI_MAP_REDUCE={'default': {'chunk_tokens': 110, 'parallelism': 2}}, CACHES=LOCMEM_CACHES)
+class MapReduceAnalysisTest(TestCase):
+    """Test cases for the chunked map-reduce analysis of long conversations."""
+    
+    def setUp(self):
+        """Start from an empty chunk cache and a 20 message conversation (4 chunks)."""
+        cache.clear()
+        self.messages = [
+            {'sender': 'user' if i % 2 == 0 else 'ai', 'content': f'Message {i:02d} about planning the trip. ' * 2}
+            for i in range(20)
+        ]
+        self.map_calls = []
+        self.prompts = []
+        self.in_flight = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+    
+    def chat(self, prompt, stream=False):
+        """Stub provider: condenses chunks slowly, answers analyses instantly."""
+        if 'condenses one part' not in prompt[0]['content']:
+            self.prompts.append(prompt[1]['content'])
+            return {'response': '["x"]', 'error': False}
+        with self.lock:
+            self.map_calls.append(prompt[1]['content'])
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        time.sleep(0.05)
+        with self.lock:
+            self.in_flight -= 1
+        return {'response': f'Condensed chunk {len(self.map_calls)}.', 'error': False}
+    
+    def test_long_transcript_is_condensed_in_parallel_chunks(self):
+        """Chunks are condensed with bounded parallelism and the analyses see only the condensed text."""
+        service = make_ai_service(self.chat)
+        analysis = service.analyze_conversation(self.messages, timeout=5)
+        
+        self.assertEqual(len(self.map_calls), 4)
+        self.assertEqual(self.peak, 2)
+        self.assertEqual(len(self.prompts), 4)
+        for prompt in self.prompts:
+            self.assertIn('part 4 of 4 (condensed)', prompt)
+            self.assertNotIn('Message 00', prompt)
+        self.assertIn('map', analysis['timings'])
+        self.assertEqual(analysis['results']['key_points'], ['x'])
+    
+    def test_reanalysis_only_condenses_changed_chunks(self):
+        """Cached chunk summaries are reused when the conversation grows."""
+        service = make_ai_service(self.chat)
+        service.extract_key_points(self.messages)
+        self.assertEqual(len(self.map_calls), 4)
+        
+        self.messages.append({'sender': 'user', 'content': 'One more thing.'})
+        service.extract_key_points(self.messages)
+        
+        self.assertEqual(len(self.map_calls), 5)
+        self.assertIn('One more thing.', self.map_calls[-1])
+    
+    def test_condensing_that_does_not_converge_fails(self):
+        """Rounds that do not shorten the transcript, or too many rounds, raise instead of looping."""
+        def echo(prompt, stream=False):
+            self.map_calls.append(prompt)
+            return {'response': prompt[1]['content'], 'error': False}
+        
+        async def aecho(prompt):
+            return echo(prompt)
+        
+        service = make_ai_service(echo)
+        service.achat = aecho
+        with self.assertRaisesMessage(AIServiceError, 'did not shorten'):
+            service.condense_transcript(self.messages)
+        self.assertEqual(len(self.map_calls), 4)
+        cache.clear()
+        with self.assertRaisesMessage(AIServiceError, 'did not shorten'):
+            asyncio.run(service.acondense_transcript(self.messages))
+        self.assertEqual(len(self.map_calls), 8)
+        
+        cache.clear()
+        service.chat = lambda prompt, stream=False: {'response': 'Condensed. ' * 20, 'error': False}
+        with override_settings(AI_MAP_REDUCE={'default': {'chunk_tokens': 110, 'parallelism': 2, 'max_rounds': 1}}):
+            with self.assertRaisesMessage(AIServiceError, 'after 1 condensing rounds'):
+                service.condense_transcript(self.messages)
+        self.assertEqual(service.generate_summary(self.messages), 'Summary generation failed')
+    
+    def test_short_transcript_skips_map_step(self):
+        """Conversations that fit in one chunk are analyzed directly."""
+        analysis = make_ai_service(self.chat).analyze_conversation(self.messages[:2], timeout=5)
+        
+        self.assertEqual(self.map_calls, [])
+        self.assertNotIn('map', analysis['timings'])
+
+
+
+@override_settings(AI_RUNNING_SUMMARY_INTERVAL=2)
+class RunningSummaryTest(APITestCase):
+    """Test cases for the live summary of active conversations."""
+    
+    def setUp(self):
+        """Set up a conversation with two messages and a stub AI service."""
+        self.conversation = Conversation.objects.create(status="active")
+        self.start = timezone.now() - timedelta(hours=1)
+        for i, sender in enumerate(['user', 'ai']):
+            self._add(i, sender)
+        self.ai_service = MagicMock(model='stub-model')
+        self.ai_service.update_running_analysis.return_value = {'summary': 'Trip planning.', 'topics': ['travel']}
+        patcher = patch('conversations.running_summary.get_ai_service', return_value=self.ai_service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def _add(self, i, sender='user'):
+        return Message.objects.create(
+            conversation=self.conversation, content=f'Message {i}', sender=sender,
+            timestamp=self.start + timedelta(seconds=i)
+        )
+    
+    def test_update_only_sends_new_messages(self):
+        """Each update folds in the messages since the previous one."""
+        self.assertTrue(update_running_summary(self.conversation.id))
+        self._add(2)
+        self.ai_service.update_running_analysis.return_value = {'summary': 'Trip to Japan.', 'topics': ['travel', 'Japan']}
+        self.assertTrue(update_running_summary(self.conversation.id))
+        
+        previous_summary, previous_topics, messages = self.ai_service.update_running_analysis.call_args.args
+        self.assertEqual(previous_summary, 'Trip planning.')
+        self.assertEqual(previous_topics, ['travel'])
+        self.assertEqual([msg['content'] for msg in messages], ['Message 2'])
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.running_summary, 'Trip to Japan.')
+        self.assertEqual(self.conversation.running_topics, ['travel', 'Japan'])
+        self.assertFalse(update_running_summary(self.conversation.id))
+    
+    def test_end_conversation_analyzes_only_the_delta(self):
+        """The final analysis sees the running summary plus the later messages."""
+        update_running_summary(self.conversation.id)
+        self._add(2)
+        self.conversation.refresh_from_db()
+        
+        messages = analysis_messages(self.conversation)
+        
+        self.assertEqual([msg['content'] for msg in messages], ['Trip planning.', 'Message 2'])
+    
+    def test_send_message_schedules_update_every_interval(self):
+        """An update is scheduled once the interval's worth of new messages has arrived."""
+        update_running_summary(self.conversation.id)
+        ai_service = MagicMock(model='stub-model')
+        ai_service.chat.return_value = {'response': 'Sure.', 'tokens_used': 3, 'model': 'stub-model', 'error': False}
+        
+        with patch('conversations.views.get_ai_service', return_value=ai_service), \
+                patch('conversations.views.build_chat_messages', return_value=[]), \
+                patch('conversations.running_summary._submit') as submit, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/conversations/send_message/',
+                {'conversation_id': self.conversation.id, 'message': 'Next question'},
+                format='json'
+            )
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        submit.assert_called_once_with(self.conversation.id)
+
+
+class EndConversationAPITest(APITestCase):
+    """Test cases for ending a conversation."""
+    
+    url = '/api/conversations/end_conversation/'
+    
+    def setUp(self):
+        """Set up test data and a stub AI service."""
+        self.conversation = Conversation.objects.create(status="active")
+        Message.objects.create(conversation=self.conversation, content="Hello", sender="user")
+        self.ai_service = MagicMock(model='stub-model')
+        patcher = patch('conversations.views.get_ai_service', return_value=self.ai_service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_partial_analysis_still_ends_conversation(self):
+        """Successful analyses are saved and failures reported in the response."""
+        self.ai_service.analyze_conversation.return_value = {
+            'results': {'summary': 'Greeting.', 'topics': ['greetings']},
+            'errors': {'sentiment': 'Timed out after 60s', 'key_points': 'boom'},
+            'timings': {'summary': 1.0, 'topics': 1.2, 'sentiment': 60.0, 'key_points': 0.5},
+        }
+        with self.assertLogs('conversations.analysis', level='INFO') as logs:
+            response = self.client.post(self.url, {'conversation_id': self.conversation.id}, format='json')
+        
+        self.assertIn('sentiment=60.00s', logs.output[0])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['analysis']['errors']['key_points'], 'boom')
+        self.assertEqual(response.data['analysis']['timings']['sentiment'], 60.0)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.status, 'ended')
+        self.assertEqual(self.conversation.summary, 'Greeting.')
+        self.assertIsNone(self.conversation.sentiment)
+        self.assertEqual(self.conversation.key_points, [])
+    
+    def test_failed_analysis_keeps_conversation_active(self):
+        """If every analysis fails the conversation is left active for a retry."""
+        self.ai_service.analyze_conversation.return_value = {
+            'results': {},
+            'errors': {name: 'boom' for name in ('summary', 'topics', 'sentiment', 'key_points')},
+            'timings': {name: 0.1 for name in ('summary', 'topics', 'sentiment', 'key_points')},
+        }
+        with self.assertLogs('conversations.analysis', level='WARNING'):
+            response = self.client.post(self.url, {'conversation_id': self.conversation.id}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.status, 'active')
+
+
+
+@override_settings(ANALYSIS_QUEUE_ENABLED=True, ANALYSIS_JOB_MAX_ATTEMPTS=2, ANALYSIS_JOB_RETRY_BACKOFF=30)
+class AnalysisJobQueueTest(APITestCase):
+    """Test cases for the queued end_conversation flow and the analysis worker."""
+    
+    def setUp(self):
+        """Set up a conversation and a stub AI service for the worker."""
+        self.conversation = Conversation.objects.create(status="active")
+        Message.objects.create(conversation=self.conversation, content="Hello", sender="user")
+        self.ai_service = MagicMock(model='stub-model')
+        self.ai_service.analyze_conversation.return_value = {
+            'results': {'summary': 'Greeting.', 'topics': ['greetings']},
+            'errors': {},
+            'timings': {'summary': 1.0, 'topics': 1.0},
+        }
+        patcher = patch('conversations.jobs.get_ai_service', return_value=self.ai_service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def _end(self):
+        return self.client.post(
+            '/api/conversations/end_conversation/',
+            {'conversation_id': self.conversation.id},
+            format='json'
+        )
+    
+    def test_end_conversation_queues_job(self):
+        """Ending returns 202 with a pollable job, and ending again reuses it."""
+        response = self._end()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['job']['status'], 'queued')
+        self.assertEqual(self._end().data['job']['id'], response.data['job']['id'])
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.status, 'ending')
+        self.ai_service.analyze_conversation.assert_not_called()
+        
+        poll = self.client.get(response.data['status_url'])
+        self.assertEqual(poll.status_code, status.HTTP_200_OK)
+        self.assertEqual(poll.data['job']['status'], 'queued')
+    
+    def test_worker_runs_job(self):
+        """A claimed job stores the analysis and ends the conversation."""
+        self._end()
+        job = claim_job('worker-1')
+        with self.assertLogs('conversations.analysis', level='INFO'):
+            self.assertTrue(run_job(job, 'worker-1'))
+        
+        job.refresh_from_db()
+        self.conversation.refresh_from_db()
+        self.assertEqual(job.status, 'succeeded')
+        self.assertEqual(self.conversation.status, 'ended')
+        self.assertEqual(self.conversation.summary, 'Greeting.')
+        self.assertIsNotNone(self.conversation.end_timestamp)
+        self.assertIsNone(claim_job('worker-1'))
+    
+    def test_failed_job_retries_with_backoff_then_fails(self):
+        """Failures are retried after a backoff, and the conversation reopens after the last attempt."""
+        self.ai_service.analyze_conversation.side_effect = RuntimeError('provider down')
+        self._end()
+        
+        with self.assertLogs('conversations.jobs', level='WARNING'):
+            job = claim_job('worker-1')
+            run_job(job, 'worker-1')
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertGreaterEqual(job.run_after, timezone.now() + timedelta(seconds=29))
+        self.assertIsNone(claim_job('worker-1'))
+        
+        AnalysisJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        with self.assertLogs('conversations.jobs', level='WARNING'):
+            job = claim_job('worker-1')
+            run_job(job, 'worker-1')
+        job.refresh_from_db()
+        self.conversation.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.attempts, 2)
+        self.assertIn('provider down', job.last_error)
+        self.assertEqual(self.conversation.status, 'active')
+        self.assertIsNone(self.conversation.end_timestamp)
+    
+    def test_expired_lease_is_reclaimed_and_stale_worker_is_fenced(self):
+        """A crashed worker's job is picked up again, and its late result is discarded."""
+        self._end()
+        stale = claim_job('worker-1', lease_seconds=0)
+        fresh = claim_job('worker-2')
+        self.assertEqual(fresh.pk, stale.pk)
+        self.assertEqual(fresh.attempts, 2)
+        
+        with self.assertLogs('conversations.analysis', level='INFO'):
+            self.assertFalse(run_job(stale, 'worker-1'))
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.status, 'ending')
+        
+        with self.assertLogs('conversations.analysis', level='INFO'):
+            self.assertTrue(run_job(fresh, 'worker-2'))
+        fresh.refresh_from_db()
+        self.assertEqual(fresh.status, 'succeeded')
+
+
+
+class VectorSearchTest(APITestCase):
+    """Test cases for embeddings and the vector index behind query_conversations."""
+    
+    def setUp(self):
+        """Start every test with an index loaded from this test's data."""
+        cache.clear()
+        reset_vector_index()
+        self.addCleanup(reset_vector_index)
+        self.now = timezone.now()
+    
+    def _ended(self, title, summary, topics, days_ago=0):
+        conversation = Conversation.objects.create(
+            title=title, summary=summary, topics=topics, status='ended',
+            start_timestamp=self.now - timedelta(days=days_ago)
+        )
+        embed_conversation(conversation)
+        return conversation
+    
+    def test_hashing_embedder_ranks_related_text_higher(self):
+        """Texts sharing words are more similar than unrelated texts."""
+        embedder = HashingEmbedder()
+        query, related, unrelated = embedder.embed([
+            'planning a trip to Japan',
+            'User planned a trip to Japan in spring',
+            'Debugging a Python memory leak',
+        ])
+        self.assertAlmostEqual(float(np.linalg.norm(related)), 1.0, places=5)
+        self.assertGreater(query @ related, query @ unrelated + 0.2)
+    
+    def test_index_top_k_with_updates_and_date_filter(self):
+        """The index returns the best matches first and reflects adds, replaces and removes."""
+        index = VectorIndex(dim=3)
+        index.add(1, self.now, [1, 0, 0])
+        index.add(2, self.now - timedelta(days=10), [0.8, 0.6, 0])
+        index.add(3, self.now, [0, 1, 0])
+        
+        self.assertEqual([cid for cid, _ in index.search([1, 0, 0], 2)], [1, 2])
+        self.assertEqual(index.search([1, 0, 0], 5, date_to=self.now - timedelta(days=1))[0][0], 2)
+        
+        index.add(1, self.now, [0, 0, 1])
+        self.assertTrue(index.remove(2))
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.search([1, 0, 0], 5), [])
+        self.assertEqual(index.search([0, 1, 0], 5), [(3, 1.0)])
+    
+    def test_sync_drops_conversations_no_longer_served(self):
+        """Conversations deleted or reopened without this process seeing it leave the index on sync."""
+        japan = self._ended('Trip to Japan', 'Planning a spring trip to Japan.', ['travel'])
+        visa = self._ended('Japan visa', 'Visa requirements for Japan.', ['travel'])
+        python = self._ended('Python debugging', 'Fixing a memory leak.', ['python'])
+        index = get_vector_index()
+        self.assertEqual(len(index), 3)
+        
+        # Deleted in another process, whose post_delete never reaches this one
+        with patch('conversations.vector_index._index', None):
+            japan.delete()
+        Conversation.objects.filter(id=visa.id).update(status='active')
+        index.sync()
+        
+        self.assertEqual(len(index), 1)
+        self.assertEqual([cid for cid, _ in index.search(HashingEmbedder().embed_one('Japan'), 5)], [])
+        self.assertIn(python.id, index)
+    
+    def test_query_conversations_uses_vector_search(self):
+        """The most similar ended conversations are sent to the AI and returned."""
+        japan = self._ended('Trip to Japan', 'Planning a spring trip to Japan and Kyoto.', ['travel', 'Japan'])
+        self._ended('Python debugging', 'Fixing a memory leak in a Python service.', ['python', 'debugging'])
+        old = self._ended('Japan visa', 'Visa requirements for a trip to Japan.', ['travel', 'Japan'], days_ago=30)
+        ai_service = MagicMock()
+        ai_service.query_conversations.return_value = {'answer': 'You planned a trip to Japan.'}
+        
+        with patch('conversations.views.get_ai_service', return_value=ai_service):
+            response = self.client.post('/api/conversations/query_conversations/', {
+                'query': 'trip to Japan',
+                'date_from': (self.now - timedelta(days=7)).isoformat(),
+            }, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = [conv['id'] for conv in response.data['relevant_conversations']]
+        self.assertEqual(ids[0], japan.id)
+        self.assertNotIn(old.id, ids)
+        self.assertEqual(response.data['answer'], 'You planned a trip to Japan.')
+    
+    @override_settings(AI_VECTOR_INDEX_REFRESH=3600)
+    def test_query_count_does_not_grow_with_corpus(self):
+        """One full-text query ranks, and only the top results are loaded, with their messages prefetched."""
+        def search():
+            return find_relevant_conversations('trip to Japan', 3)
+        
+        for size in (5, 50):
+            for i in range(size - Conversation.objects.count()):
+                conversation = self._ended(f'Trip to Japan {i}', 'Planning a trip to Japan.', ['travel'])
+                Message.objects.bulk_create(
+                    Message(conversation=conversation, content=f'Japan message {n}', sender='user')
+                    for n in range(3)
+                )
+            reset_vector_index()
+            search()  # Load the index
+            
+            with self.assertNumQueries(3):
+                results = search()
+            self.assertEqual(len(results), 3)
+            self.assertEqual(results[0]['message_count'], 3)
+
+
+class HybridRetrievalTest(APITestCase):
+    """Test cases for fused lexical and vector ranking in query_conversations."""
+    
+    def setUp(self):
+        """One conversation only in the vector index, one only matching full-text search."""
+        cache.clear()
+        reset_vector_index()
+        self.addCleanup(reset_vector_index)
+        self.vector_only = Conversation.objects.create(
+            title='Kyoto itinerary', summary='Temples to visit in Kyoto.', topics=['travel'], status='ended'
+        )
+        embed_conversation(self.vector_only)
+        # No embedding, so only full-text search can find it
+        self.lexical_only = Conversation.objects.create(
+            title='Packing list', summary='What to pack for Kyoto in winter.', status='ended'
+        )
+    
+    def test_reciprocal_rank_fusion_favours_results_in_both_lists(self):
+        """A result ranked by both retrievers beats one ranked first by only one of them."""
+        fused = reciprocal_rank_fusion([[(1, 9.0), (2, 5.0)], [(3, 0.9), (2, 0.8)]])
+        
+        self.assertEqual([key for key, _ in fused], [2, 1, 3])
+        self.assertAlmostEqual(fused[0][1], 2 / 62)
+    
+    def test_both_retrievers_contribute_and_stages_are_timed(self):
+        """Hits from either retriever are returned, with per-stage latency metadata."""
+        ai_service = MagicMock()
+        ai_service.query_conversations.return_value = {'answer': 'Pack warm clothes.'}
+        
+        with patch('conversations.views.get_ai_service', return_value=ai_service):
+            response = self.client.post('/api/conversations/query_conversations/', {
+                'query': 'Kyoto'
+            }, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = {conv['id'] for conv in response.data['relevant_conversations']}
+        self.assertEqual(ids, {self.vector_only.id, self.lexical_only.id})
+        timings = response.data['metadata']['timings_ms']
+        self.assertEqual(set(timings), {'cache', 'vector_sync', 'lexical', 'vector', 'fusion', 'load', 'chunks',
+                                        'answer'})
+    
+    def test_vector_stage_excludes_lexical_and_index_sync(self):
+        """The vector timing covers only embedding and search, not the slower lexical stage."""
+        def slow_keyword_search(*args):
+            time.sleep(0.05)
+            return []
+        
+        timings = {}
+        with patch('conversations.retrieval.keyword_search', slow_keyword_search):
+            rank_conversations('Kyoto', 5, timings=timings)
+        
+        self.assertGreaterEqual(timings['lexical'], 50)
+        self.assertLess(timings['vector'], timings['lexical'])
+        self.assertIn('vector_sync', timings)
+    
+    @override_settings(AI_HYBRID_RERANK=True)
+    def test_rerank_orders_by_query_word_coverage(self):
+        """Reranking puts the conversation covering more of the query's words first."""
+        timings = {}
+        hits = rank_conversations('pack for Kyoto winter', 5, timings=timings)
+        
+        self.assertEqual(hits[0][0], self.lexical_only.id)
+        self.assertIn('rerank', timings)
+
+
+class AnswerCacheTest(APITestCase):
+    """Test cases for the query_conversations answer cache."""
+    
+    def setUp(self):
+        """An empty cache and one ended conversation found by full-text search."""
+        cache.clear()
+        reset_vector_index()
+        self.addCleanup(reset_vector_index)
+        self.conversation = Conversation.objects.create(
+            title='Kyoto itinerary', summary='Temples to visit in Kyoto.', status='ended'
+        )
+        self.ai_service = MagicMock()
+        self.ai_service.query_conversations.return_value = {'answer': 'Visit the temples.'}
+    
+    def _query(self, query, **fields):
+        with patch('conversations.views.get_ai_service', return_value=self.ai_service):
+            return self.client.post('/api/conversations/query_conversations/', {'query': query, **fields},
+                                    format='json')
+    
+    def test_repeated_query_is_answered_from_cache(self):
+        """Queries that normalize the same reuse the answer; a different limit does not."""
+        first = self._query('Which temples in Kyoto?')
+        second = self._query('  which temples in KYOTO ')
+        self._query('Which temples in Kyoto?', limit=3)
+        
+        self.assertFalse(first.data['metadata']['cached'])
+        self.assertTrue(second.data['metadata']['cached'])
+        self.assertEqual(second.data['answer'], 'Visit the temples.')
+        self.assertEqual(second.data['query'], 'which temples in KYOTO')
+        self.assertEqual(self.ai_service.query_conversations.call_count, 2)
+        stats = cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+        self.assertAlmostEqual(stats['hit_rate'], 1 / 3)
+    
+    def test_version_bumped_by_another_process_invalidates(self):
+        """The corpus version lives in the shared cache, so a bump by another worker reaches this one."""
+        self._query('Kyoto')
+        other_worker = caches.create_connection('default')
+        other_worker.add(VERSION_KEY, 0, None)
+        other_worker.incr(VERSION_KEY)
+        
+        self.assertFalse(self._query('Kyoto').data['metadata']['cached'])
+        self.assertEqual(self.ai_service.query_conversations.call_count, 2)
+        self.assertEqual(other_worker.get(MISSES_KEY), 2)
+    
+    def test_ending_or_deleting_a_conversation_invalidates(self):
+        """The corpus version moves when a conversation ends or is deleted, so answers are recomputed."""
+        self._query('Kyoto')
+        active = Conversation.objects.create(title='Kyoto food', status='active')
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_analysis(active, {'results': {'summary': 'Ramen in Kyoto.'}})
+        self._query('Kyoto')
+        with self.captureOnCommitCallbacks(execute=True):
+            active.delete()
+        self._query('Kyoto')
+        
+        self.assertEqual(self.ai_service.query_conversations.call_count, 3)
+        self.assertEqual(cache_stats()['corpus_version'], 2)
+    
+    def test_failed_answer_is_not_cached(self):
+        """A provider error returned as the answer is recomputed on the next request."""
+        self.ai_service.query_conversations.return_value = {'error': True, 'answer': 'Error: rate limited'}
+        self._query('Kyoto temples')
+        self.ai_service.query_conversations.return_value = {'answer': 'Visit the temples.'}
+        second = self._query('Kyoto temples')
+        
+        self.assertFalse(second.data['metadata']['cached'])
+        self.assertEqual(second.data['answer'], 'Visit the temples.')
+        self.assertEqual(self.ai_service.query_conversations.call_count, 2)
+    
+    @override_settings(AI_QUERY_CACHE_SIZE=2)
+    def test_least_recently_used_entry_is_evicted(self):
+        """Past AI_QUERY_CACHE_SIZE entries, the least recently used one is dropped."""
+        self._query('Kyoto temples')
+        self._query('Kyoto gardens')
+        self._query('Kyoto temples')  # Now the most recently used
+        self._query('Kyoto shrines')
+        
+        self.assertTrue(self._query('Kyoto temples').data['metadata']['cached'])
+        self.assertFalse(self._query('Kyoto gardens').data['metadata']['cached'])
+        self.assertEqual(cache_stats()['entries'], 2)
+
+
+class ORJSONRendererTest(TestCase):
+    """Test cases for the orjson-backed renderer and parser."""
+    
+    def test_renders_like_json_renderer(self):
+        """Datetimes, Decimals, arrays and line separators render byte for byte like JSONRenderer."""
+        payload = {
+            'success': True,
+            'timestamp': timezone.now(),
+            'date': timezone.now().date(),
+            'price': Decimal('1.50'),
+            'duration': timedelta(minutes=3),
+            'content': 'caf\u00e9 \u2028 line',
+            'embedding': np.arange(3, dtype=np.float32),
+            'counts': {1: 'one'},
+            'missing': None,
+        }
+        self.assertEqual(ORJSONRenderer().render(payload), JSONRenderer().render(payload))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+    
+    def test_parses_json(self):
+        """Valid JSON parses like JSONParser; malformed JSON and NaN raise ParseError."""
+        body = '{"message": "caf\u00e9", "limit": 5}'.encode('utf-8')
+        self.assertEqual(ORJSONParser().parse(io.BytesIO(body)), {'message': 'caf\u00e9', 'limit': 5})
+        for body in (b'{"message": ', b'{"limit": NaN}'):
+            with self.assertRaises(ParseError):
+                ORJSONParser().parse(io.BytesIO(body))
+
+
+class QueryStreamTest(APITestCase):
+    """Test cases for the Server-Sent Events query_conversations endpoint."""
+    
+    url = '/api/conversations/query_conversations_stream/'
+    
+    def setUp(self):
+        """An empty answer cache, one matching conversation and a streaming stub AI service."""
+        cache.clear()
+        reset_vector_index()
+        self.addCleanup(reset_vector_index)
+        self.conversation = Conversation.objects.create(
+            title='Kyoto itinerary', summary='Temples to visit in Kyoto.', status='ended'
+        )
+        self.ai_service = MagicMock(model='stub-model')
+        self.ai_service.query_conversations_stream.side_effect = lambda query, excerpts: (chunk for chunk in [
+            {'delta': 'Visit'},
+            {'delta': ' temples.'},
+            {'done': True, 'response': 'Visit temples.', 'tokens_used': 7, 'model': 'stub-model', 'error': False},
+        ])
+        patcher = patch('conversations.views.get_ai_service', return_value=self.ai_service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_conversations_are_sent_before_answer_tokens(self):
+        """The first event lists the relevant conversations; the answer follows token by token."""
+        response = self.client.post(self.url, {'query': 'Kyoto'}, format='json')
+        
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = sse_events(response)
+        self.assertEqual([e for e, _ in events], ['conversations', 'token', 'token', 'done'])
+        self.assertEqual([c['id'] for c in events[0][1]['relevant_conversations']], [self.conversation.id])
+        self.assertEqual(events[-1][1]['answer'], 'Visit temples.')
+        self.assertIn('answer', events[-1][1]['metadata']['timings_ms'])
+    
+    def test_streamed_answer_is_cached(self):
+        """A completed stream fills the answer cache, which both endpoints then serve."""
+        sse_events(self.client.post(self.url, {'query': 'Kyoto'}, format='json'))
+        
+        events = sse_events(self.client.post(self.url, {'query': 'kyoto'}, format='json'))
+        response = self.client.post('/api/conversations/query_conversations/', {'query': 'Kyoto'}, format='json')
+        
+        self.assertEqual([e for e, _ in events], ['conversations', 'token', 'done'])
+        self.assertTrue(events[-1][1]['metadata']['cached'])
+        self.assertEqual(response.data['answer'], 'Visit temples.')
+        self.assertEqual(self.ai_service.query_conversations_stream.call_count, 1)
+
+
+class FullTextSearchTest(APITestCase):
+    """Test cases for PostgreSQL full-text search."""
+    
+    def setUp(self):
+        """Create conversations matching on the summary, on a message only, and not at all."""
+        self.now = timezone.now()
+        self.japan = Conversation.objects.create(
+            title='Trip to Japan', status='ended', topics=['travel'],
+            summary='Planning a spring trip to Kyoto to see the cherry blossoms.',
+            start_timestamp=self.now
+        )
+        self.garden = Conversation.objects.create(
+            title='Garden', status='ended', start_timestamp=self.now - timedelta(days=30)
+        )
+        Message.objects.create(conversation=self.garden, content='My cherry tree blossomed early this year.', sender='user')
+        self.python = Conversation.objects.create(
+            title='Python debugging', status='ended', summary='Fixing a memory leak.', start_timestamp=self.now
+        )
+    
+    def test_list_search_ranks_and_highlights(self):
+        """Search matches stemmed words in summaries and messages and highlights them."""
+        response = self.client.get('/api/conversations/', {'search': 'cherry blossoms'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['conversations']
+        self.assertEqual([conv['id'] for conv in results], [self.japan.id, self.garden.id])
+        self.assertIn('<mark>blossoms</mark>', results[0]['highlight'])
+        self.assertIn('<mark>blossomed</mark>', results[1]['highlight'])
+    
+    def test_search_vector_follows_updates(self):
+        """The triggers refresh the search vector when the summary changes."""
+        Conversation.objects.filter(pk=self.python.pk).update(summary='Fixed a leak in the cherry picker.')
+        
+        response = self.client.get('/api/conversations/', {'search': 'cherry -blossoms'})
+        
+        self.assertEqual([conv['id'] for conv in response.data['conversations']], [self.python.id])
+    
+    def test_search_vector_is_only_recomputed_for_searched_columns(self):
+        """Writing a message bumps the conversation's version without recomputing its search vector."""
+        Conversation.objects.filter(pk=self.python.pk).update(search_vector=None)
+        Message.objects.create(conversation=self.python, content='One more leak.', sender='user')
+        self.assertIsNone(Conversation.objects.get(pk=self.python.pk).search_vector)
+        
+        Conversation.objects.filter(pk=self.python.pk).update(title='Python leaks')
+        self.assertIsNotNone(Conversation.objects.get(pk=self.python.pk).search_vector)
+    
+    def test_keyword_search_matches_any_word_within_dates(self):
+        """Natural language queries match any word and respect the date range."""
+        ids = [cid for cid, _ in keyword_search('what did I say about cherry blossoms?', 5)]
+        self.assertEqual(ids, [self.japan.id, self.garden.id])
+        
+        recent = keyword_search('cherry', 5, date_from=self.now - timedelta(days=7))
+        self.assertEqual([cid for cid, _ in recent], [self.japan.id])
+        self.assertEqual(keyword_search('?!', 5), [])
+
+
+class BM25IndexTest(TestCase):
+    """Test cases for the in-process BM25 index."""
+    
+    def setUp(self):
+        """Index a few conversations directly, with a small merge threshold."""
+        self.now = timezone.now()
+        self.index = BM25Index(merge_threshold=4)
+        self.index.set_conversation(1, self.now, True, 'Trip to Japan', 'Cherry blossoms in Kyoto.', ['travel'])
+        self.index.set_conversation(2, self.now - timedelta(days=30), True, 'Garden')
+        self.index.set_conversation(3, self.now, False, 'Still active')
+        self.index.add_message(1, 2, 'My cherry tree blossomed early. The cherry tree is old.')
+        self.index.add_message(2, 1, 'Tree, then cherry: not the phrase.')
+        self.index.add_message(3, 3, 'cherry tree')
+    
+    def test_ranks_ended_conversations_within_dates(self):
+        """Words score with BM25 across headers and messages; filters apply."""
+        self.assertEqual([cid for cid, _ in self.index.search('cherry', 5)], [1, 2])
+        recent = self.index.search('cherry', 5, date_from=self.now - timedelta(days=7))
+        self.assertEqual([cid for cid, _ in recent], [1])
+        self.assertEqual(self.index.search('tokyo', 5), [])
+    
+    def test_phrase_and_prefix_queries(self):
+        """Phrases must occur in order; prefixes expand to vocabulary terms."""
+        self.assertEqual([cid for cid, _ in self.index.search('"cherry tree"', 5)], [2])
+        self.assertEqual({cid for cid, _ in self.index.search('blossom*', 5)}, {1, 2})
+    
+    def test_updates_survive_merges(self):
+        """Replaced and removed documents stop matching, before and after a merge."""
+        self.index.add_message(1, 2, 'Replaced text')
+        self.assertEqual(self.index.search('"cherry tree"', 5), [])
+        self.index.merge()
+        self.assertEqual(self.index.search('"cherry tree"', 5), [])
+        self.assertEqual({cid for cid, _ in self.index.search('replaced blossoms', 5)}, {1, 2})
+        
+        self.index.remove_conversation(2)
+        self.index.merge()
+        self.assertEqual(self.index.search('replaced', 5), [])
+        self.assertEqual(len(self.index), 4)
+    
+    @override_settings(AI_LEXICAL_BACKEND='bm25', AI_VECTOR_INDEX_REFRESH=3600)
+    def test_keyword_search_follows_saves(self):
+        """The index is built from the database and kept current by signals."""
+        reset_bm25_index()
+        self.addCleanup(reset_bm25_index)
+        conversation = Conversation.objects.create(title='Garden', status='ended')
+        Message.objects.create(conversation=conversation, content='Planting tomatoes', sender='user')
+        self.assertEqual([cid for cid, _ in keyword_search('tomatoes', 5)], [conversation.id])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(conversation=conversation, content='And some basil', sender='user')
+            other = Conversation.objects.create(title='Basil pesto recipe', status='active')
+        self.assertEqual([cid for cid, _ in keyword_search('basil', 5)], [conversation.id])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            other.status = 'ended'
+            other.save()
+            conversation.delete()
+        self.assertEqual([cid for cid, _ in keyword_search('basil', 5)], [other.id])
+    
+    def test_sync_removes_conversations_deleted_elsewhere(self):
+        """A conversation deleted in another process leaves the index, messages included, on the next sync."""
+        garden = Conversation.objects.create(title='Garden', status='ended')
+        Message.objects.create(conversation=garden, content='Planting tomatoes', sender='user')
+        soup = Conversation.objects.create(title='Soup with tomatoes', status='ended')
+        index = BM25Index()
+        index.sync()
+        self.assertEqual(len(index.search('tomatoes', 5)), 2)
+        
+        # No post_delete reaches this index
+        garden.delete()
+        index.sync()
+        
+        self.assertEqual([cid for cid, _ in index.search('tomatoes', 5)], [soup.id])
+        self.assertEqual(len(index), 1)
+
+
+class ANNIndexTest(TestCase):
+    """Test cases for the IVF-PQ index and its on-disk format."""
+    
+    def setUp(self):
+        """Clustered unit vectors, and a scratch directory for saved indexes."""
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(20, 32))
+        vectors = centers[rng.integers(0, 20, size=2000)] + 0.3 * rng.normal(size=(2000, 32))
+        self.vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+        self.ids = np.arange(1, 2001)
+        self.now = timezone.now()
+        self.starts = np.where(self.ids % 2, self.now.timestamp(), (self.now - timedelta(days=30)).timestamp())
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+    
+    def _build(self):
+        trained = IVFPQ.train(self.vectors, nlist=20, m=8, train_size=1000)
+        return trained.encode(self.ids, self.starts, self.vectors, built_at=self.now)
+    
+    def test_recall_against_exact_search_after_reload(self):
+        """The memory-mapped index finds the exact top k, with filters and exclusions."""
+        self._build().save(self.directory)
+        index = IVFPQ.load(self.directory)
+        self.assertIsInstance(index.codes, np.memmap)
+        
+        query = self.vectors[0]
+        exact = [int(i) for i in self.ids[np.argsort(-(self.vectors @ query))[:5]]]
+        hits = index.search(query, 5, nprobe=20, rerank=50)
+        self.assertEqual([cid for cid, _ in hits], exact)
+        self.assertAlmostEqual(hits[0][1], 1.0, places=5)
+        
+        recent = index.search(query, 5, nprobe=20, rerank=50, date_from=self.now - timedelta(days=1),
+                              exclude=np.array([1]))
+        self.assertNotIn(1, [cid for cid, _ in recent])
+        self.assertTrue(all(cid % 2 for cid, _ in recent))
+    
+    def test_overlay_adds_replaces_and_removes(self):
+        """Changes since the build shadow the saved index until the next one."""
+        self._build().save(self.directory)
+        index = ANNIndex(32, self.directory)
+        query = self.vectors[0]
+        self.assertEqual(index.search(query, 1)[0][0], 1)
+        
+        index.remove(1)
+        self.assertNotEqual(index.search(query, 1)[0][0], 1)
+        index.add(5000, self.now, query)
+        index.add(2, self.now, -query)
+        hits = [cid for cid, _ in index.search(query, 20)]
+        self.assertEqual(hits[0], 5000)
+        self.assertNotIn(1, hits)
+        self.assertNotIn(2, hits)
+        self.assertEqual(len(index), 2000)
+    
+    def test_save_keeps_recent_versions(self):
+        """Saving prunes the oldest versions only, after the pointer moved, and never the current one."""
+        index = self._build()
+        paths = [index.save(self.directory, keep=2) for _ in range(4)]
+        
+        current = IVFPQ.load(self.directory)
+        self.assertEqual(current.version, os.path.basename(paths[-1]))
+        self.assertEqual([os.path.isdir(path) for path in paths], [False, False, True, True])
+        self.assertEqual(len(current), 2000)
+    
+    @override_settings(AI_VECTOR_INDEX='ivfpq', AI_VECTOR_INDEX_REFRESH=0)
+    def test_build_command_and_search(self):
+        """build_ann_index saves a new version that search picks up; --compact reuses the quantizers."""
+        with override_settings(AI_ANN_INDEX_DIR=self.directory):
+            reset_vector_index()
+            self.addCleanup(reset_vector_index)
+            japan = Conversation.objects.create(title='Trip to Japan', summary='Kyoto in spring', status='ended')
+            embed_conversation(japan)
+            Conversation.objects.create(title='Python', summary='Memory leak', status='ended')
+            
+            call_command('build_ann_index', stdout=open(os.devnull, 'w'))
+            first = IVFPQ.load(self.directory)
+            self.assertEqual(len(first), 1)
+            self.assertIsInstance(get_vector_index(), ANNIndex)
+            self.assertEqual(search_conversations('trip to Japan', 5)[0][0], japan.id)
+            
+            call_command('build_ann_index', '--compact', stdout=open(os.devnull, 'w'))
+            second = IVFPQ.load(self.directory)
+            self.assertNotEqual(second.version, first.version)
+            np.testing.assert_array_equal(second.centroids, first.centroids)
+            self.assertEqual(sorted(os.listdir(self.directory)), sorted(['CURRENT', first.version, second.version]))
+            
+            # Reopened by a bulk update, which sends no signal: hidden from the saved index on sync
+            Conversation.objects.filter(id=japan.id).update(status='active')
+            self.assertNotIn(japan.id, [cid for cid, _ in search_conversations('trip to Japan', 5)])
+
+
+class EmbeddingStorageTest(TestCase):
+    """Test cases for the binary EmbeddingField."""
+    
+    def setUp(self):
+        """A normalized random vector."""
+        vector = np.random.default_rng(0).standard_normal(128).astype(np.float32)
+        self.vector = vector / np.linalg.norm(vector)
+    
+    def test_float32_round_trip_is_exact_and_zero_copy(self):
+        """float32 embeddings decode to a read-only view of the stored bytes."""
+        data = encode_embedding(self.vector)
+        decoded = decode_embedding(data)
+        
+        self.assertEqual(len(data), 4 + 128 * 4)
+        np.testing.assert_array_equal(decoded, self.vector)
+        self.assertFalse(decoded.flags.owndata)
+        self.assertFalse(decoded.flags.writeable)
+    
+    def test_compact_formats_keep_cosine_similarity(self):
+        """float16 and int8 encodings are smaller and nearly preserve the vector."""
+        for dtype, size in (('float16', 4 + 128 * 2), ('int8', 8 + 128)):
+            data = encode_embedding(self.vector, dtype)
+            decoded = decode_embedding(data)
+            self.assertEqual(len(data), size)
+            self.assertEqual(decoded.dtype, np.float32)
+            self.assertGreater(float(decoded @ self.vector) / float(np.linalg.norm(decoded)), 0.999)
+    
+    def test_rows_in_different_formats_load_together(self):
+        """Each stored value records its format, so changing AI_EMBEDDING_DTYPE needs no rewrite."""
+        first = Conversation.objects.create(status='ended', embedding=self.vector, embedding_model='hashing')
+        with override_settings(AI_EMBEDDING_DTYPE='int8'):
+            second = Conversation.objects.create(status='ended', embedding=self.vector.tolist(),
+                                                 embedding_model='hashing')
+        
+        embeddings = dict(Conversation.objects.values_list('id', 'embedding'))
+        np.testing.assert_array_equal(embeddings[first.id], self.vector)
+        np.testing.assert_allclose(embeddings[second.id], self.vector, atol=0.01)
+        index = VectorIndex(128)
+        self.assertEqual(index.sync(), 2)
+
+
+class EmbedConversationsCommandTest(TestCase):
+    """Test cases for the embed_conversations backfill command."""
+    
+    def setUp(self):
+        """Five ended conversations without embeddings and a temporary checkpoint file."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.checkpoint = os.path.join(directory, 'checkpoint.json')
+        self.conversations = [
+            Conversation.objects.create(title=f'Trip {i}', summary='Planning a trip.', status='ended')
+            for i in range(5)
+        ]
+        for conversation in self.conversations:
+            Message.objects.create(conversation=conversation, content='Flights to Japan', sender='user')
+    
+    def _embed(self, *args):
+        call_command('embed_conversations', '--checkpoint', self.checkpoint, '--batch-size', '2', *args,
+                     stdout=open(os.devnull, 'w'))
+    
+    def test_backfill_in_a_process_pool_matches_embed_conversation(self):
+        """Pooled batches store the same vectors as embedding one conversation at a time."""
+        self._embed('--workers', '2')
+        
+        conversation = Conversation.objects.get(id=self.conversations[0].id)
+        self.assertEqual(conversation.embedding_model, 'hashing')
+        np.testing.assert_allclose(conversation.embedding, embed_conversation(conversation), rtol=1e-6)
+        self.assertFalse(Conversation.objects.filter(embedding__isnull=True).exists())
+        self.assertFalse(os.path.exists(self.checkpoint))
+    
+    def test_resumes_after_checkpoint(self):
+        """An interrupted --all run continues after the last conversation it wrote."""
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'job': 'all:hashing', 'after': self.conversations[2].id}, f)
+        
+        self._embed('--all', '--workers', '1')
+        
+        embedded = set(Conversation.objects.filter(embedding__isnull=False).values_list('id', flat=True))
+        self.assertEqual(embedded, {c.id for c in self.conversations[3:]})
+    
+    def test_model_version_is_staged_until_activated(self):
+        """--model-version leaves the served embeddings alone until --activate promotes them, chunks included."""
+        index_chunks(self.conversations[0])
+        Conversation.objects.update(embedding=[1.0], embedding_model='old')
+        ConversationChunk.objects.update(embedding=[1.0], embedding_model='old')
+        
+        self._embed('--model-version', 'hashing', '--workers', '1')
+        conversation = Conversation.objects.get(id=self.conversations[0].id)
+        chunk = conversation.chunks.get()
+        self.assertEqual((conversation.embedding.tolist(), conversation.next_embedding_model), ([1.0], 'hashing'))
+        self.assertEqual(len(conversation.next_embedding), 128)
+        self.assertEqual((chunk.embedding.tolist(), chunk.next_embedding_model), ([1.0], 'hashing'))
+        np.testing.assert_allclose(chunk.next_embedding, HashingEmbedder().embed_one(chunk.text), rtol=1e-6)
+        
+        self._embed('--activate', 'hashing')
+        conversation.refresh_from_db()
+        chunk.refresh_from_db()
+        self.assertEqual(len(conversation.embedding), 128)
+        self.assertEqual((conversation.embedding_model, conversation.next_embedding), ('hashing', None))
+        self.assertEqual(len(chunk.embedding), 128)
+        self.assertEqual((chunk.embedding_model, chunk.next_embedding), ('hashing', None))
+    
+    def test_indexes_only_load_the_configured_embedder(self):
+        """Vectors of another embedder version are not searched, even with a matching dimension."""
+        self._embed('--workers', '1')
+        index_chunks(self.conversations[0])
+        Conversation.objects.filter(id=self.conversations[1].id).update(embedding_model='openai:other')
+        ConversationChunk.objects.update(embedding_model='openai:other')
+        
+        self.assertEqual(VectorIndex(128).sync(), 4)
+        self.assertEqual(retrieve_chunks(self.conversations[0].title, [self.conversations[0].id]), [])
+
+
+class ChunkRetrievalTest(APITestCase):
+    """Test cases for message window retrieval in query_conversations."""
+    
+    def setUp(self):
+        """A long conversation whose answer is deep in the middle, and a short one."""
+        cache.clear()
+        reset_vector_index()
+        self.addCleanup(reset_vector_index)
+        self.trip = Conversation.objects.create(title='Trip planning', summary='Planning a trip.', status='ended')
+        contents = [f'Small talk about the weather number {i}.' for i in range(30)]
+        contents[17] = 'My passport expires in March, so I must renew the passport first.'
+        Message.objects.bulk_create(
+            Message(conversation=self.trip, content=content, sender='user' if i % 2 == 0 else 'ai',
+                    timestamp=timezone.now() + timedelta(seconds=i))
+            for i, content in enumerate(contents)
+        )
+        self.other = Conversation.objects.create(title='Cooking', summary='Pasta recipes.',
+                                                 topics=['cooking'], status='ended')
+        with self.captureOnCommitCallbacks(execute=True):
+            embed_conversation(self.trip)
+            embed_conversation(self.other)
+            self.chunk_count = index_chunks(self.trip)
+    
+    def test_message_windows_overlap_and_cover_the_end(self):
+        """Windows share size - stride messages and the last one ends with the last message."""
+        self.assertEqual(message_windows(list(range(10)), 4, 3), [[0, 1, 2, 3], [3, 4, 5, 6], [6, 7, 8, 9]])
+        self.assertEqual(message_windows(list(range(11)), 4, 3)[-1], [7, 8, 9, 10])
+        self.assertEqual(message_windows(list(range(3)), 4, 3), [[0, 1, 2]])
+        self.assertEqual(self.chunk_count, 7)
+        self.assertEqual(ConversationChunk.objects.filter(conversation=self.trip).count(), 7)
+    
+    def test_prompt_packs_matching_windows_with_citations(self):
+        """The windows that mention the answer are sent, cited by conversation id, within budget."""
+        prompts = []
+        
+        def chat(prompt, stream=False):
+            prompts.append(prompt)
+            return {'response': f'Renew your passport [Conversation {self.trip.id}].'}
+        
+        with patch('conversations.views.get_ai_service', return_value=make_ai_service(chat)):
+            response = self.client.post('/api/conversations/query_conversations/', {
+                'query': 'renew my passport'
+            }, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        context = prompts[0][1]['content']
+        self.assertIn(f'[Conversation {self.trip.id}]', context)
+        self.assertIn('passport expires in March', context)
+        self.assertNotIn('weather number 0.', context)
+        self.assertLess(len(context), 2000)
+    
+    def test_only_ranked_conversations_are_cited(self):
+        """Windows of a conversation that was not ranked never reach the prompt."""
+        cooking = {'id': self.other.id, 'title': 'Cooking', 'summary': 'Pasta recipes.',
+                   'topics': ['cooking'], 'start_timestamp': '2024-01-01T00:00:00Z'}
+        
+        excerpts = query_excerpts('renew my passport', [cooking])
+        
+        self.assertEqual([e['conversation_id'] for e in excerpts], [self.other.id])
+        trip = {**cooking, 'id': self.trip.id}
+        self.assertTrue(any('passport expires' in e['text'] for e in query_excerpts('renew my passport', [trip])))
+    
+    def test_chunks_written_by_another_process_are_retrieved(self):
+        """Chunks are scored from the database, so windows indexed elsewhere are found without a sync."""
+        ConversationChunk.objects.filter(conversation=self.trip).delete()
+        trip = {'id': self.trip.id, 'title': 'Trip planning', 'summary': 'Planning a trip.',
+                'topics': [], 'start_timestamp': '2024-01-01T00:00:00Z'}
+        self.assertEqual(retrieve_chunks('renew my passport', [self.trip.id]), [])
+        
+        # No on-commit callbacks run, as when another worker indexed the conversation
+        index_chunks(self.trip)
+        
+        with self.assertNumQueries(2):
+            chunks = retrieve_chunks('renew my passport', [self.trip.id])
+        self.assertIn('passport expires', chunks[0].text)
+        self.assertTrue(any('passport expires' in e['text'] for e in query_excerpts('renew my passport', [trip])))
+    
+    def test_pack_excerpts_respects_budget_and_falls_back_to_summaries(self):
+        """Chunks fill the budget best first; conversations without chunks add their summary."""
+        chunks = list(ConversationChunk.objects.select_related('conversation').order_by('-position'))
+        conversations = [{'id': self.other.id, 'title': 'Cooking', 'summary': 'Pasta recipes.',
+                          'topics': ['cooking'], 'start_timestamp': '2024-01-01T00:00:00Z'}]
+        
+        excerpts = pack_excerpts(chunks, conversations, budget=200)
+        
+        trip_positions = [e['text'] for e in excerpts if e['conversation_id'] == self.trip.id]
+        self.assertEqual(len(trip_positions), 2)
+        self.assertIn('number 29', trip_positions[-1])
+        self.assertEqual(excerpts[-1]['conversation_id'], self.other.id)
+        self.assertIn('Pasta recipes', excerpts[-1]['text'])
+
+
 # To run these tests:
 # python manage.py test conversations
 
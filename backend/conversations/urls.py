@@ -3,12 +3,17 @@ URL configuration for conversations API.
 """
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ConversationViewSet
+from . import async_views
+from .views import AnalysisJobViewSet, ConversationViewSet
 
 router = DefaultRouter()
 router.register(r'conversations', ConversationViewSet, basename='conversation')
+router.register(r'analysis_jobs', AnalysisJobViewSet, basename='analysis-job')
 
 urlpatterns = [
     path('', include(router.urls)),
+    # Non-blocking variants for ASGI deployments
+    path('async/conversations/send_message/', async_views.send_message, name='async-send-message'),
+    path('async/conversations/end_conversation/', async_views.end_conversation, name='async-end-conversation'),
+    path('async/conversations/query_conversations/', async_views.query_conversations, name='async-query-conversations'),
 ]
-
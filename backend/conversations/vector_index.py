@@ -0,0 +1,301 @@
+"""
+In-process vector index over the embeddings of ended conversations.
+
+The embeddings are kept in one contiguous float32 matrix, so a search is a
+single matrix-vector product followed by a partial sort (argpartition) for
+the top k. The date range filter is a vectorized mask over the conversations'
+start timestamps.
+
+The index is loaded from the database on first use and then kept current
+incrementally:
+
+- add() is called when a conversation ends in this process;
+- remove() is called when a conversation is deleted in this process;
+- every AI_VECTOR_INDEX_REFRESH seconds a search first pulls conversations
+  that other processes ended since the last sync (by updated_at), and drops
+  the ones no longer served: deleted, reopened or re-embedded by another
+  embedder, in another process or by a bulk QuerySet operation that sent
+  no signal. These are found by comparing the index with the ids of the
+  served conversations, a scan of one integer column.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+from typing import List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .embeddings import conversation_text, get_embedder
+from .models import Conversation
+
+
+logger = logging.getLogger(__name__)
+
+# Rows to allocate up front; the matrix doubles when it fills up
+INITIAL_CAPACITY = 1024
+
+# Overlap between incremental syncs, to allow for clock skew and transactions
+# that committed late
+SYNC_OVERLAP = timedelta(seconds=30)
+
+
+class VectorIndex:
+    """Exact cosine top-k index over L2-normalized vectors, keyed by conversation id."""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.size = 0
+        self._matrix = np.zeros((INITIAL_CAPACITY, dim), dtype=np.float32)
+        self._ids = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        # Conversation start times as POSIX timestamps, for date filters
+        self._starts = np.zeros(INITIAL_CAPACITY, dtype=np.float64)
+        self._rows = {}
+        self._lock = threading.Lock()
+        self.synced_at = None
+        self._last_refresh = 0.0
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, conversation_id):
+        return conversation_id in self._rows
+
+    def add(self, conversation_id: int, start_timestamp, vector) -> None:
+        """Insert or replace the vector of a conversation."""
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.shape != (self.dim,):
+            raise ValueError(f'Expected a vector of dimension {self.dim}, got shape {vector.shape}')
+        with self._lock:
+            row = self._rows.get(conversation_id)
+            if row is None:
+                if self.size == len(self._ids):
+                    self._grow()
+                row = self.size
+                self.size += 1
+                self._rows[conversation_id] = row
+                self._ids[row] = conversation_id
+            self._matrix[row] = vector
+            self._starts[row] = start_timestamp.timestamp()
+
+    def remove(self, conversation_id: int) -> bool:
+        """Remove a conversation; the last row is moved into its slot."""
+        with self._lock:
+            row = self._rows.pop(conversation_id, None)
+            if row is None:
+                return False
+            last = self.size - 1
+            if row != last:
+                moved_id = int(self._ids[last])
+                self._matrix[row] = self._matrix[last]
+                self._ids[row] = moved_id
+                self._starts[row] = self._starts[last]
+                self._rows[moved_id] = row
+            self.size = last
+            return True
+
+    def search(self, query_vector, k: int, date_from=None, date_to=None,
+               min_score: float = 0.0) -> List[Tuple[int, float]]:
+        """
+        Find the k conversations most similar to a query vector.
+
+        Args:
+            query_vector: L2-normalized query embedding
+            k: Maximum number of results
+            date_from, date_to: Optional bounds on the conversation start time
+            min_score: Only return results scoring above this cosine similarity
+
+        Returns:
+            List of (conversation id, score), best first
+        """
+        with self._lock:
+            size = self.size
+            matrix = self._matrix[:size]
+            ids = self._ids[:size]
+            starts = self._starts[:size]
+        if size == 0 or k <= 0:
+            return []
+
+        scores = matrix @ np.asarray(query_vector, dtype=np.float32)
+        if date_from is not None:
+            scores[starts < date_from.timestamp()] = -np.inf
+        if date_to is not None:
+            scores[starts > date_to.timestamp()] = -np.inf
+
+        if k < size:
+            top = np.argpartition(scores, -k)[-k:]
+        else:
+            top = np.arange(size)
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(int(ids[i]), float(scores[i])) for i in top if scores[i] > min_score]
+
+    def sync(self, prune: bool = True) -> int:
+        """
+        Load conversations that ended (or changed) since the last sync.
+
+        Args:
+            prune: On incremental syncs, also drop conversations that are no
+                longer served (see prune())
+
+        Returns:
+            Number of conversations added or updated
+        """
+        started = timezone.now()
+        since = self.synced_at - SYNC_OVERLAP if self.synced_at is not None else None
+
+        count = 0
+        for key, start_timestamp, embedding in self.changed_rows(since).iterator(chunk_size=2000):
+            if len(embedding) != self.dim:
+                # Stored by an embedder of another dimension; skipped until re-embedded
+                continue
+            self.add(key, start_timestamp, embedding)
+            count += 1
+        if since is not None and prune:
+            self.prune()
+
+        self.synced_at = started
+        self._last_refresh = time.monotonic()
+        return count
+
+    def served_rows(self):
+        """Conversations whose embeddings are searched: ended, embedded by the configured embedder."""
+        return Conversation.objects.filter(
+            status='ended', embedding__isnull=False, embedding_model=get_embedder().version
+        )
+
+    def changed_rows(self, since):
+        """
+        (id, start timestamp, embedding) rows to load, changed since `since`
+        (None: all). Only embeddings of the configured embedder are loaded,
+        since queries are embedded with it.
+        """
+        rows = self.served_rows()
+        if since is not None:
+            rows = rows.filter(updated_at__gte=since)
+        return rows.values_list('id', 'start_timestamp', 'embedding')
+
+    def live_ids(self) -> np.ndarray:
+        """The ids of the served conversations, read from the database."""
+        return np.fromiter(self.served_rows().values_list('id', flat=True).iterator(chunk_size=10000),
+                           dtype=np.int64)
+
+    def prune(self, live: Optional[np.ndarray] = None) -> int:
+        """
+        Drop conversations that are not in `live` (default: live_ids()).
+
+        Conversations added while the ids are read are kept.
+
+        Returns:
+            Number of conversations removed
+        """
+        with self._lock:
+            indexed = self._ids[:self.size].copy()
+        if live is None:
+            live = self.live_ids()
+        stale = indexed[~np.isin(indexed, live)]
+        for conversation_id in stale:
+            self.remove(int(conversation_id))
+        if len(stale):
+            logger.debug('Pruned %s conversations no longer served', len(stale))
+        return len(stale)
+
+    def refresh_if_stale(self) -> None:
+        """Sync with the database if the last sync is older than AI_VECTOR_INDEX_REFRESH seconds."""
+        if time.monotonic() - self._last_refresh >= settings.AI_VECTOR_INDEX_REFRESH:
+            self.sync()
+
+    def _grow(self):
+        capacity = len(self._ids) * 2
+        for name in ('_matrix', '_ids', '_starts'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+
+# Singleton instance
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_vector_index() -> VectorIndex:
+    """
+    Get the process-wide index, loading it from the database on first use.
+
+    With AI_VECTOR_INDEX = 'ivfpq' this is an ann_index.ANNIndex, which has
+    the same interface.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            if settings.AI_VECTOR_INDEX == 'ivfpq':
+                from .ann_index import ANNIndex
+                index = ANNIndex(get_embedder().dim, settings.AI_ANN_INDEX_DIR)
+            else:
+                index = VectorIndex(get_embedder().dim)
+            started = time.perf_counter()
+            count = index.sync()
+            logger.debug('Loaded %s conversation embeddings in %.2fs', count, time.perf_counter() - started)
+            _index = index
+    return _index
+
+
+def reset_vector_index() -> None:
+    """Drop the process-wide index; it is reloaded on next use."""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def embed_conversation(conversation, save: bool = True) -> Optional[np.ndarray]:
+    """
+    Compute and store the embedding of an ended conversation.
+
+    The conversation is added to this process's index once the current
+    transaction commits. Embedding failures are logged and leave the
+    embedding empty, so they never prevent a conversation from ending.
+
+    Returns:
+        The embedding, or None if it could not be computed
+    """
+    embedder = get_embedder()
+    try:
+        vector = embedder.embed_one(conversation_text(conversation))
+    except Exception:
+        logger.exception('Could not embed conversation %s', conversation.id)
+        return None
+
+    conversation.embedding = vector
+    conversation.embedding_model = embedder.version
+    if save:
+        # Bump updated_at so other processes pick the embedding up on their next sync
+        Conversation.objects.filter(pk=conversation.pk).update(
+            embedding=conversation.embedding, embedding_model=conversation.embedding_model,
+            updated_at=timezone.now()
+        )
+
+    def add_to_index():
+        if _index is not None and conversation.status == 'ended':
+            _index.add(conversation.id, conversation.start_timestamp, vector)
+
+    transaction.on_commit(add_to_index)
+    return conversation.embedding
+
+
+def search_conversations(query: str, limit: int = 5, date_from=None, date_to=None) -> List[Tuple[int, float]]:
+    """
+    Find the ended conversations most similar to a natural language query.
+
+    Returns:
+        List of (conversation id, score), best first
+    """
+    index = get_vector_index()
+    index.refresh_if_stale()
+    return index.search(
+        get_embedder().embed_one(query), limit,
+        date_from=date_from, date_to=date_to,
+        min_score=settings.AI_VECTOR_MIN_SCORE
+    )
@@ -3,23 +3,75 @@ API Views for Chat Portal.
 
 Implements all REST API endpoints for conversation management and AI features.
 """
-from rest_framework import viewsets, status
+import time
+from functools import partial
+
+from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from django.utils import timezone
-from django.db.models import Q
+from rest_framework.reverse import reverse
+from rest_framework.utils.urls import replace_query_param
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 
-from .models import Conversation, Message
+from .models import AnalysisJob, Conversation, Message
 from .serializers import (
+    AnalysisJobSerializer,
     ConversationListSerializer,
     ConversationDetailSerializer,
+    ConversationRetrieveSerializer,
     ConversationCreateSerializer,
+    ConversationListValuesSerializer,
+    ConversationValuesSerializer,
     MessageSerializer,
+    MessageValuesSerializer,
     ChatMessageSerializer,
     EndConversationSerializer,
-    QueryConversationsSerializer
+    QueryConversationsSerializer,
+    annotate_list_fields,
+    message_count_subquery,
+    parse_fieldset
 )
+from . import answer_cache
 from .ai_service import get_ai_service
+from .analysis import analysis_messages, apply_analysis, log_analysis
+from .conditional import cached_detail, conversation_validators, list_validators, not_modified, set_validators
+from .context import build_chat_messages
+from .jobs import enqueue_analysis
+from .pagination import InvalidCursor, keyset_page
+from .renderers import EventStreamRenderer, format_sse
+from .retrieval import query_excerpts, rank_conversations, timed
+from .running_summary import maybe_schedule_running_summary
+from .search import full_text_search, parse_query, search_matches
+
+
+def find_relevant_conversations(query, limit, date_from=None, date_to=None, timings=None):
+    """
+    Find and serialize the ended conversations most relevant to a query.
+    
+    Candidates are ranked by hybrid lexical and vector retrieval (see
+    retrieval.rank_conversations()), so no conversation data is read to
+    score them. Only the top `limit` are loaded, with their messages
+    prefetched in one query. Stage latencies are recorded in `timings`.
+    """
+    timings = {} if timings is None else timings
+    hits = rank_conversations(query, limit, date_from, date_to, timings)
+    conversations = timed(
+        timings, 'load', Conversation.objects.prefetch_related('messages').in_bulk,
+        [conversation_id for conversation_id, _ in hits]
+    )
+    return [
+        ConversationDetailSerializer(conversations[conversation_id]).data
+        for conversation_id, _ in hits
+        # Deleted by another process since the index last synced
+        if conversation_id in conversations
+    ]
+
+
+# Largest page the messages endpoint returns
+MAX_MESSAGE_PAGE_SIZE = 200
 
 
 class ConversationViewSet(viewsets.ModelViewSet):
@@ -34,8 +86,8 @@ class ConversationViewSet(viewsets.ModelViewSet):
         """Return appropriate serializer based on action."""
         if self.action == 'list':
             return ConversationListSerializer
-        elif self.action == 'retrieve':
-            return ConversationDetailSerializer
+        elif self.action in ('retrieve', 'changes'):
+            return ConversationRetrieveSerializer
         elif self.action == 'create':
             return ConversationCreateSerializer
         return ConversationDetailSerializer
@@ -43,8 +95,29 @@ class ConversationViewSet(viewsets.ModelViewSet):
     def list(self, request):
         """
         GET /api/conversations/
-        Retrieve all conversations with basic info.
+        Retrieve a page of conversations with basic info, newest first.
+        
+        Pages hold PAGE_SIZE conversations and are keyset paginated on
+        (start_timestamp, id): `next` links to the following page with a
+        ?cursor=. Search results are ordered by relevance instead and paged
+        with ?page=N. Message counts and last-message previews are
+        annotated, so a page is read in one query, after the query that
+        yields the ETag and the total count (sent on the first page).
+        
+        Honours If-None-Match: an unchanged page returns 304 Not Modified
+        after the ETag query alone (see conditional.py). ?fields= and
+        ?exclude= select the fields returned, and only their columns are
+        read.
         """
+        try:
+            fields = parse_fieldset(request.query_params, ConversationListValuesSerializer.fields)
+        except ValueError as e:
+            return Response({
+                'success': False,
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        serializer = ConversationListValuesSerializer(fields)
+        
         conversations = self.get_queryset()
         
         # Optional filters
@@ -53,37 +126,218 @@ class ConversationViewSet(viewsets.ModelViewSet):
             conversations = conversations.filter(status=status_filter)
         
         search = request.query_params.get('search')
+        search_query = parse_query(search) if search else None
+        
+        matching = conversations.filter(search_matches(search_query)) if search else conversations
+        try:
+            etag, total = list_validators(matching, request.query_params, self.paginator.page_size)
+        except InvalidCursor as e:
+            return Response({
+                'success': False,
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        conversations = annotate_list_fields(conversations)
+        
+        # Full-text search over title, summary, topics and messages, best match first
         if search:
-            conversations = conversations.filter(
-                Q(title__icontains=search) | 
-                Q(summary__icontains=search)
+            conversations = full_text_search(conversations, search_query)
+            page = self.paginate_queryset(serializer.values(conversations, 'highlight'))
+            count = self.paginator.page.paginator.count
+            next_link = self.paginator.get_next_link()
+        else:
+            page, next_cursor = keyset_page(
+                serializer.values(conversations, 'start_timestamp', 'id'), 'start_timestamp',
+                self.paginator.page_size, request.query_params.get('cursor')
             )
+            count = total
+            next_link = self._cursor_link(request.build_absolute_uri(), next_cursor)
         
-        serializer = self.get_serializer(conversations, many=True)
-        return Response({
+        data = serializer.serialize(page)
+        if search:
+            for item, row in zip(data, page):
+                item['highlight'] = row['highlight']
+        
+        return set_validators(Response({
             'success': True,
-            'count': conversations.count(),
-            'conversations': serializer.data
-        })
+            'count': count,
+            'next': next_link,
+            'conversations': data
+        }), etag)
     
     def retrieve(self, request, pk=None):
         """
         GET /api/conversations/{id}/
-        Get a specific conversation with full message history.
+        Get a specific conversation with its newest page of messages.
+        
+        `messages_next` links to the older messages (see messages()).
+        ?fields= and ?exclude= select the fields returned (`messages`
+        included). Honours If-None-Match and If-Modified-Since: an
+        unchanged conversation returns 304 Not Modified after one query, and
+        the response of an ended one is cached (see conditional.py).
         """
         try:
-            conversation = self.get_object()
-            serializer = self.get_serializer(conversation)
+            fields = parse_fieldset(request.query_params, [*ConversationValuesSerializer.fields, 'messages'])
+        except ValueError as e:
             return Response({
+                'success': False,
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            etag, last_modified, conversation_status = conversation_validators(self.get_queryset(), pk)
+            response = not_modified(request, etag, last_modified)
+            if response is not None:
+                return response
+            
+            build = partial(self._retrieve_data, pk, fields)
+            if conversation_status == 'ended':
+                data = cached_detail(etag, request.build_absolute_uri(), build)
+            else:
+                data = build()
+            return set_validators(Response({
                 'success': True,
-                'conversation': serializer.data
-            })
+                'conversation': data
+            }), etag, last_modified)
         except Conversation.DoesNotExist:
             return Response({
                 'success': False,
                 'error': 'Conversation not found'
             }, status=status.HTTP_404_NOT_FOUND)
     
+    def _retrieve_data(self, pk, fields):
+        """Serialize a conversation's `fields`, with its newest page of messages if selected."""
+        serializer = ConversationValuesSerializer([field for field in fields if field != 'messages'])
+        row = serializer.values(
+            self.get_queryset().filter(pk=pk).annotate(message_count=message_count_subquery())
+        ).first()
+        if row is None:
+            raise Http404
+        data = serializer.to_representation(row)
+        if 'messages' in fields:
+            message_serializer = MessageValuesSerializer()
+            messages, next_cursor = keyset_page(
+                message_serializer.values(Message.objects.filter(conversation_id=pk), 'timestamp', 'id'),
+                'timestamp', self.paginator.page_size
+            )
+            data['messages'] = message_serializer.serialize(messages[::-1])
+            data['messages_next'] = self._cursor_link(
+                reverse('conversation-messages', args=[pk], request=self.request), next_cursor
+            )
+        return data
+    
+    @action(detail=True, methods=['get'])
+    def messages(self, request, pk=None):
+        """
+        GET /api/conversations/{id}/messages/
+        Page back through a conversation's messages, newest page first.
+        
+        Keyset paginated on (timestamp, id) over the (conversation,
+        timestamp) index. Messages within a page are in chronological order;
+        `next` links to the page of older messages (?cursor=), and
+        ?limit= sets the page size (default PAGE_SIZE, at most
+        MAX_MESSAGE_PAGE_SIZE). ?fields= and ?exclude= select the message
+        fields returned.
+        """
+        conversation = self.get_object()
+        try:
+            serializer = MessageValuesSerializer(parse_fieldset(request.query_params, MessageValuesSerializer.fields))
+        except ValueError as e:
+            return Response({
+                'success': False,
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', self.paginator.page_size)), MAX_MESSAGE_PAGE_SIZE)
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            return Response({
+                'success': False,
+                'error': 'limit must be a positive integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            messages, next_cursor = keyset_page(
+                serializer.values(conversation.messages.all(), 'timestamp', 'id'), 'timestamp', limit,
+                request.query_params.get('cursor')
+            )
+        except InvalidCursor as e:
+            return Response({
+                'success': False,
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'success': True,
+            'next': self._cursor_link(request.build_absolute_uri(), next_cursor),
+            'messages': serializer.serialize(messages[::-1])
+        })
+    
+    @action(detail=True, methods=['get'])
+    def changes(self, request, pk=None):
+        """
+        GET /api/conversations/{id}/changes/?since=<version>
+        Get what changed in a conversation since the client's copy.
+        
+        `since` is the `version` of the conversation as last loaded. If it
+        is still current, only the version is read and `changed` is false.
+        Otherwise the response holds the conversation fields and the
+        messages added or edited since then, in chronological order. When
+        more than MAX_MESSAGE_PAGE_SIZE messages changed, or `since` is not
+        a version of this conversation, `reset` is true and the client
+        should retrieve the conversation again.
+        """
+        try:
+            since = int(request.query_params['since'])
+            if since < 0:
+                raise ValueError
+        except (KeyError, ValueError):
+            return Response({
+                'success': False,
+                'error': 'since must be a non-negative integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        version = get_object_or_404(self.get_queryset().values_list('version', flat=True), pk=pk)
+        if version == since:
+            return Response({
+                'success': True,
+                'changed': False,
+                'version': version
+            })
+        
+        serializer = ConversationValuesSerializer()
+        conversation = serializer.values(
+            self.get_queryset().filter(pk=pk).annotate(message_count=message_count_subquery())
+        ).first()
+        if conversation is None:
+            raise Http404
+        message_serializer = MessageValuesSerializer()
+        messages = list(message_serializer.values(
+            Message.objects.filter(conversation_id=pk, version__gt=since).order_by('timestamp', 'id')
+        )[:MAX_MESSAGE_PAGE_SIZE + 1])
+        if since > conversation['version'] or len(messages) > MAX_MESSAGE_PAGE_SIZE:
+            return Response({
+                'success': True,
+                'changed': True,
+                'reset': True,
+                'version': conversation['version']
+            })
+        return Response({
+            'success': True,
+            'changed': True,
+            'reset': False,
+            'version': conversation['version'],
+            'conversation': serializer.to_representation(conversation),
+            'messages': message_serializer.serialize(messages)
+        })
+    
+    def _cursor_link(self, url, cursor):
+        """Link to the page after `cursor`, or None on the last page."""
+        return replace_query_param(url, 'cursor', cursor) if cursor else None
+    
     def create(self, request):
         """
         POST /api/conversations/
@@ -141,18 +395,11 @@ class ConversationViewSet(viewsets.ModelViewSet):
                 sender='user'
             )
             
-            # Get conversation history for context
-            messages = conversation.messages.all()
-            ai_messages = [
-                {'role': 'system', 'content': 'You are a helpful AI assistant.'}
-            ]
-            
-            for msg in messages:
-                role = 'user' if msg.sender == 'user' else 'assistant'
-                ai_messages.append({'role': role, 'content': msg.content})
+            # Get conversation history for context, within the token budget
+            ai_service = get_ai_service()
+            ai_messages = build_chat_messages(conversation, ai_service)
             
             # Get AI response
-            ai_service = get_ai_service()
             ai_result = ai_service.chat(ai_messages)
             
             if ai_result.get('error'):
@@ -171,12 +418,8 @@ class ConversationViewSet(viewsets.ModelViewSet):
             )
             
             # Update conversation title if it's the first exchange
-            # use the model helper instead of a non-existent attribute
-            if conversation.get_message_count() == 2 and not conversation.title:
-                # Generate title from first message
-                title = user_message[:50] + ('...' if len(user_message) > 50 else '')
-                conversation.title = title
-                conversation.save()
+            self._update_title(conversation, user_message)
+            maybe_schedule_running_summary(conversation)
             
             return Response({
                 'success': True,
@@ -196,6 +439,104 @@ class ConversationViewSet(viewsets.ModelViewSet):
                 'error': f'Error processing message: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    @action(detail=False, methods=['post'], renderer_classes=[JSONRenderer, EventStreamRenderer])
+    def send_message_stream(self, request):
+        """
+        POST /api/conversations/send_message_stream/
+        Send a message and stream the AI response as Server-Sent Events.
+        
+        Request body is the same as send_message. The response emits:
+        - event: user_message  (the saved user message)
+        - event: token         ({"delta": "..."} for every generated fragment)
+        - event: done          ({"ai_response": {...}} once the AI message is saved)
+        - event: error         ({"success": false, "error": "..."} on provider failure)
+        
+        If the client disconnects mid-stream, the partial AI response is saved.
+        """
+        serializer = ChatMessageSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                'success': False,
+                'errors': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        conversation_id = serializer.validated_data['conversation_id']
+        user_message = serializer.validated_data['message']
+        
+        try:
+            conversation = Conversation.objects.get(id=conversation_id)
+        except Conversation.DoesNotExist:
+            return Response({
+                'success': False,
+                'error': 'Conversation not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        if conversation.status != 'active':
+            return Response({
+                'success': False,
+                'error': 'Conversation is not active'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        user_msg = Message.objects.create(
+            conversation=conversation,
+            content=user_message,
+            sender='user'
+        )
+        ai_service = get_ai_service()
+        ai_messages = build_chat_messages(conversation, ai_service)
+        
+        def event_stream():
+            parts = []
+            final = {}
+            ai_msg = None
+            chunks = ai_service.chat_stream(ai_messages)
+            try:
+                yield format_sse('user_message', MessageSerializer(user_msg).data)
+                for chunk in chunks:
+                    if chunk.get('done'):
+                        final = chunk
+                        break
+                    parts.append(chunk['delta'])
+                    yield format_sse('token', {'delta': chunk['delta']})
+            finally:
+                # Runs on completion and on client disconnect (GeneratorExit),
+                # so a cancelled stream still keeps what was generated so far.
+                chunks.close()
+                if not final.get('error') and (final or parts):
+                    ai_msg = Message.objects.create(
+                        conversation=conversation,
+                        content=final.get('response', ''.join(parts)),
+                        sender='ai',
+                        tokens_used=final.get('tokens_used'),
+                        model_used=final.get('model', ai_service.model)
+                    )
+                    self._update_title(conversation, user_message)
+                    maybe_schedule_running_summary(conversation)
+            
+            if final.get('error'):
+                yield format_sse('error', {
+                    'success': False,
+                    'error': final.get('response', 'AI service error')
+                })
+            else:
+                yield format_sse('done', {
+                    'success': True,
+                    'ai_response': MessageSerializer(ai_msg).data
+                })
+        
+        response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    def _update_title(self, conversation, user_message):
+        """Generate a title from the first user message after the first exchange."""
+        if conversation.get_message_count() == 2 and not conversation.title:
+            title = user_message[:50] + ('...' if len(user_message) > 50 else '')
+            conversation.title = title
+            conversation.save()
+    
     @action(detail=False, methods=['post'])
     def end_conversation(self, request):
         """
@@ -206,6 +547,9 @@ class ConversationViewSet(viewsets.ModelViewSet):
         {
             "conversation_id": 1
         }
+        
+        With ANALYSIS_QUEUE_ENABLED, the analysis is queued for the background
+        worker and the response is 202 with the job and its status URL.
         """
         serializer = EndConversationSerializer(data=request.data)
         if not serializer.is_valid():
@@ -226,7 +570,7 @@ class ConversationViewSet(viewsets.ModelViewSet):
                 }, status=status.HTTP_400_BAD_REQUEST)
             
             # Get all messages for analysis
-            messages = list(conversation.messages.values('sender', 'content'))
+            messages = analysis_messages(conversation)
             
             if not messages:
                 return Response({
@@ -234,33 +578,34 @@ class ConversationViewSet(viewsets.ModelViewSet):
                     'error': 'Cannot end conversation with no messages'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Generate AI analysis
-            ai_service = get_ai_service()
-            
-            # Generate summary
-            summary = ai_service.generate_summary(messages)
-            
-            # Extract topics
-            topics = ai_service.extract_topics(messages)
+            if settings.ANALYSIS_QUEUE_ENABLED:
+                job = enqueue_analysis(conversation)
+                return Response({
+                    'success': True,
+                    'job': AnalysisJobSerializer(job).data,
+                    'status_url': reverse('analysis-job-detail', args=[job.id], request=request),
+                    'message': 'Conversation analysis queued'
+                }, status=status.HTTP_202_ACCEPTED)
             
-            # Analyze sentiment
-            sentiment = ai_service.analyze_sentiment(messages)
+            # Generate AI analysis (summary, topics, sentiment, key points) concurrently
+            ai_service = get_ai_service()
+            analysis = ai_service.analyze_conversation(messages)
+            log_analysis(conversation.id, analysis)
             
-            # Extract key points
-            key_points = ai_service.extract_key_points(messages)
+            if not analysis['results']:
+                return Response({
+                    'success': False,
+                    'error': 'AI analysis failed',
+                    'analysis': analysis
+                }, status=status.HTTP_502_BAD_GATEWAY)
             
-            # Update conversation
-            conversation.status = 'ended'
-            conversation.end_timestamp = timezone.now()
-            conversation.summary = summary
-            conversation.topics = topics
-            conversation.sentiment = sentiment
-            conversation.key_points = key_points
-            conversation.save()
+            # Update conversation, keeping defaults for analyses that failed
+            apply_analysis(conversation, analysis)
             
             return Response({
                 'success': True,
                 'conversation': ConversationDetailSerializer(conversation).data,
+                'analysis': {'timings': analysis['timings'], 'errors': analysis['errors']},
                 'message': 'Conversation ended and analyzed successfully'
             })
         
@@ -302,49 +647,161 @@ class ConversationViewSet(viewsets.ModelViewSet):
         limit = serializer.validated_data.get('limit', 5)
         
         try:
-            # Filter ended conversations
-            conversations = Conversation.objects.filter(status='ended')
+            timings = {}
+            cached = timed(timings, 'cache', answer_cache.get_answer, query, date_from, date_to, limit)
+            if cached is not None:
+                return Response({**cached, 'query': query, 'metadata': {'cached': True, 'timings_ms': timings}})
             
-            # Apply date filters
-            if date_from:
-                conversations = conversations.filter(start_timestamp__gte=date_from)
-            if date_to:
-                conversations = conversations.filter(start_timestamp__lte=date_to)
+            # Hybrid lexical and vector search over ended conversations
+            relevant_conversations = find_relevant_conversations(query, limit, date_from, date_to, timings)
             
             # Get AI service
             ai_service = get_ai_service()
             
-            # Perform semantic search
-            all_conversations = []
-            for conv in conversations:
-                conv_data = ConversationDetailSerializer(conv).data
-                all_conversations.append(conv_data)
-            
-            relevant_conversations = ai_service.semantic_search(query, all_conversations, limit)
-            
-            # Query AI for answer
+            # Query AI for answer, from the best matching message windows
             if relevant_conversations:
-                result = ai_service.query_conversations(query, relevant_conversations)
-                
-                return Response({
-                    'success': True,
-                    'query': query,
-                    'answer': result['answer'],
-                    'relevant_conversations': relevant_conversations,
-                    'count': len(relevant_conversations)
-                })
+                excerpts = timed(timings, 'chunks', query_excerpts, query, relevant_conversations)
+                result = timed(timings, 'answer', ai_service.query_conversations, query, excerpts)
+                answer = result['answer']
             else:
-                return Response({
-                    'success': True,
-                    'query': query,
-                    'answer': 'No relevant conversations found for your query.',
-                    'relevant_conversations': [],
-                    'count': 0
-                })
+                answer = 'No relevant conversations found for your query.'
+            
+            payload = {
+                'success': True,
+                'query': query,
+                'answer': answer,
+                'relevant_conversations': relevant_conversations,
+                'count': len(relevant_conversations)
+            }
+            # Provider errors come back as the answer text; never cache them
+            if not relevant_conversations or not result.get('error'):
+                answer_cache.set_answer(query, date_from, date_to, limit, payload)
+            return Response({**payload, 'metadata': {'cached': False, 'timings_ms': timings}})
+        
+        except Exception as e:
+            return Response({
+                'success': False,
+                'error': f'Error querying conversations: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    @action(detail=False, methods=['post'], renderer_classes=[JSONRenderer, EventStreamRenderer])
+    def query_conversations_stream(self, request):
+        """
+        POST /api/conversations/query_conversations_stream/
+        Query past conversations and stream the answer as Server-Sent Events.
+        
+        Request body is the same as query_conversations. The response emits:
+        - event: conversations ({"query", "relevant_conversations", "count"} as soon as retrieval finishes)
+        - event: token         ({"delta": "..."} for every generated fragment of the answer)
+        - event: done          ({"success": true, "answer": "...", "metadata": {...}})
+        - event: error         ({"success": false, "error": "..."} on provider failure)
+        
+        A cached answer is sent as a single token event.
+        """
+        serializer = QueryConversationsSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                'success': False,
+                'errors': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        query = serializer.validated_data['query']
+        date_from = serializer.validated_data.get('date_from')
+        date_to = serializer.validated_data.get('date_to')
+        limit = serializer.validated_data.get('limit', 5)
         
+        try:
+            timings = {}
+            cached = timed(timings, 'cache', answer_cache.get_answer, query, date_from, date_to, limit)
+            if cached is None:
+                relevant_conversations = find_relevant_conversations(query, limit, date_from, date_to, timings)
+                excerpts = None
+                if relevant_conversations:
+                    excerpts = timed(timings, 'chunks', query_excerpts, query, relevant_conversations)
+            else:
+                relevant_conversations = cached['relevant_conversations']
         except Exception as e:
             return Response({
                 'success': False,
                 'error': f'Error querying conversations: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        def event_stream():
+            yield format_sse('conversations', {
+                'query': query,
+                'relevant_conversations': relevant_conversations,
+                'count': len(relevant_conversations)
+            })
+            
+            if cached is not None:
+                yield format_sse('token', {'delta': cached['answer']})
+                yield format_sse('done', {
+                    'success': True,
+                    'answer': cached['answer'],
+                    'metadata': {'cached': True, 'timings_ms': timings}
+                })
+                return
+            
+            final = {}
+            parts = []
+            if relevant_conversations:
+                started = time.perf_counter()
+                chunks = get_ai_service().query_conversations_stream(query, excerpts)
+                try:
+                    for chunk in chunks:
+                        if chunk.get('done'):
+                            final = chunk
+                            break
+                        parts.append(chunk['delta'])
+                        yield format_sse('token', {'delta': chunk['delta']})
+                finally:
+                    chunks.close()
+                timings['answer'] = round((time.perf_counter() - started) * 1000, 2)
+                answer = final.get('response', ''.join(parts))
+            else:
+                answer = 'No relevant conversations found for your query.'
+                yield format_sse('token', {'delta': answer})
+            
+            if final.get('error'):
+                yield format_sse('error', {
+                    'success': False,
+                    'error': final.get('response', 'AI service error')
+                })
+                return
+            answer_cache.set_answer(query, date_from, date_to, limit, {
+                'success': True,
+                'query': query,
+                'answer': answer,
+                'relevant_conversations': relevant_conversations,
+                'count': len(relevant_conversations)
+            })
+            yield format_sse('done', {
+                'success': True,
+                'answer': answer,
+                'metadata': {'cached': False, 'timings_ms': timings}
+            })
+        
+        response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
 
+class AnalysisJobViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    ViewSet for polling background analysis jobs.
+    """
+    queryset = AnalysisJob.objects.all()
+    serializer_class = AnalysisJobSerializer
+    
+    def retrieve(self, request, pk=None):
+        """
+        GET /api/analysis_jobs/{id}/
+        Get the status of a conversation analysis job.
+        """
+        job = self.get_object()
+        return Response({
+            'success': True,
+            'job': self.get_serializer(job).data
+        })
@@ -18,6 +18,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chat_portal.settings')
 django.setup()
 
 from conversations.models import Conversation, Message
+from conversations.retrieval import index_chunks
+from conversations.vector_index import embed_conversation
 from django.utils import timezone
 
 
@@ -159,6 +161,12 @@ def create_sample_conversations():
             timestamp=conv4.start_timestamp + timedelta(minutes=i*5)
         )
     
+    # Embed the ended conversations and their message windows so they can be
+    # found by query_conversations
+    for conv in Conversation.objects.filter(status="ended"):
+        embed_conversation(conv)
+        index_chunks(conv)
+    
     print(f"✅ Successfully created {Conversation.objects.count()} conversations")
     print(f"✅ Successfully created {Message.objects.count()} messages")
     print("\nSample conversations:")
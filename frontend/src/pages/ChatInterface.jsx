@@ -10,7 +10,16 @@ function ChatInterface() {
   const [inputMessage, setInputMessage] = useState('')
   const [loading, setLoading] = useState(false)
   const [sending, setSending] = useState(false)
+  // Link to the page of messages before the oldest one loaded
+  const [olderMessages, setOlderMessages] = useState(null)
+  const [loadingOlder, setLoadingOlder] = useState(false)
   const messagesEndRef = useRef(null)
+  const messagesAreaRef = useRef(null)
+  // Distance from the bottom to keep when older messages are prepended
+  const restoreScrollRef = useRef(null)
+  // Threads loaded before, by conversation id, brought up to date with
+  // getChanges() instead of being downloaded again
+  const threadsRef = useRef(new Map())
 
   // Scroll to bottom of messages
   const scrollToBottom = () => {
@@ -18,7 +27,14 @@ function ChatInterface() {
   }
 
   useEffect(() => {
-    scrollToBottom()
+    const area = messagesAreaRef.current
+    if (restoreScrollRef.current !== null && area) {
+      // Keep the same messages in view after prepending older ones
+      area.scrollTop = area.scrollHeight - restoreScrollRef.current
+      restoreScrollRef.current = null
+    } else {
+      scrollToBottom()
+    }
   }, [messages])
 
   // Load active conversations on mount
@@ -43,6 +59,7 @@ function ChatInterface() {
         const newConv = response.conversation
         setCurrentConversation(newConv)
         setMessages([])
+        setOlderMessages(null)
         setConversations([newConv, ...conversations])
       }
     } catch (error) {
@@ -53,13 +70,45 @@ function ChatInterface() {
     }
   }
 
+  const showThread = ({ conversation, messages, olderMessages }) => {
+    setCurrentConversation(conversation)
+    setMessages(messages)
+    setOlderMessages(olderMessages)
+  }
+
+  // Merge changed messages into a thread: edited ones are replaced, new ones appended
+  const mergeMessages = (messages, changed) => {
+    const byId = new Map(changed.map(msg => [msg.id, msg]))
+    const merged = messages.map(msg => byId.get(msg.id) || msg)
+    const known = new Set(messages.map(msg => msg.id))
+    return [...merged, ...changed.filter(msg => !known.has(msg.id))]
+  }
+
   const loadConversation = async (conversationId) => {
+    if (currentConversation) {
+      threadsRef.current.set(currentConversation.id, { conversation: currentConversation, messages, olderMessages })
+    }
     try {
       setLoading(true)
+      const cached = threadsRef.current.get(conversationId)
+      if (cached && cached.conversation.version !== undefined) {
+        const response = await apiService.getChanges(conversationId, cached.conversation.version)
+        if (response.success && !response.reset) {
+          showThread(response.changed ? {
+            conversation: response.conversation,
+            messages: mergeMessages(cached.messages, response.messages),
+            olderMessages: cached.olderMessages,
+          } : cached)
+          return
+        }
+      }
       const response = await apiService.getConversation(conversationId)
       if (response.success) {
-        setCurrentConversation(response.conversation)
-        setMessages(response.conversation.messages || [])
+        showThread({
+          conversation: response.conversation,
+          messages: response.conversation.messages || [],
+          olderMessages: response.conversation.messages_next,
+        })
       }
     } catch (error) {
       console.error('Failed to load conversation:', error)
@@ -69,6 +118,25 @@ function ChatInterface() {
     }
   }
 
+  // Load the previous page of messages when scrolled back to the top
+  const loadOlderMessages = async () => {
+    if (!olderMessages || loadingOlder) return
+    try {
+      setLoadingOlder(true)
+      const response = await apiService.getMessages(currentConversation.id, olderMessages)
+      if (response.success) {
+        const area = messagesAreaRef.current
+        restoreScrollRef.current = area.scrollHeight - area.scrollTop
+        setMessages(prev => [...response.messages, ...prev])
+        setOlderMessages(response.next)
+      }
+    } catch (error) {
+      console.error('Failed to load older messages:', error)
+    } finally {
+      setLoadingOlder(false)
+    }
+  }
+
   const sendMessage = async (e) => {
     e.preventDefault()
     
@@ -104,36 +172,71 @@ function ChatInterface() {
       setMessages(prev => [...prev, tempUserMessage])
       setInputMessage('')
 
-      // Send to API
-      const response = await apiService.sendMessage(currentConversation.id, message)
-      
-      if (response.success) {
-        // Replace temp message with real messages from server
-        setMessages(prev => {
-          const filtered = prev.filter(msg => msg.id !== tempUserMessage.id)
-          return [...filtered, response.user_message, response.ai_response]
-        })
+      // Placeholder AI message that fills in as tokens stream in
+      const tempAiMessage = {
+        id: `${tempUserMessage.id}-ai`,
+        content: '',
+        sender: 'ai',
+        timestamp: new Date().toISOString(),
+      }
+      setMessages(prev => [...prev, tempAiMessage])
 
-        // Update conversation title if it changed
-        if (response.ai_response) {
-          const updatedConvs = conversations.map(conv =>
-            conv.id === currentConversation.id
-              ? { ...conv, updated_at: new Date().toISOString() }
-              : conv
-          )
-          setConversations(updatedConvs)
-        }
+      // Send to API and stream the response
+      let streamError = null
+      await apiService.sendMessageStream(currentConversation.id, message, {
+        onUserMessage: (userMessage) => {
+          setMessages(prev => prev.map(msg => (msg.id === tempUserMessage.id ? userMessage : msg)))
+        },
+        onToken: (delta) => {
+          setMessages(prev => prev.map(msg =>
+            msg.id === tempAiMessage.id ? { ...msg, content: msg.content + delta } : msg
+          ))
+        },
+        onDone: (aiResponse) => {
+          setMessages(prev => prev.map(msg => (msg.id === tempAiMessage.id ? aiResponse : msg)))
+        },
+        onError: (payload) => {
+          streamError = payload
+        },
+      })
+
+      if (streamError) {
+        throw new Error(streamError.error || 'AI service error')
       }
+
+      // Update conversation timestamp in the sidebar
+      const updatedConvs = conversations.map(conv =>
+        conv.id === currentConversation.id
+          ? { ...conv, updated_at: new Date().toISOString() }
+          : conv
+      )
+      setConversations(updatedConvs)
     } catch (error) {
       console.error('Failed to send message:', error)
       alert('Failed to send message. Please try again.')
-      // Remove optimistic message on error
-      setMessages(prev => prev.filter(msg => msg.id !== Date.now()))
+      // Remove the unanswered AI placeholder on error
+      setMessages(prev => prev.filter(msg => !(msg.sender === 'ai' && typeof msg.id === 'string')))
     } finally {
       setSending(false)
     }
   }
 
+  const pollAnalysisJob = async (jobId, delay = 2000) => {
+    try {
+      const { job } = await apiService.getAnalysisJob(jobId)
+      if (job.status === 'succeeded') {
+        alert('Conversation ended and analyzed successfully!')
+      } else if (job.status === 'failed') {
+        alert('Conversation analysis failed. The conversation has been reopened.')
+        loadActiveConversations()
+      } else {
+        setTimeout(() => pollAnalysisJob(jobId, Math.min(delay * 2, 30000)), delay)
+      }
+    } catch (error) {
+      console.error('Failed to check analysis status:', error)
+    }
+  }
+
   const endCurrentConversation = async () => {
     if (!currentConversation) return
 
@@ -146,9 +249,15 @@ function ChatInterface() {
       const response = await apiService.endConversation(currentConversation.id)
       
       if (response.success) {
-        alert('Conversation ended and analyzed successfully!')
+        if (response.job) {
+          // Analysis was queued (202); report the outcome when the worker is done
+          pollAnalysisJob(response.job.id)
+        } else {
+          alert('Conversation ended and analyzed successfully!')
+        }
         setCurrentConversation(null)
         setMessages([])
+        setOlderMessages(null)
         loadActiveConversations()
       }
     } catch (error) {
@@ -209,7 +318,7 @@ function ChatInterface() {
             </h2>
             {currentConversation && (
               <p className="text-sm text-gray-500 dark:text-gray-400">
-                {messages.length} messages
+                {Math.max(currentConversation.message_count || 0, messages.length)} messages
               </p>
             )}
           </div>
@@ -226,7 +335,23 @@ function ChatInterface() {
         </div>
 
         {/* Messages Area */}
-        <div className="flex-1 overflow-y-auto custom-scrollbar p-4 space-y-4">
+        <div
+          ref={messagesAreaRef}
+          onScroll={(e) => e.currentTarget.scrollTop === 0 && loadOlderMessages()}
+          className="flex-1 overflow-y-auto custom-scrollbar p-4 space-y-4"
+        >
+          {olderMessages && (
+            <div className="text-center">
+              <button
+                onClick={loadOlderMessages}
+                disabled={loadingOlder}
+                className="text-sm text-primary-600 dark:text-primary-400 hover:underline disabled:opacity-50"
+              >
+                {loadingOlder ? 'Loading...' : 'Load earlier messages'}
+              </button>
+            </div>
+          )}
+
           {messages.length === 0 && !loading && (
             <div className="flex items-center justify-center h-full text-gray-500 dark:text-gray-400">
               <div className="text-center">
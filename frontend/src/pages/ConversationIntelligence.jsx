@@ -26,13 +26,23 @@ function ConversationIntelligence() {
       if (dateFrom) filters.date_from = new Date(dateFrom).toISOString()
       if (dateTo) filters.date_to = new Date(dateTo).toISOString()
 
-      const response = await apiService.queryConversations(query, filters)
-      
-      if (response.success) {
-        setResult(response)
-      } else {
-        alert('Failed to query conversations')
-      }
+      // Show the relevant conversations as soon as retrieval finishes,
+      // then fill in the answer as it is generated
+      await apiService.queryConversationsStream(query, filters, {
+        onConversations: (conversations) => {
+          setResult({ ...conversations, answer: '' })
+          setLoading(false)
+        },
+        onToken: (delta) => {
+          setResult((current) => ({ ...current, answer: current.answer + delta }))
+        },
+        onDone: (done) => {
+          setResult((current) => ({ ...current, answer: done.answer }))
+        },
+        onError: () => {
+          alert('Failed to query conversations')
+        },
+      })
     } catch (error) {
       console.error('Failed to query:', error)
       alert('Failed to query conversations. Please try again.')
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react'
+import React, { useState, useEffect, useRef } from 'react'
 import { FiCalendar, FiMessageSquare, FiClock, FiTag, FiSearch } from 'react-icons/fi'
 import { format } from 'date-fns'
 import apiService from '../services/api'
@@ -9,22 +9,69 @@ function ConversationsDashboard() {
   const [loading, setLoading] = useState(true)
   const [searchTerm, setSearchTerm] = useState('')
   const [statusFilter, setStatusFilter] = useState('all')
+  const [nextPage, setNextPage] = useState(null)
+  const [loadingMore, setLoadingMore] = useState(false)
+  // Number of the latest list request, so responses to older filters are ignored
+  const requestRef = useRef(0)
 
   useEffect(() => {
-    loadConversations()
-  }, [])
+    // Search and status are filtered by the server; start again from the
+    // first page whenever they change (after a pause in typing)
+    const timeout = setTimeout(() => loadConversations(true, true), searchTerm ? 300 : 0)
+    // Refresh the live summaries of active conversations
+    const interval = setInterval(() => loadConversations(false), 30000)
+    return () => {
+      clearTimeout(timeout)
+      clearInterval(interval)
+    }
+  }, [searchTerm, statusFilter])
 
-  const loadConversations = async () => {
+  const loadConversations = async (showLoading = true, reset = false) => {
+    const request = ++requestRef.current
     try {
-      setLoading(true)
-      const response = await apiService.getAllConversations()
-      if (response.success) {
-        setConversations(response.conversations || [])
+      if (showLoading) setLoading(true)
+      const params = {}
+      if (searchTerm.trim()) params.search = searchTerm.trim()
+      if (statusFilter !== 'all') params.status = statusFilter
+      const response = await apiService.getAllConversations(params)
+      if (response.success && request === requestRef.current) {
+        const firstPage = response.conversations || []
+        if (reset) {
+          setConversations(firstPage)
+          setNextPage(response.next)
+          return
+        }
+        // Keep the pages loaded with "Load more" when refreshing the first one
+        setConversations((current) => {
+          const ids = new Set(firstPage.map((conv) => conv.id))
+          return [...firstPage, ...current.slice(firstPage.length).filter((conv) => !ids.has(conv.id))]
+        })
+        setNextPage((current) => (response.next ? current || response.next : null))
       }
     } catch (error) {
       console.error('Failed to load conversations:', error)
     } finally {
-      setLoading(false)
+      if (request === requestRef.current) setLoading(false)
+    }
+  }
+
+  const loadMore = async () => {
+    const request = requestRef.current
+    try {
+      setLoadingMore(true)
+      // The next link carries the search and status filters of the first page
+      const response = await apiService.getNextConversations(nextPage)
+      if (response.success && request === requestRef.current) {
+        setConversations((current) => {
+          const ids = new Set(current.map((conv) => conv.id))
+          return [...current, ...(response.conversations || []).filter((conv) => !ids.has(conv.id))]
+        })
+        setNextPage(response.next)
+      }
+    } catch (error) {
+      console.error('Failed to load more conversations:', error)
+    } finally {
+      setLoadingMore(false)
     }
   }
 
@@ -44,17 +91,6 @@ function ConversationsDashboard() {
     setSelectedConversation(null)
   }
 
-  // Filter conversations
-  const filteredConversations = conversations.filter(conv => {
-    const matchesSearch = searchTerm === '' || 
-      (conv.title && conv.title.toLowerCase().includes(searchTerm.toLowerCase())) ||
-      (conv.summary && conv.summary.toLowerCase().includes(searchTerm.toLowerCase()))
-    
-    const matchesStatus = statusFilter === 'all' || conv.status === statusFilter
-
-    return matchesSearch && matchesStatus
-  })
-
   return (
     <div className="space-y-6">
       {/* Header */}
@@ -101,12 +137,14 @@ function ConversationsDashboard() {
           <div className="col-span-full text-center py-12 text-gray-500 dark:text-gray-400">
             Loading conversations...
           </div>
-        ) : filteredConversations.length === 0 ? (
+        ) : conversations.length === 0 ? (
           <div className="col-span-full text-center py-12 text-gray-500 dark:text-gray-400">
-            No conversations found
+            {searchTerm.trim() || statusFilter !== 'all'
+              ? 'No conversations match your search'
+              : 'No conversations yet'}
           </div>
         ) : (
-          filteredConversations.map((conversation) => (
+          conversations.map((conversation) => (
             <div
               key={conversation.id}
               onClick={() => viewConversationDetails(conversation.id)}
@@ -146,10 +184,19 @@ function ConversationsDashboard() {
                 )}
               </div>
 
-              {/* Topics */}
-              {conversation.topics && conversation.topics.length > 0 && (
+              {/* Live summary of an active conversation */}
+              {conversation.status === 'active' && conversation.running_summary && (
+                <p className="mt-3 text-sm text-gray-700 dark:text-gray-300 line-clamp-3">
+                  {conversation.running_summary}
+                </p>
+              )}
+
+              {/* Topics (live topics while the conversation is active) */}
+              {(() => {
+                const topics = conversation.status === 'active' ? conversation.running_topics : conversation.topics
+                return topics && topics.length > 0 && (
                 <div className="mt-3 flex flex-wrap gap-2">
-                  {conversation.topics.slice(0, 3).map((topic, index) => (
+                  {topics.slice(0, 3).map((topic, index) => (
                     <span
                       key={index}
                       className="px-2 py-1 bg-primary-50 dark:bg-primary-900 text-primary-700 dark:text-primary-300 rounded text-xs"
@@ -159,7 +206,8 @@ function ConversationsDashboard() {
                     </span>
                   ))}
                 </div>
-              )}
+                )
+              })()}
 
               {/* Last Message Preview */}
               {conversation.last_message && (
@@ -174,6 +222,18 @@ function ConversationsDashboard() {
         )}
       </div>
 
+      {!loading && nextPage && (
+        <div className="text-center">
+          <button
+            onClick={loadMore}
+            disabled={loadingMore}
+            className="px-6 py-2 bg-gray-200 hover:bg-gray-300 dark:bg-gray-700 dark:hover:bg-gray-600 text-gray-900 dark:text-white rounded-lg transition-colors disabled:opacity-50"
+          >
+            {loadingMore ? 'Loading...' : 'Load more'}
+          </button>
+        </div>
+      )}
+
       {/* Conversation Detail Modal */}
       {selectedConversation && (
         <div className="fixed inset-0 bg-black bg-opacity-50 flex items-center justify-center p-4 z-50">
@@ -212,6 +272,18 @@ function ConversationsDashboard() {
                 </div>
               )}
 
+              {/* Live summary while the conversation is active */}
+              {!selectedConversation.summary && selectedConversation.running_summary && (
+                <div className="mb-6">
+                  <h3 className="text-lg font-semibold text-gray-900 dark:text-white mb-2">
+                    Live Summary
+                  </h3>
+                  <p className="text-gray-700 dark:text-gray-300 bg-gray-50 dark:bg-gray-700 p-4 rounded-lg">
+                    {selectedConversation.running_summary}
+                  </p>
+                </div>
+              )}
+
               {/* Key Points */}
               {selectedConversation.key_points && selectedConversation.key_points.length > 0 && (
                 <div className="mb-6">
@@ -269,7 +341,12 @@ function ConversationsDashboard() {
               {/* Messages */}
               <div>
                 <h3 className="text-lg font-semibold text-gray-900 dark:text-white mb-4">
-                  Messages ({selectedConversation.messages?.length || 0})
+                  Messages ({selectedConversation.message_count ?? selectedConversation.messages?.length ?? 0})
+                  {selectedConversation.messages_next && (
+                    <span className="ml-2 text-sm font-normal text-gray-500 dark:text-gray-400">
+                      showing the newest {selectedConversation.messages.length}
+                    </span>
+                  )}
                 </h3>
                 <div className="space-y-4">
                   {selectedConversation.messages?.map((message) => (
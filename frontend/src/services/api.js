@@ -14,6 +14,34 @@ const api = axios.create({
   },
 })
 
+// Read a Server-Sent Events response, calling onEvent(event, payload) for each event
+const readEventStream = async (response, onEvent) => {
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+
+  const dispatch = (block) => {
+    let event = 'message'
+    let data = ''
+    block.split('\n').forEach((line) => {
+      if (line.startsWith('event: ')) event = line.slice(7)
+      else if (line.startsWith('data: ')) data += line.slice(6)
+    })
+    if (!data) return
+    onEvent(event, JSON.parse(data))
+  }
+
+  while (true) {
+    const { value, done } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    const blocks = buffer.split('\n\n')
+    buffer = blocks.pop()
+    blocks.forEach(dispatch)
+  }
+  if (buffer.trim()) dispatch(buffer)
+}
+
 // API Service object with all endpoints
 const apiService = {
   /**
@@ -42,6 +70,41 @@ const apiService = {
     }
   },
 
+  // Get what changed in a conversation since `version`
+  // (the `version` of the copy the client already has)
+  getChanges: async (id, version) => {
+    try {
+      const response = await api.get(`/conversations/${id}/changes/`, { params: { since: version } })
+      return response.data
+    } catch (error) {
+      console.error('Error fetching conversation changes:', error)
+      throw error
+    }
+  },
+
+  // Get a page of a conversation's messages, newest page first
+  // (pass the `next` link of the previous page, or messages_next of the conversation)
+  getMessages: async (id, next = null) => {
+    try {
+      const response = await api.get(next || `/conversations/${id}/messages/`)
+      return response.data
+    } catch (error) {
+      console.error('Error fetching messages:', error)
+      throw error
+    }
+  },
+
+  // Follow the `next` link of a conversation list page
+  getNextConversations: async (next) => {
+    try {
+      const response = await api.get(next)
+      return response.data
+    } catch (error) {
+      console.error('Error fetching conversations:', error)
+      throw error
+    }
+  },
+
   // Create a new conversation
   createConversation: async (title = '') => {
     try {
@@ -67,6 +130,34 @@ const apiService = {
     }
   },
 
+  // Send a message and stream the AI response (Server-Sent Events)
+  // handlers: { onUserMessage, onToken, onDone, onError }
+  sendMessageStream: async (conversationId, message, handlers = {}, signal) => {
+    const response = await fetch(`${API_BASE_URL}/conversations/send_message_stream/`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        Accept: 'text/event-stream',
+      },
+      body: JSON.stringify({ conversation_id: conversationId, message }),
+      signal,
+    })
+
+    if (!response.ok) {
+      const error = new Error('Error sending message')
+      error.response = { status: response.status, data: await response.json() }
+      console.error('Error sending message:', error)
+      throw error
+    }
+
+    await readEventStream(response, (event, payload) => {
+      if (event === 'user_message') handlers.onUserMessage?.(payload)
+      else if (event === 'token') handlers.onToken?.(payload.delta)
+      else if (event === 'done') handlers.onDone?.(payload.ai_response)
+      else if (event === 'error') handlers.onError?.(payload)
+    })
+  },
+
   // End a conversation
   endConversation: async (conversationId) => {
     try {
@@ -80,10 +171,49 @@ const apiService = {
     }
   },
 
+  // Get the status of a queued conversation analysis
+  getAnalysisJob: async (jobId) => {
+    try {
+      const response = await api.get(`/analysis_jobs/${jobId}/`)
+      return response.data
+    } catch (error) {
+      console.error('Error fetching analysis job:', error)
+      throw error
+    }
+  },
+
   /**
    * Conversation Intelligence APIs
    */
 
+  // Query past conversations and stream the answer (Server-Sent Events)
+  // handlers: { onConversations, onToken, onDone, onError }
+  queryConversationsStream: async (query, filters = {}, handlers = {}, signal) => {
+    const response = await fetch(`${API_BASE_URL}/conversations/query_conversations_stream/`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        Accept: 'text/event-stream',
+      },
+      body: JSON.stringify({ query, ...filters }),
+      signal,
+    })
+
+    if (!response.ok) {
+      const error = new Error('Error querying conversations')
+      error.response = { status: response.status, data: await response.json() }
+      console.error('Error querying conversations:', error)
+      throw error
+    }
+
+    await readEventStream(response, (event, payload) => {
+      if (event === 'conversations') handlers.onConversations?.(payload)
+      else if (event === 'token') handlers.onToken?.(payload.delta)
+      else if (event === 'done') handlers.onDone?.(payload)
+      else if (event === 'error') handlers.onError?.(payload)
+    })
+  },
+
   // Query past conversations
   queryConversations: async (query, filters = {}) => {
     try {